@@ -0,0 +1,244 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-chrono service - acquisition catalog
+"""
+import json
+import time
+import datetime
+import threading
+import collections
+
+from geocore.database import Database
+
+def normalize(date: datetime.datetime) -> datetime.datetime:
+    """
+    A function that normalizes a date, datetime or ISO8601 string into a naive UTC datetime
+    so that acquisition timestamps from different sources can be compared with each other.
+    """
+    if isinstance(date, str):
+        date = datetime.datetime.fromisoformat(date)
+
+    if not isinstance(date, datetime.datetime):
+        date = datetime.datetime.combine(date, datetime.time())
+
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return date
+
+def regionkey(bounds: list) -> str:
+    """ A function that generates the catalog key for a region from its bounding coordinates. """
+    return ",".join(f"{float(bound):.6f}" for bound in bounds)
+
+class AcquisitionCatalog:
+    """
+    A class that represents an in-process catalog of Sentinel-2 acquisition timestamps for regions.
+
+    Each region entry holds the daterange that it covers and the acquisitions within that daterange.
+    The covered daterange never extends past 'settle' seconds before the time of the update, so that
+    the acquisitions that are ingested late for the recent days are still retrieved by the next lookup.
+    Entries expire after 'ttl' seconds and the least recently used entries are evicted once the
+    catalog holds more than 'maxsize' entries. The catalog also remembers the last seen acquisition
+    of each region, which does not expire because acquisitions are never removed from the collection,
+    but is bounded to the 'maxsize' most recently used regions together with the entries.
+    If a 'path' is given, the entries are also persisted to an SQLite database at that path so that
+    the catalog survives container restarts.
+    """
+
+    def __init__(self, ttl: float, maxsize: int, settle: float, path: str = None) -> None:
+        """ Initialization Method """
+        self.ttl: float = ttl
+        self.maxsize: int = maxsize
+        self.settle: float = settle
+
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.lastseens = collections.OrderedDict()
+        self.counters = {"hits": 0, "partials": 0, "misses": 0, "evictions": 0, "deltas": 0}
+
+        self.database = None
+
+        if path:
+            self.database = Database(path, [
+                "CREATE TABLE IF NOT EXISTS catalog "
+                "(region TEXT PRIMARY KEY, startdate TEXT, enddate TEXT, fetched REAL, acquisitions TEXT)",
+                "CREATE TABLE IF NOT EXISTS lastseen (region TEXT PRIMARY KEY, acquisition TEXT)",
+            ])
+
+    def lookup(self, region: str, start: datetime.datetime, end: datetime.datetime) -> tuple:
+        """
+        A method that looks up the acquisitions for a region within the daterange [start, end).
+        Returns a tuple of the list of known acquisitions within the daterange and a list
+        of (start, end) dateranges that are not covered by the catalog.
+        """
+        with self.lock:
+            entry = self._retrieve(region)
+
+            # Check that the entry overlaps with the daterange
+            if entry is None or start >= entry["end"] or end <= entry["start"]:
+                self.counters["misses"] += 1
+                return [], [(start, end)]
+
+            missing = []
+            if start < entry["start"]:
+                missing.append((start, entry["start"]))
+            if end > entry["end"]:
+                missing.append((entry["end"], end))
+
+            self.counters["partials" if missing else "hits"] += 1
+            acquisitions = [date for date in entry["acquisitions"] if start <= date < end]
+
+            return acquisitions, missing
+
+    def update(self, region: str, start: datetime.datetime, end: datetime.datetime, acquisitions: list):
+        """
+        A method that updates the catalog with the acquisitions for a region within the daterange [start, end).
+        The daterange is merged into the existing entry for the region if it overlaps or touches it,
+        otherwise the existing entry is replaced. The acquisitions are all kept, but the covered
+        daterange is capped at the settle time before now.
+        """
+        acquisitions = [normalize(date) for date in acquisitions]
+        # Generate the end of the covered daterange
+        covered = max(start, min(end, datetime.datetime.utcnow() - datetime.timedelta(seconds=self.settle)))
+
+        with self.lock:
+            entry = self._retrieve(region)
+
+            if entry is not None and start <= entry["end"] and end >= entry["start"]:
+                entry = {
+                    "start": min(start, entry["start"]),
+                    "end": max(covered, entry["end"]),
+                    "fetched": entry["fetched"],
+                    "acquisitions": sorted(set(entry["acquisitions"]).union(acquisitions)),
+                }
+
+            else:
+                entry = {"start": start, "end": covered, "fetched": time.time(), "acquisitions": sorted(set(acquisitions))}
+
+            self.entries[region] = entry
+            self.entries.move_to_end(region)
+            self._evict()
+
+            if self.database is not None:
+                self._persist(region, entry)
+
+    def lastseen(self, region: str, start: datetime.datetime) -> datetime.datetime:
+        """
+        A method that returns the last seen acquisition for a region or None if it is not known or 
+        older than 'start'. Counts as a delta because the caller only needs to query for acquisitions
+        newer than it.
+        """
+        with self.lock:
+            lastseen = self.lastseens.get(region)
+
+            if lastseen is None and self.database is not None:
+                row = self.database.execute("SELECT acquisition FROM lastseen WHERE region = ?", (region,)).fetchone()
+                lastseen = normalize(row[0]) if row else None
+
+            if lastseen is None or lastseen < start:
+                return None
+
+            self.lastseens[region] = lastseen
+            self.lastseens.move_to_end(region)
+            self._evict()
+            self.counters["deltas"] += 1
+
+            return lastseen
+
+    def advance(self, region: str, acquisition: datetime.datetime):
+        """ A method that advances the last seen acquisition for a region if the given acquisition is newer. """
+        acquisition = normalize(acquisition)
+
+        with self.lock:
+            lastseen = self.lastseens.get(region)
+
+            if lastseen is None and self.database is not None:
+                row = self.database.execute("SELECT acquisition FROM lastseen WHERE region = ?", (region,)).fetchone()
+                lastseen = normalize(row[0]) if row else None
+
+            if lastseen is not None and lastseen >= acquisition:
+                return
+
+            self.lastseens[region] = acquisition
+            self.lastseens.move_to_end(region)
+            self._evict()
+
+            if self.database is not None:
+                self.database.execute("INSERT OR REPLACE INTO lastseen VALUES (?, ?)", (region, acquisition.isoformat()))
+                self.database.commit()
+
+    def stats(self) -> dict:
+        """ A method that returns the hit/miss counters and the size of the catalog. """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.entries)
+            return stats
+
+    def _retrieve(self, region: str) -> dict:
+        """
+        A method that retrieves the unexpired entry for a region from memory, falling back to the
+        database. Expired entries are discarded. Must be called while holding the lock.
+        """
+        entry = self.entries.get(region)
+
+        if entry is None and self.database is not None:
+            entry = self._load(region)
+            if entry is not None:
+                self.entries[region] = entry
+                self._evict()
+
+        if entry is None:
+            return None
+
+        if time.time() - entry["fetched"] > self.ttl:
+            del self.entries[region]
+            return None
+
+        self.entries.move_to_end(region)
+        return entry
+
+    def _evict(self):
+        """
+        A method that evicts the least recently used entries and last seen acquisitions beyond the maximum size,
+        including those loaded from the database. Must be called while holding the lock.
+        """
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+        while len(self.lastseens) > self.maxsize:
+            self.lastseens.popitem(last=False)
+
+    def _load(self, region: str) -> dict:
+        """ A method that loads the entry for a region from the database. """
+        row = self.database.execute(
+            "SELECT startdate, enddate, fetched, acquisitions FROM catalog WHERE region = ?", (region,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        startdate, enddate, fetched, acquisitions = row
+        return {
+            "start": normalize(startdate),
+            "end": normalize(enddate),
+            "fetched": fetched,
+            "acquisitions": [normalize(date) for date in json.loads(acquisitions)],
+        }
+
+    def _persist(self, region: str, entry: dict):
+        """ A method that writes the entry for a region to the database and purges the expired entries. """
+        self.database.execute(
+            "INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?)", (
+                region,
+                entry["start"].isoformat(),
+                entry["end"].isoformat(),
+                entry["fetched"],
+                json.dumps([date.isoformat() for date in entry["acquisitions"]])
+            )
+        )
+        self.database.execute("DELETE FROM catalog WHERE fetched < ?", (time.time() - self.ttl,))
+        self.database.commit()
@@ -5,58 +5,31 @@ Google Cloud Platform - Cloud Run
 
 geocore-chrono service
 """
+from __future__ import annotations
+
 import os
-import json
 import datetime
 
 import flask
 import flask_restful
 
-import ee
-from terrarium import temporal
-from terrarium import spatial
-from terrarium import initialize
-
-class LogEntry:
-    """ A class that represents a serverless log compliant with Google Cloud Platform. """
-
-    service = "geocore-chrono"
-
-    def __init__(self, workflow: str) -> None:
-        """ Initialization Method """
-        self.workflow: str = workflow
-        self.logtrace: list = [f"execution started. worflow - {workflow}."]
-
-        self.baselog = {
-            "trace": self.logtrace, 
-            "service":self.service
-        }
+from geocore import logentry
+from geocore import metrics
+from geocore import startup
+from geocore.singleflight import SingleFlight
+from geocore.session import session, Health
 
-        project = os.environ.get('GCP_PROJECT')
-        reqtrace = flask.request.headers.get('X-Cloud-Trace-Context')
+from catalog import AcquisitionCatalog, normalize, regionkey
 
-        if reqtrace and project:
-            tracedata = f"projects/{project}/traces/{reqtrace.split('/')[0]}"
-            self.baselog.update({"logging.googleapis.com/trace": tracedata})
+# Import Earth Engine and Terrarium lazily, they are only required by the temporal endpoints
+ee = startup.lazyimport("ee")
+temporal = startup.lazyimport("terrarium.temporal")
+spatial = startup.lazyimport("terrarium.spatial")
 
-    def addtrace(self, trace: str):
-        """ A method that adds a trace string to the list of logtraces. """
-        self.logtrace.append(trace)
-
-    def flush(self, severity: str, message: str):
-        """
-        A method of LogEntry that creates and flushes the built log to Cloud Logging as
-        a structured log given that it is called within a Cloud Run/Functions Service.
-        The method accepts a log severity string and a log message string.
-
-        Accepted log severity values are - EMERGENCY, ALERT, CRITICAL, ERROR, WARNING, NOTICE, INFO, DEBUG and DEFAULT.
-        Refer to https://cloud.google.com/logging/docs/reference/v2/rest/v2/LogEntry#logseverity for more information.
-        """
-        self.addtrace("execution ended.")
-        logentry = dict(severity=severity, message=message)
-        logentry.update(self.baselog)
+class LogEntry(logentry.LogEntry):
+    """ A class that represents a serverless log compliant with Google Cloud Platform. """
 
-        print(json.dumps(logentry))
+    service = "geocore-chrono"
 
 class Check(flask_restful.Resource):
     """ RESTful resource for the '/check' endpoint. """
@@ -82,7 +55,7 @@ class Check(flask_restful.Resource):
                 log.flush("ERROR", "runtime terminated")
                 return {"error": f"temporal check failed. invalid bounds. must be a list"}, 400
 
-            log.addtrace(f"bounds - {bounds}.")
+            log.addtrace("bounds - {}.", bounds)
 
             # Check that timestamp is a str.
             if not isinstance(timestamp, str):
@@ -91,23 +64,23 @@ class Check(flask_restful.Resource):
                 log.flush("ERROR", "runtime terminated")
                 return {"error": f"temporal check failed. invalid timestamp. must be an str"}, 400
 
-            log.addtrace(f"timestamp - {timestamp}.")
+            log.addtrace("timestamp - {}.", timestamp)
 
         except KeyError as e:
             # log and return the error
-            log.addtrace(f"missing request parameter {e}.")
+            log.addtrace("missing request parameter {}.", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal check failed. missing request parameter. {e}"}, 400
 
-        log.addtrace(f"request parameters retrieved.")
+        log.addtrace("request parameters retrieved.")
 
         try:
-            # Initialize Earth Engine Session
-            initialize(os.environ.get("GCP_PROJECT")) if not ee.data._initialized else None
+            # Ensure that the Earth Engine Session is initialized
+            session.ensure()
 
         except Exception as e:
             # log and return the error
-            log.addtrace(f"{e}")
+            log.addtrace("{}", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal check failed. {e}"}, 500
 
@@ -120,13 +93,13 @@ class Check(flask_restful.Resource):
 
         except RuntimeError as e:
             # log and return the error
-            log.addtrace(f"could not generate geometry from bounds. {e}")
+            log.addtrace("could not generate geometry from bounds. {}", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal check failed. could not generate geometry from bounds. {e}"}, 400
 
         except Exception as e:
             # log and return the error
-            log.addtrace(f"could not generate date from timestamp. {e}")
+            log.addtrace("could not generate date from timestamp. {}", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal check failed. could not generate date from timestamp. {e}"}, 400
 
@@ -136,15 +109,17 @@ class Check(flask_restful.Resource):
             # Generate a daterange buffered around the date by 12 hours
             daterange = temporal.generate_daterange(date, 0.5, buffer=True)
 
-            # Create a Sentinel-2 MSI collection
-            collection = ee.ImageCollection("COPERNICUS/S2_SR")
-            # Filter the collection for the daterange
-            collection = collection.filterBounds(geometry).filterDate(*daterange)
-            
-            # Check if images exist in the the collection
-            exists = True if collection.size().getInfo() else False
+            # Generate the acquisitions for the daterange from the acquisition catalog, sharing
+            # the computation with the identical checks that are already in flight
+            flightkey = ("acquisitions", regionkey(bounds), *(normalize(date) for date in daterange))
+            acquisitions, shared = flights.do(flightkey, generate_acquisitions, bounds, geometry, daterange)
+            if shared:
+                log.addtrace("coalesced with an in-flight check.")
+
+            # Check if acquisitions exist in the daterange
+            exists = True if acquisitions else False
             # log the generated values
-            log.addtrace(f"acquisition check - {exists}")
+            log.addtrace("acquisition check - {}", exists)
             log.flush("INFO", "runtime complete")
 
             # Return the check response
@@ -180,7 +155,7 @@ class Select(flask_restful.Resource):
                 log.flush("ERROR", "runtime terminated")
                 return {"error": f"temporal select failed. invalid bounds. must be a list"}, 400
 
-            log.addtrace(f"bounds - {bounds}.")
+            log.addtrace("bounds - {}.", bounds)
 
             # Check that count is an int.
             if not isinstance(count, int):
@@ -189,23 +164,23 @@ class Select(flask_restful.Resource):
                 log.flush("ERROR", "runtime terminated")
                 return {"error": f"temporal select failed. invalid count. must be an int"}, 400
 
-            log.addtrace(f"count - {count}.")
+            log.addtrace("count - {}.", count)
 
         except KeyError as e:
             # log and return the error
-            log.addtrace(f"missing request parameter {e}.")
+            log.addtrace("missing request parameter {}.", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal select failed. missing request parameter. {e}"}, 400
 
-        log.addtrace(f"request parameters retrieved.")
+        log.addtrace("request parameters retrieved.")
 
         try:
-            # Initialize Earth Engine Session
-            initialize(os.environ.get("GCP_PROJECT")) if not ee.data._initialized else None
+            # Ensure that the Earth Engine Session is initialized
+            session.ensure()
 
         except Exception as e:
             # log and return the error
-            log.addtrace(f"{e}")
+            log.addtrace("{}", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal select failed. {e}"}, 500
         
@@ -215,7 +190,7 @@ class Select(flask_restful.Resource):
 
         except RuntimeError as e:
             # log and return the error
-            log.addtrace(f"could not generate geometry from bounds. {e}")
+            log.addtrace("could not generate geometry from bounds. {}", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal select failed. could not generate geometry from bounds. {e}"}, 400
 
@@ -227,25 +202,23 @@ class Select(flask_restful.Resource):
             # Generate a daterange going back 10 days from the current day
             daterange = temporal.generate_daterange(today, 10)
 
-            # Create a Sentinel-2 MSI collection
-            collection = ee.ImageCollection("COPERNICUS/S2_SR")
-            # Filter the collection for the daterange
-            collection = collection.filterBounds(geometry).filterDate(*daterange)
+            # Generate the latest acquisition for the daterange, sharing the computation with the
+            # identical selects that are already in flight. The daterange ends at the current time,
+            # so the selects for a region on the same day are considered identical.
+            flightkey = ("latestacquisition", regionkey(bounds), today.date())
+            latest, shared = flights.do(flightkey, generate_latestacquisition, bounds, geometry, daterange)
+            if shared:
+                log.addtrace("coalesced with an in-flight select.")
 
         except Exception as e:
             # log and return the error
-            log.addtrace(f"could not filter sentinel-2 collection. {e}")
+            log.addtrace("could not filter sentinel-2 collection. {}", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal select failed. could not filter sentinel-2 collection. {e}"}, 500
 
-        log.addtrace("filtered collection generated.")
+        log.addtrace("latest acquisition generated.")
 
         try:
-            # Generate a list of dates from the Earth Engine Collection
-            datelist = temporal.generate_earthenginecollection_datelist(collection)
-            # Select the last date from the datelist as the latest date
-            latest = datelist[-1]
-
             # Generate a list dates for the last 'count' no of acquisitions.
             # Each generation cycles shifts the day 5 days behind and adds it to the list.
             datetimes = [date := latest, *[date := temporal.shift_date(date, -5) for _ in range(count-1)]]
@@ -255,7 +228,7 @@ class Select(flask_restful.Resource):
             # Convert the acquisition dates to IS08601 strings
             timestamps = [date.isoformat() for date in datetimes]
             # log the generated values
-            log.addtrace(f"acquisition dates selected. dates - {timestamps}")
+            log.addtrace("acquisition dates selected. dates - {}", timestamps)
             log.flush("INFO", "runtime complete")
 
             # Return the select response
@@ -263,20 +236,320 @@ class Select(flask_restful.Resource):
 
         except Exception as e:
             # log and return the error
-            log.addtrace(f"could not select acquisition dates. {e}")
+            log.addtrace("could not select acquisition dates. {}", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"temporal select failed. could not select acquisition dates. {e}"}, 500
 
 
+class CheckBatch(flask_restful.Resource):
+    """ RESTful resource for the '/check/batch' endpoint. """
+
+    def post(self):
+        """ RESTful POST """
+        # Create a LogEntry object for the checkbatch workflow
+        log = LogEntry("checkbatch")
+
+        # Parse the request JSON
+        request = flask.request.get_json()
+        log.addtrace("request parsed.")
+
+        try:
+            # Retrieve the 'checks' key from the request
+            checks = request["checks"]
+
+            # Check that checks is a list.
+            if not isinstance(checks, list):
+                # log and return the error
+                log.addtrace("invalid checks.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"temporal batch check failed. invalid checks. must be a list"}, 400
+
+            # Retrieve the maximum number of checks in a batch
+            batchmax = int(os.environ.get("CHECK_BATCHMAX", 1000))
+
+            # Check that the batch is within the maximum size.
+            if len(checks) > batchmax:
+                # log and return the error
+                log.addtrace("batch too large.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"temporal batch check failed. invalid checks. must have at most {batchmax} checks"}, 400
+
+            log.addtrace("check count - {}.", len(checks))
+
+        except KeyError as e:
+            # log and return the error
+            log.addtrace("missing request parameter {}.", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"temporal batch check failed. missing request parameter. {e}"}, 400
+
+        log.addtrace("request parameters retrieved.")
+
+        try:
+            # Ensure that the Earth Engine Session is initialized
+            session.ensure()
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("{}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"temporal batch check failed. {e}"}, 500
+
+        # Create a result slot for each check to preserve the request order
+        results = [None] * len(checks)
+        # Create a list of (position, bounds, geometry, daterange) for the valid checks
+        valid = []
+
+        for position, item in enumerate(checks):
+            try:
+                # Generate the parameters for the check
+                valid.append((position, *generate_checkparams(item)))
+
+            except ValueError as e:
+                # Record the error for the check without failing the batch
+                results[position] = {"error": f"temporal check failed. {e}"}
+
+        log.addtrace("check parameters generated. valid - {}. invalid - {}.", len(valid), len(checks) - len(valid))
+
+        # Create a list of (position, bounds, geometry, daterange, missing) for the checks not answered by the catalog
+        pending = []
+
+        for position, bounds, geometry, daterange in valid:
+            # Lookup the known acquisitions and the missing dateranges in the acquisition catalog
+            acquisitions, missing = catalog.lookup(regionkey(bounds), *(normalize(date) for date in daterange))
+
+            if acquisitions or not missing:
+                results[position] = {"check": True if acquisitions else False}
+            else:
+                pending.append((position, bounds, geometry, daterange, missing))
+
+        log.addtrace("acquisition catalog resolved. answered - {}. pending - {}.", len(valid) - len(pending), len(pending))
+
+        # Retrieve the number of checks evaluated per Earth Engine request
+        batchsize = int(os.environ.get("CHECK_BATCHSIZE", 100))
+        retried = 0
+
+        for start in range(0, len(pending), batchsize):
+            # Isolate the checks for the chunk
+            chunk = pending[start:start + batchsize]
+
+            try:
+                # Retrieve the acquisition timestamps of the missing dateranges of all the checks in the chunk in a single request
+                timestamps = ee.List([generate_missingtimestamps(geometry, missing) for _, _, geometry, _, missing in chunk]).getInfo()
+
+                for (position, bounds, _, daterange, missing), fetched in zip(chunk, timestamps):
+                    # Update the acquisition catalog with the acquisitions of the missing dateranges
+                    acquisitions = update_catalog(regionkey(bounds), missing, fetched)
+                    results[position] = {"check": True if acquisitions else False}
+
+            except Exception:
+                # Retry the checks of the failed chunk individually, so that a single failing check only fails itself
+                for position, bounds, geometry, daterange, _ in chunk:
+                    try:
+                        flightkey = ("acquisitions", regionkey(bounds), *(normalize(date) for date in daterange))
+                        acquisitions, _ = flights.do(flightkey, generate_acquisitions, bounds, geometry, daterange)
+                        results[position] = {"check": True if acquisitions else False}
+
+                    except Exception as e:
+                        # Record the error for the check without failing the batch
+                        results[position] = {"error": f"temporal check failed. could not check if acquisition exists. {e}"}
+
+                retried += len(chunk)
+
+        # log the generated values
+        log.addtrace("acquisition checks evaluated. chunks - {}. retried - {}.", -(-len(pending) // batchsize), retried)
+        log.flush("INFO", "runtime complete")
+
+        # Return the batch check response
+        return {"checks": results}, 200
+
+def generate_checkparams(item: dict) -> tuple:
+    """
+    A function that generates the bounds, Earth Engine Geometry and daterange for a single check item
+    of a batch check. The check item must be a dictionary with the 'bounds' and 'timestamp' keys, in
+    the same form as the '/check' request.
+
+    Raises a ValueError with the reason if the check item is invalid.
+    """
+    # Check that item is a dictionary.
+    if not isinstance(item, dict):
+        raise ValueError("invalid check. must be a dictionary")
+
+    try:
+        # Retrieve the 'bounds' and 'timestamp' keys from the check
+        bounds = item["bounds"]
+        timestamp = item["timestamp"]
+
+    except KeyError as e:
+        raise ValueError(f"missing request parameter. {e}")
+
+    # Check that bounds is a list.
+    if not isinstance(bounds, list):
+        raise ValueError("invalid bounds. must be a list")
+
+    # Check that timestamp is a str.
+    if not isinstance(timestamp, str):
+        raise ValueError("invalid timestamp. must be an str")
+
+    try:
+        # Generate an Earth Engine Geometry from the bounds
+        geometry = spatial.generate_earthenginegeometry_frombounds(*bounds)
+
+    except Exception as e:
+        raise ValueError(f"could not generate geometry from bounds. {e}")
+
+    try:
+        # Obtain the datetime from the timestamp
+        date = datetime.datetime.fromisoformat(timestamp)
+
+    except Exception as e:
+        raise ValueError(f"could not generate date from timestamp. {e}")
+
+    # Generate a daterange buffered around the date by 12 hours
+    return bounds, geometry, temporal.generate_daterange(date, 0.5, buffer=True)
+
+def generate_missingtimestamps(geometry: ee.Geometry, missing: list) -> ee.List:
+    """
+    A function that generates the server-side list of the Sentinel-2 acquisition timestamp lists
+    of a region for each of a list of (start, end) dateranges.
+    """
+    timestamps = []
+
+    for start, end in missing:
+        # Create a Sentinel-2 MSI collection
+        collection = ee.ImageCollection("COPERNICUS/S2_SR")
+        # Filter the collection for the daterange
+        collection = collection.filterBounds(geometry).filterDate(start, end)
+
+        timestamps.append(collection.aggregate_array("system:time_start"))
+
+    return ee.List(timestamps)
+
+def update_catalog(region: str, missing: list, timestamps: list) -> list:
+    """
+    A function that updates the acquisition catalog for a region with the epoch millisecond acquisition
+    timestamps retrieved for each of a list of missing (start, end) dateranges and advances the last seen
+    acquisition of the region. Returns the acquisitions within the missing dateranges.
+    """
+    acquisitions = []
+
+    for (start, end), fetched in zip(missing, timestamps):
+        fetched = [datetime.datetime.utcfromtimestamp(timestamp / 1000) for timestamp in fetched]
+
+        # Update the catalog with the acquisitions of the missing daterange
+        catalog.update(region, start, end, fetched)
+        acquisitions.extend(date for date in fetched if start <= date < end)
+
+    # Advance the last seen acquisition for the region
+    if acquisitions:
+        catalog.advance(region, max(acquisitions))
+
+    return acquisitions
+
+class Catalog(flask_restful.Resource):
+    """ RESTful resource for the '/catalog' endpoint. """
+
+    def get(self):
+        """ RESTful GET """
+        # Return the acquisition catalog counters
+        return {"catalog": catalog.stats()}, 200
+
+def generate_acquisitions(bounds: list, geometry: ee.Geometry, daterange: tuple) -> list:
+    """
+    A function that generates the sorted list of Sentinel-2 acquisition datetimes for a region within a 
+    daterange. The acquisitions are answered from the acquisition catalog when it covers the daterange 
+    and only the dateranges missing from the catalog are retrieved from Earth Engine.
+    """
+    # Generate the catalog key for the region and normalize the daterange
+    region = regionkey(bounds)
+    start, end = (normalize(date) for date in daterange)
+
+    # Lookup the known acquisitions and the missing dateranges in the catalog
+    acquisitions, missing = catalog.lookup(region, start, end)
+
+    if missing:
+        # Retrieve the acquisitions of the missing dateranges in a single request and update the catalog
+        timestamps = generate_missingtimestamps(geometry, missing).getInfo()
+        acquisitions.extend(update_catalog(region, missing, timestamps))
+
+    # Advance the last seen acquisition for the region
+    if acquisitions:
+        catalog.advance(region, max(acquisitions))
+
+    return sorted(set(acquisitions))
+
+def generate_latestacquisition(bounds: list, geometry: ee.Geometry, daterange: tuple) -> datetime.datetime:
+    """
+    A function that generates the latest Sentinel-2 acquisition datetime for a region within a daterange.
+    If the last seen acquisition of the region is known and within the daterange, only the acquisitions 
+    newer than it are queried with a server-side maximum, instead of transferring the full list of
+    acquisitions. Otherwise, the full list of acquisitions is generated with the acquisition catalog.
+
+    Raises a RuntimeError if there are no acquisitions within the daterange.
+    """
+    # Generate the catalog key for the region and normalize the daterange
+    region = regionkey(bounds)
+    start, end = (normalize(date) for date in daterange)
+
+    # Retrieve the last seen acquisition for the region
+    lastseen = catalog.lastseen(region, start)
+
+    if lastseen is None:
+        # Generate the full list of acquisitions for the daterange
+        acquisitions = generate_acquisitions(bounds, geometry, daterange)
+
+        if not acquisitions:
+            raise RuntimeError("no acquisitions found in daterange")
+
+        return acquisitions[-1]
+
+    # Create a Sentinel-2 MSI collection
+    collection = ee.ImageCollection("COPERNICUS/S2_SR")
+    # Filter the collection for the acquisitions since the last seen acquisition
+    collection = collection.filterBounds(geometry).filterDate(lastseen, end)
+
+    # Retrieve the latest acquisition timestamp of the collection
+    timestamp = collection.aggregate_max("system:time_start").getInfo()
+    if timestamp is None:
+        return lastseen
+
+    # Advance the last seen acquisition for the region
+    latest = datetime.datetime.utcfromtimestamp(timestamp / 1000)
+    catalog.advance(region, latest)
+
+    return max(lastseen, latest)
+
+# Create the acquisition catalog for the service
+catalog = AcquisitionCatalog(
+    ttl=float(os.environ.get("CATALOG_TTL", 21600)),
+    maxsize=int(os.environ.get("CATALOG_MAXSIZE", 10000)),
+    settle=float(os.environ.get("CATALOG_SETTLE", 259200)),
+    path=os.environ.get("CATALOG_PATH")
+)
+# Expose the acquisition catalog counters as metrics
+metrics.registry.register("geocore_catalog", LogEntry.service, catalog.stats)
+
+# Create the request coalescing group for the service
+flights = SingleFlight()
+# Expose the request coalescing counters as metrics
+metrics.registry.register("geocore_singleflight", LogEntry.service, flights.stats)
+
+# Expose the earth engine session counters as metrics
+metrics.registry.register("geocore_session", LogEntry.service, session.stats)
+
 app = flask.Flask(__name__)
 api = flask_restful.Api(app)
 
 api.add_resource(Check, '/check')
+api.add_resource(CheckBatch, '/check/batch')
 api.add_resource(Select, '/select')
+api.add_resource(Catalog, '/catalog')
+api.add_resource(metrics.Metrics, '/metrics')
+api.add_resource(Health, '/health')
 
 if __name__ == '__main__':
-    # Initialize Earth Engine Session
-    initialize(os.environ.get("GCP_PROJECT")) if not ee.data._initialized else None
+    # Initialize Earth Engine Session and report the startup times
+    startup.initialize_earthengine()
+    startup.report(LogEntry.service)
 
     # Start the Flask App
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
@@ -0,0 +1,116 @@
+"""
+GeoSentry GeoCore API
+
+geocore-chrono service - acquisition catalog tests
+"""
+import types
+import datetime
+
+import pytest
+
+import catalog
+from catalog import AcquisitionCatalog, normalize, regionkey
+
+START = datetime.datetime(2022, 1, 1)
+END = datetime.datetime(2022, 1, 11)
+
+ACQUISITIONS = [datetime.datetime(2022, 1, 2, 5, 30), datetime.datetime(2022, 1, 7, 5, 30)]
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ A fixture that returns a mutable clock of epoch seconds that the catalog reads instead of the system time. """
+    clock = types.SimpleNamespace(now=1700000000.0)
+    monkeypatch.setattr(catalog, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def test_normalize_and_regionkey():
+    assert normalize("2022-01-01T05:30:00+05:30") == datetime.datetime(2022, 1, 1)
+    assert normalize(datetime.date(2022, 1, 1)) == datetime.datetime(2022, 1, 1)
+    assert regionkey([77.1, 12, "77.2", 12.2]) == "77.100000,12.000000,77.200000,12.200000"
+
+def test_lookup_returns_known_acquisitions_and_missing_dateranges(clock):
+    acquisitions = AcquisitionCatalog(ttl=60, maxsize=10, settle=0)
+    assert acquisitions.lookup("region", START, END) == ([], [(START, END)])
+
+    acquisitions.update("region", START, END, ACQUISITIONS)
+    assert acquisitions.lookup("region", START, END) == (ACQUISITIONS, [])
+
+    # A wider daterange is a partial hit with the uncovered ends missing
+    wider = (START - datetime.timedelta(days=2), END + datetime.timedelta(days=2))
+    assert acquisitions.lookup("region", *wider) == (ACQUISITIONS, [(wider[0], START), (END, wider[1])])
+
+    assert acquisitions.stats() == {"hits": 1, "partials": 1, "misses": 1, "evictions": 0, "deltas": 0, "size": 1}
+
+def test_entries_expire_after_the_ttl(clock):
+    acquisitions = AcquisitionCatalog(ttl=60, maxsize=10, settle=0)
+    acquisitions.update("region", START, END, ACQUISITIONS)
+
+    clock.now += 60
+    assert acquisitions.lookup("region", START, END) == (ACQUISITIONS, [])
+
+    clock.now += 1
+    assert acquisitions.lookup("region", START, END) == ([], [(START, END)])
+    assert acquisitions.stats()["size"] == 0
+
+def test_least_recently_used_entries_are_evicted(clock):
+    acquisitions = AcquisitionCatalog(ttl=60, maxsize=2, settle=0)
+    acquisitions.update("first", START, END, [])
+    acquisitions.update("second", START, END, [])
+
+    # Using the first region makes the second the least recently used
+    acquisitions.lookup("first", START, END)
+    acquisitions.update("third", START, END, [])
+
+    assert list(acquisitions.entries) == ["first", "third"]
+    assert acquisitions.stats()["evictions"] == 1
+
+def test_covered_daterange_stops_at_the_settle_horizon(clock):
+    acquisitions = AcquisitionCatalog(ttl=60, maxsize=10, settle=3 * 86400)
+    now = datetime.datetime.utcnow()
+    start, end = now - datetime.timedelta(days=10), now + datetime.timedelta(days=1)
+    recent = now - datetime.timedelta(days=1)
+
+    acquisitions.update("region", start, end, [recent])
+    known, missing = acquisitions.lookup("region", start, end)
+
+    # The recent acquisition is kept, but the recent days are retrieved again
+    assert known == [recent]
+    assert len(missing) == 1
+    assert missing[0][1] == end
+    assert now - datetime.timedelta(days=3) <= missing[0][0] < now - datetime.timedelta(days=3) + datetime.timedelta(minutes=1)
+
+def test_lastseen_advances_and_is_bounded_with_the_entries(clock):
+    acquisitions = AcquisitionCatalog(ttl=60, maxsize=2, settle=0)
+    acquisitions.advance("first", ACQUISITIONS[1])
+    acquisitions.advance("first", ACQUISITIONS[0])
+
+    assert acquisitions.lastseen("first", START) == ACQUISITIONS[1]
+    assert acquisitions.lastseen("first", END) is None
+
+    acquisitions.advance("second", ACQUISITIONS[0])
+    acquisitions.advance("third", ACQUISITIONS[0])
+
+    assert list(acquisitions.lastseens) == ["second", "third"]
+    assert acquisitions.lastseen("first", START) is None
+
+def test_sqlite_backend_persists_entries_and_lastseens(clock, tmp_path):
+    path = str(tmp_path / "catalog.db")
+    acquisitions = AcquisitionCatalog(ttl=60, maxsize=2, settle=0, path=path)
+    acquisitions.update("first", START, END, ACQUISITIONS)
+    acquisitions.advance("first", ACQUISITIONS[1])
+    acquisitions.advance("second", ACQUISITIONS[0])
+    acquisitions.advance("third", ACQUISITIONS[0])
+
+    # A new catalog on the same database answers from the persisted rows
+    restarted = AcquisitionCatalog(ttl=60, maxsize=2, settle=0, path=path)
+    assert restarted.lookup("first", START, END) == (ACQUISITIONS, [])
+    assert restarted.lastseen("first", START) == ACQUISITIONS[1]
+
+    # The last seen acquisitions loaded from the database are bounded like the entries
+    restarted.lastseen("second", START)
+    restarted.lastseen("third", START)
+    assert list(restarted.lastseens) == ["second", "third"]
+
+    # The persisted entries expire after the ttl
+    clock.now += 61
+    assert AcquisitionCatalog(ttl=60, maxsize=2, settle=0, path=path).lookup("first", START, END) == ([], [(START, END)])
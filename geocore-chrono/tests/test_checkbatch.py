@@ -0,0 +1,133 @@
+"""
+GeoSentry GeoCore API
+
+geocore-chrono service - batch check tests
+"""
+import types
+import datetime
+
+import pytest
+
+import main
+from catalog import AcquisitionCatalog
+
+# The bounds of the regions with and without an acquisition and of the region that fails on the server
+ACQUIRED = [77.1, 12.1, 77.2, 12.2]
+EMPTY = [78.1, 13.1, 78.2, 13.2]
+FAILING = [79.1, 14.1, 79.2, 14.2]
+
+TIMESTAMP = "2022-01-01T10:00:00"
+
+class Timestamps:
+    """ A class that stands in for the server-side list of acquisition timestamps of a region. """
+
+    def __init__(self, client, geometry: tuple, missing: list) -> None:
+        self.client, self.geometry, self.missing = client, geometry, missing
+
+    def fetch(self) -> list:
+        if self.geometry in self.client.failures:
+            raise RuntimeError("computation timed out")
+
+        acquisitions = self.client.acquisitions.get(self.geometry, [])
+        return [
+            [date.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000 for date in acquisitions if start <= date < end]
+            for start, end in self.missing
+        ]
+
+    def getInfo(self) -> list:
+        self.client.requests.append(("single", list(self.geometry)))
+        return self.fetch()
+
+class List:
+    """ A class that stands in for the server-side list of the timestamps of a chunk of checks. """
+
+    def __init__(self, client, items: list) -> None:
+        self.client, self.items = client, items
+
+    def getInfo(self) -> list:
+        self.client.requests.append(("chunk", len(self.items)))
+        return [item.fetch() for item in self.items]
+
+@pytest.fixture
+def client(monkeypatch):
+    """ A fixture that returns a test client with an empty acquisition catalog and a stand-in Earth Engine that records its requests. """
+    client = main.app.test_client()
+    client.requests, client.failures = [], set()
+    client.acquisitions = {tuple(ACQUIRED): [datetime.datetime(2022, 1, 1, 5, 30)]}
+
+    def generate_daterange(date: datetime.datetime, days: float, buffer: bool = False) -> tuple:
+        return date - datetime.timedelta(days=days), date + datetime.timedelta(days=days)
+
+    monkeypatch.setattr(main, "spatial", types.SimpleNamespace(generate_earthenginegeometry_frombounds=lambda *bounds: bounds))
+    monkeypatch.setattr(main, "temporal", types.SimpleNamespace(generate_daterange=generate_daterange))
+    monkeypatch.setattr(main, "ee", types.SimpleNamespace(List=lambda items: List(client, items)))
+    monkeypatch.setattr(main, "generate_missingtimestamps", lambda geometry, missing: Timestamps(client, geometry, missing))
+    monkeypatch.setattr(main, "catalog", AcquisitionCatalog(ttl=60, maxsize=100, settle=0))
+    monkeypatch.setattr(main.session, "ensure", lambda: None)
+    monkeypatch.setattr(main.logentry.writer, "write", lambda entry: None)
+
+    return client
+
+def post(client, bounds: list) -> tuple:
+    """ A function that posts a batch check of a list of bounds and returns the status and the results. """
+    response = client.post("/check/batch", json={"checks": [{"bounds": item, "timestamp": TIMESTAMP} for item in bounds]})
+    return response.status_code, response.get_json()
+
+def test_results_keep_the_request_order_with_invalid_checks(client):
+    response = client.post("/check/batch", json={"checks": [
+        {"bounds": ACQUIRED, "timestamp": TIMESTAMP},
+        {"bounds": "invalid", "timestamp": TIMESTAMP},
+        {"bounds": EMPTY, "timestamp": TIMESTAMP},
+        {"bounds": EMPTY},
+    ]})
+
+    results = response.get_json()["checks"]
+    assert response.status_code == 200
+    assert results[0] == {"check": True}
+    assert "invalid bounds" in results[1]["error"]
+    assert results[2] == {"check": False}
+    assert "missing request parameter" in results[3]["error"]
+
+    # The valid checks are retrieved with a single request
+    assert client.requests == [("chunk", 2)]
+
+def test_catalog_answers_checks_before_earth_engine(client):
+    post(client, [ACQUIRED])
+    client.requests.clear()
+
+    # The cataloged region is answered without a request
+    status, body = post(client, [ACQUIRED])
+    assert (status, body["checks"]) == (200, [{"check": True}])
+    assert client.requests == []
+
+    # Only the uncataloged region is retrieved
+    status, body = post(client, [EMPTY, ACQUIRED])
+    assert body["checks"] == [{"check": False}, {"check": True}]
+    assert client.requests == [("chunk", 1)]
+
+    assert main.catalog.stats()["hits"] == 2
+
+def test_failed_chunk_is_retried_one_check_at_a_time(client, monkeypatch):
+    monkeypatch.setenv("CHECK_BATCHSIZE", "2")
+    client.failures.add(tuple(FAILING))
+
+    status, body = post(client, [FAILING, ACQUIRED, EMPTY])
+
+    assert status == 200
+    assert "could not check if acquisition exists. computation timed out" in body["checks"][0]["error"]
+    assert body["checks"][1:] == [{"check": True}, {"check": False}]
+
+    # Only the checks of the failed chunk are retried, the next chunk is still retrieved in a single request
+    assert client.requests == [("chunk", 2), ("single", FAILING), ("single", ACQUIRED), ("chunk", 1)]
+
+def test_batch_over_the_maximum_is_rejected(client, monkeypatch):
+    monkeypatch.setenv("CHECK_BATCHMAX", "2")
+
+    status, body = post(client, [ACQUIRED, EMPTY, ACQUIRED])
+
+    assert status == 400
+    assert body["error"] == "temporal batch check failed. invalid checks. must have at most 2 checks"
+    assert client.requests == []
+
+    status, body = post(client, [ACQUIRED, EMPTY])
+    assert status == 200
@@ -0,0 +1,171 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-raster service - cloud optimized geotiff writer
+
+The Cloud-Optimized GeoTIFFs are written with the IFDs of the full resolution image and its overviews at the start
+of the file, followed by the deflate compressed tiles of the overviews from the smallest to the largest and then the
+tiles of the full resolution image, so that a reader can fetch the tiles of any level with range requests. The bands
+are stored as separate planes, so that each band is tiled on its own without interleaving the bands in memory.
+"""
+import zlib
+import shutil
+import struct
+import tempfile
+import contextlib
+
+import numpy
+
+# The TIFF field types as (code, struct format) tuples
+SHORT = (3, "H")
+LONG = (4, "I")
+DOUBLE = (12, "d")
+
+# The TIFF sample formats of the numpy dtype kinds
+SAMPLE_FORMATS = {"u": 1, "b": 1, "i": 2, "f": 3}
+
+def write(file, bands, transform: tuple, tilesize: int = 256, level: int = 6):
+    """
+    A function that writes a sequence of (rows, cols) band arrays, such as a (bands, rows, cols) array or a list of views
+    into the fields of a structured array, as a Cloud-Optimized GeoTIFF to a writable binary file. The transform is the
+    (west, north, xsize, ysize) of the pixels in degrees, the tiles are 'tilesize' pixels square and compressed with the
+    zlib compression 'level'. Overviews are generated by nearest neighbour decimation until they fit within a single tile.
+
+    The bands are tiled one at a time from strided views, so only a single tile of each band is copied at a time. The
+    compressed tiles of each level are spooled to a temporary file so that their offsets are known before the IFDs are
+    written, and then copied to the file in chunks, without holding a full copy of the output in memory.
+    """
+    bands = list(bands)
+    dtype = numpy.result_type(*bands)
+    if dtype.kind == "b":
+        dtype = numpy.dtype(numpy.uint8)
+
+    # Write the samples in little endian order
+    dtype = dtype.newbyteorder("<")
+    rows, cols = bands[0].shape
+
+    # Generate the strides of the full resolution level and the overviews
+    steps = [1]
+    while max(-(-rows // steps[-1]), -(-cols // steps[-1])) > tilesize:
+        steps.append(steps[-1] * 2)
+
+    with contextlib.ExitStack() as stack:
+        spools = [stack.enter_context(tempfile.TemporaryFile()) for _ in steps]
+        tiles = [[] for _ in steps]
+
+        # Compress the tiles of every level of each band in turn, the tiles of a level are ordered by band
+        for band in bands:
+            for position, step in enumerate(steps):
+                for tile in generate_tiles(band[::step, ::step], tilesize, dtype):
+                    data = zlib.compress(tile.tobytes(), level)
+                    tiles[position].append((spools[position].tell(), len(data)))
+                    spools[position].write(data)
+
+        # Place the tiles of the overviews from the smallest to the largest and then the full resolution image
+        starts, start = {}, 0
+        for position in reversed(range(len(steps))):
+            starts[position] = start
+            start += spools[position].tell()
+
+        shapes = [(-(-rows // step), -(-cols // step)) for step in steps]
+
+        # Generate the IFDs with placeholder offsets to compute the size of the header
+        ifds = [generate_entries(shapes[position], len(bands), dtype, position, tiles[position], 0, tilesize, transform) for position in range(len(steps))]
+        datastart = 8 + sum(len(serialize_ifd(entries, 0, 0)) for entries in ifds)
+
+        # Write the TIFF header followed by the IFDs with the offsets of the tiles
+        file.write(b"II*\x00" + struct.pack("<I", 8))
+
+        offset = 8
+        for position in range(len(steps)):
+            entries = generate_entries(shapes[position], len(bands), dtype, position, tiles[position], datastart + starts[position], tilesize, transform)
+            size = len(serialize_ifd(entries, offset, 0))
+            following = offset + size if position < len(steps) - 1 else 0
+
+            file.write(serialize_ifd(entries, offset, following))
+            offset += size
+
+        # Copy the compressed tiles of each level to the file
+        for position in reversed(range(len(steps))):
+            spools[position].seek(0)
+            shutil.copyfileobj(spools[position], file, 1024 * 1024)
+
+def generate_tiles(band: numpy.ndarray, tilesize: int, dtype: numpy.dtype):
+    """ A generator function that yields the tiles of a (rows, cols) band in row major order, converted to the dtype and padded with zeros to the tile size. """
+    rows, cols = band.shape
+
+    for row in range(0, rows, tilesize):
+        for col in range(0, cols, tilesize):
+            tile = numpy.zeros((tilesize, tilesize), dtype=dtype)
+            window = band[row:row + tilesize, col:col + tilesize]
+            tile[:window.shape[0], :window.shape[1]] = window
+
+            yield tile
+
+def generate_entries(shape: tuple, bands: int, dtype: numpy.dtype, position: int, tiles: list, datastart: int, tilesize: int, transform: tuple) -> list:
+    """
+    A function that generates the IFD entries of a level of a (rows, cols) shape as (tag, type, values) tuples sorted by tag.
+    The georeferencing tags are only written for the full resolution image at position 0, the overviews are marked as reduced
+    resolution. The 'tiles' are the (offset, length) of the tiles of the level relative to 'datastart', ordered by band.
+    """
+    rows, cols = shape
+    rgb = bands == 3 and dtype == numpy.uint8
+
+    entries = [
+        (254, LONG, [0 if position == 0 else 1]),
+        (256, LONG, [cols]),
+        (257, LONG, [rows]),
+        (258, SHORT, [dtype.itemsize * 8] * bands),
+        (259, SHORT, [8]),
+        (262, SHORT, [2 if rgb else 1]),
+        (277, SHORT, [bands]),
+        # The bands are stored as separate planes
+        (284, SHORT, [2]),
+        (322, SHORT, [tilesize]),
+        (323, SHORT, [tilesize]),
+        (324, LONG, [datastart + offset for offset, _ in tiles]),
+        (325, LONG, [length for _, length in tiles]),
+    ]
+
+    # Mark the samples beyond the color or gray samples as unspecified extra samples
+    extras = bands - (3 if rgb else 1)
+    if extras > 0:
+        entries.append((338, SHORT, [0] * extras))
+
+    entries.append((339, SHORT, [SAMPLE_FORMATS[dtype.kind]] * bands))
+
+    if position == 0:
+        west, north, xsize, ysize = transform
+        entries += [
+            (33550, DOUBLE, [xsize, ysize, 0.0]),
+            (33922, DOUBLE, [0.0, 0.0, 0.0, west, north, 0.0]),
+            # A geographic WGS84 model with pixels that represent areas
+            (34735, SHORT, [1, 1, 0, 3, 1024, 0, 1, 2, 1025, 0, 1, 1, 2048, 0, 1, 4326]),
+        ]
+
+    return entries
+
+def serialize_ifd(entries: list, offset: int, following: int) -> bytes:
+    """
+    A function that serializes the IFD entries for an IFD at the given offset of the file, followed by the values that
+    do not fit within their entries. The 'following' offset is the offset of the next IFD, or 0 for the last IFD.
+    """
+    valuestart = offset + 2 + 12 * len(entries) + 4
+    header, values = [struct.pack("<H", len(entries))], []
+
+    for tag, (code, fmt), items in entries:
+        data = struct.pack(f"<{len(items)}{fmt}", *items)
+
+        if len(data) <= 4:
+            header.append(struct.pack("<HHI", tag, code, len(items)) + data.ljust(4, b"\x00"))
+            continue
+
+        position = valuestart + sum(len(value) for value in values)
+        header.append(struct.pack("<HHII", tag, code, len(items), position))
+        # Keep the values on word boundaries
+        values.append(data + b"\x00" * (len(data) % 2))
+
+    header.append(struct.pack("<I", following))
+    return b"".join(header + values)
@@ -0,0 +1,206 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-raster service - local dem tile store
+
+The DEM tiles are NumPy arrays saved as '.npy' files, each covering a 1 degree square named after its south west
+corner in the SRTM convention, such as 'N12E077.npy' for the tile from 77E to 78E and 12N to 13N. The rows of a
+tile run from north to south and its columns from west to east, and every pixel covers an equal fraction of the
+tile. A synthetic DEM can be written for local testing with 'python demstore.py <path> <tile> [<tile> ...]'.
+"""
+import os
+import sys
+import math
+import threading
+import collections
+
+import numpy
+
+class DEMStore:
+    """
+    A class that represents a store of local DEM tiles at 'path' that are memory-mapped when they are first read.
+
+    Up to 'maxtiles' tiles are held open in an LRU, so that the tiles of the frequently queried regions are
+    answered from the page cache. Pixels equal to 'nodata' are returned as NaN. Tiles that are not on disk
+    are reported as missing, so that the caller can fall back to Earth Engine.
+    """
+
+    def __init__(self, path: str, maxtiles: int, nodata: float = -32768) -> None:
+        """ Initialization Method """
+        self.path: str = path
+        self.maxtiles: int = maxtiles
+        self.nodata: float = nodata
+
+        self.lock = threading.Lock()
+        self.tiles = collections.OrderedDict()
+        self.counters = {"hits": 0, "opens": 0, "missing": 0, "evictions": 0}
+
+    @staticmethod
+    def tilename(west: int, south: int) -> str:
+        """ A static method that generates the name of the tile with the given south west corner. """
+        return f"{'N' if south >= 0 else 'S'}{abs(south):02d}{'E' if west >= 0 else 'W'}{abs(west):03d}"
+
+    def tile(self, west: int, south: int) -> numpy.ndarray:
+        """ A method that returns the memory-mapped array of the tile with the given south west corner or None if it is not on disk. """
+        name = self.tilename(west, south)
+
+        with self.lock:
+            if name in self.tiles:
+                self.tiles.move_to_end(name)
+                self.counters["hits"] += 1
+                return self.tiles[name]
+
+            filepath = os.path.join(self.path, f"{name}.npy") if self.path else None
+
+            if filepath is None or not os.path.exists(filepath):
+                self.counters["missing"] += 1
+                return None
+
+            self.tiles[name] = numpy.load(filepath, mmap_mode="r")
+            self.counters["opens"] += 1
+
+            # Close the least recently used tiles beyond the maximum number of open tiles
+            while len(self.tiles) > self.maxtiles:
+                self.tiles.popitem(last=False)
+                self.counters["evictions"] += 1
+
+            return self.tiles[name]
+
+    def sample(self, longitudes: list, latitudes: list) -> tuple:
+        """
+        A method that samples the elevations at a list of points with vectorized lookups for the points of each tile.
+        Returns a tuple of the array of elevations and a boolean array that is False for the points whose tile is not
+        on disk and must be sampled elsewhere.
+        """
+        longitudes = numpy.asarray(longitudes, dtype=float)
+        latitudes = numpy.asarray(latitudes, dtype=float)
+
+        elevations = numpy.full(longitudes.shape, numpy.nan)
+        found = numpy.zeros(longitudes.shape, dtype=bool)
+
+        wests = numpy.floor(longitudes).astype(int)
+        souths = numpy.floor(latitudes).astype(int)
+
+        for west, south in set(zip(wests.tolist(), souths.tolist())):
+            tile = self.tile(west, south)
+            if tile is None:
+                continue
+
+            selected = (wests == west) & (souths == south)
+            rows, cols = tile.shape
+
+            # Generate the pixel positions of the points within the tile
+            row = numpy.clip(((south + 1 - latitudes[selected]) * rows).astype(int), 0, rows - 1)
+            col = numpy.clip(((longitudes[selected] - west) * cols).astype(int), 0, cols - 1)
+
+            values = tile[row, col].astype(float)
+            values[values == self.nodata] = numpy.nan
+
+            elevations[selected] = values
+            found[selected] = True
+
+        return elevations, found
+
+    def summarize(self, polygons: list) -> dict:
+        """
+        A method that generates the mean, minimum and maximum elevation of the pixels whose centers are within a list
+        of polygons, each of which is a list of rings of [longitude, latitude] positions. Returns None if any of the
+        tiles that the polygons cover is not on disk. A polygon that is smaller than a pixel is summarized by the
+        pixel at the center of its bounds.
+        """
+        positions = numpy.asarray([position for polygon in polygons for ring in polygon for position in ring], dtype=float)
+        west, south = positions.min(axis=0)
+        east, north = positions.max(axis=0)
+
+        values = []
+
+        # Generate the tiles that the bounds cover, excluding the tiles that only touch its east or north edge
+        for tilewest in range(math.floor(west), max(math.floor(west) + 1, math.ceil(east))):
+            for tilesouth in range(math.floor(south), max(math.floor(south) + 1, math.ceil(north))):
+                tile = self.tile(tilewest, tilesouth)
+                if tile is None:
+                    return None
+
+                rows, cols = tile.shape
+
+                # Generate the window of pixels of the tile that intersect the bounds
+                firstrow = max(0, int((tilesouth + 1 - north) * rows))
+                lastrow = min(rows, int(math.ceil((tilesouth + 1 - south) * rows)))
+                firstcol = max(0, int((west - tilewest) * cols))
+                lastcol = min(cols, int(math.ceil((east - tilewest) * cols)))
+
+                if firstrow >= lastrow or firstcol >= lastcol:
+                    continue
+
+                # Generate the pixel centers of the window and select the pixels within the polygons
+                latitude = tilesouth + 1 - (numpy.arange(firstrow, lastrow) + 0.5) / rows
+                longitude = tilewest + (numpy.arange(firstcol, lastcol) + 0.5) / cols
+                longitude, latitude = numpy.meshgrid(longitude, latitude)
+
+                window = tile[firstrow:lastrow, firstcol:lastcol].astype(float)
+                values.append(window[contains(polygons, longitude, latitude)])
+
+        values = numpy.concatenate(values) if values else numpy.array([])
+        values = values[values != self.nodata]
+
+        if values.size == 0:
+            elevations, found = self.sample([(west + east) / 2], [(south + north) / 2])
+            values = elevations[found & ~numpy.isnan(elevations)]
+
+        if values.size == 0:
+            return {"mean": None, "min": None, "max": None}
+
+        return {"mean": round(float(values.mean()), 3), "min": round(float(values.min()), 3), "max": round(float(values.max()), 3)}
+
+    def stats(self) -> dict:
+        """ A method that returns the counters and the number of open tiles. """
+        with self.lock:
+            return {**self.counters, "open": len(self.tiles)}
+
+def contains(polygons: list, longitudes: numpy.ndarray, latitudes: numpy.ndarray) -> numpy.ndarray:
+    """
+    A function that generates a boolean array of the points that are within any of a list of polygons, each of which
+    is a list of rings of [longitude, latitude] positions. The rings of a polygon are tested with the even-odd rule,
+    so that its holes are excluded, with one vectorized ray crossing test for each edge.
+    """
+    inside = numpy.zeros(longitudes.shape, dtype=bool)
+
+    for polygon in polygons:
+        crossings = numpy.zeros(longitudes.shape, dtype=bool)
+
+        for ring in polygon:
+            for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                if y1 == y2:
+                    continue
+
+                # Toggle the points whose ray to the east crosses the edge
+                crossings ^= ((y1 > latitudes) != (y2 > latitudes)) & (longitudes < (x2 - x1) * (latitudes - y1) / (y2 - y1) + x1)
+
+        inside |= crossings
+
+    return inside
+
+def generate_synthetictile(west: int, south: int, size: int) -> numpy.ndarray:
+    """
+    A function that generates a synthetic DEM tile with the given south west corner and size, whose elevation at a
+    pixel center is 1000 + 500 * sin(longitude) + 300 * cos(latitude) with the coordinates in radians times 10.
+    """
+    latitude = south + 1 - (numpy.arange(size) + 0.5) / size
+    longitude = west + (numpy.arange(size) + 0.5) / size
+    longitude, latitude = numpy.meshgrid(longitude, latitude)
+
+    return (1000 + 500 * numpy.sin(numpy.radians(longitude * 10)) + 300 * numpy.cos(numpy.radians(latitude * 10))).astype(numpy.float32)
+
+if __name__ == '__main__':
+    # Write synthetic DEM tiles to the path for local testing
+    path, names = sys.argv[1], sys.argv[2:]
+    os.makedirs(path, exist_ok=True)
+
+    for name in names:
+        south = int(name[1:3]) * (1 if name[0] == "N" else -1)
+        west = int(name[4:7]) * (1 if name[3] == "E" else -1)
+
+        numpy.save(os.path.join(path, f"{name}.npy"), generate_synthetictile(west, south, int(os.environ.get("DEM_TILESIZE", 3600))))
+        print(f"synthetic tile written. {name}")
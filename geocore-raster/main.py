@@ -5,369 +5,491 @@ Google Cloud Platform - Cloud Run
 
 geocore-raster service
 """
+from __future__ import annotations
+
 import os
-import json
-import datetime
+import math
+import concurrent.futures
 
 import flask
 import flask_restful
 
-import ee
-from terrarium import spatial
-from terrarium import export
-from terrarium import spectral
-from terrarium import initialize
-
-class LogEntry:
+from geocore import logentry
+from geocore import metrics
+from geocore import startup
+from geocore.session import session, Health
+
+import sceneclass
+from pipeline import EXPORT_FIELDS, REQUIRED, Memo, Pipeline, PipelineError
+from registry import ExportRegistry, MemoryBackend, SQLiteBackend
+from tracker import MemoryPublisher, PubSubPublisher, TaskTracker, generate_operationstatuses
+from storage import CloudStorage, LocalStorage
+from demstore import DEMStore
+
+# Import Earth Engine lazily, it is only required by the image endpoints
+ee = startup.lazyimport("ee")
+
+# The Sentinel-2 bands that can be composited into a false color image
+FALSECOLOR_BANDS = ("B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B8A", "B9", "B11", "B12")
+# The reflectance that is stretched to the maximum of the false color composites
+FALSECOLOR_MAXIMUM = float(os.environ.get("FALSECOLOR_MAXIMUM", 3000))
+# The Sentinel-2 bands of the normalized difference spectral indices and the true color composite
+SPECTRAL_INDICES = {"NDVI": ["B8", "B4"], "NDWI": ["B3", "B8"], "NDMI": ["B8", "B11"], "NBR": ["B8", "B12"]}
+TRUECOLOR_BANDS = ["B4", "B3", "B2"]
+
+class LogEntry(logentry.LogEntry):
     """ A class that represents a serverless log compliant with Google Cloud Platform. """
 
     service = "geocore-raster"
 
-    def __init__(self, workflow: str) -> None:
-        """ Initialization Method """
-        self.workflow: str = workflow
-        self.logtrace: list = [f"execution started. worflow - {workflow}."]
-
-        self.baselog = {
-            "trace": self.logtrace, 
-            "service":self.service
-        }
-
-        project = os.environ.get('GCP_PROJECT')
-        reqtrace = flask.request.headers.get('X-Cloud-Trace-Context')
-
-        if reqtrace and project:
-            tracedata = f"projects/{project}/traces/{reqtrace.split('/')[0]}"
-            self.baselog.update({"logging.googleapis.com/trace": tracedata})
+class FalseColor(flask_restful.Resource):
 
-    def addtrace(self, trace: str):
-        """ A method that adds a trace string to the list of logtraces. """
-        self.logtrace.append(trace)
+    def post(self):
+        """ The runtime for when the '/falsecolor' endpoint recieves a POST request """
+        # Create a Pipeline for the falsecolor workflow
+        pipeline = generate_pipeline("falsecolor")
 
-    def flush(self, severity: str, message: str):
-        """
-        A method of LogEntry that creates and flushes the built log to Cloud Logging as
-        a structured log given that it is called within a Cloud Run/Functions Service.
-        The method accepts a log severity string and a log message string.
+        try:
+            # Retrieve and check the request parameters and the optional 'bands' key
+            params = pipeline.validate(flask.request.get_json(), (*EXPORT_FIELDS, (
+                "bands", lambda value: is_bandtriple(value) or (
+                    isinstance(value, list) and value and all(is_bandtriple(item) for item in value)
+                ), "must be a list of 3 Sentinel-2 bands or a list of such lists", ["B8", "B4", "B3"]
+            )))
 
-        Accepted log severity values are - EMERGENCY, ALERT, CRITICAL, ERROR, WARNING, NOTICE, INFO, DEBUG and DEFAULT.
-        Refer to https://cloud.google.com/logging/docs/reference/v2/rest/v2/LogEntry#logseverity for more information.
-        """
-        self.addtrace("execution ended.")
-        logentry = dict(severity=severity, message=message)
-        logentry.update(self.baselog)
+            # Generate the mapping of export names to the band triples they composite
+            triples = [params["bands"]] if is_bandtriple(params["bands"]) else params["bands"]
+            composites = {f"FCC-{'-'.join(triple).upper()}": [band.upper() for band in triple] for triple in triples}
 
-        print(json.dumps(logentry))
+            # Start an export for each composite, sharing the source image between them
+            tasks = pipeline.export({
+                name: (lambda name=name, bands=bands: pipeline.image(name, lambda: generate_falsecolorimage(pipeline.source(), bands)))
+                for name, bands in composites.items()
+            })
 
-class FalseColor(flask_restful.Resource):
+        except PipelineError as e:
+            # Return the error response
+            return e.body, e.status
 
-    def post(self):
-        """ The runtime for when the '/falsecolor' endpoint recieves a POST request """
-        logger = LogEntry("falsecolor")
+        # Return the completion response for a single composite or the mapping of composites to their tasks
+        if is_bandtriple(params["bands"]):
+            return pipeline.respond(tasks, next(iter(composites)))
 
-        request = flask.request.get_json()
-        logger.flush("INFO", f"{request}")
-
-        return f"complete", 200
+        return pipeline.respond(tasks)
 
 class TrueColor(flask_restful.Resource):
 
     def post(self):
         """ The runtime for when the '/truecolor' endpoint recieves a POST request """
-        # Create a LogEntry object for the truecolor workflow
-        log = LogEntry("truecolor")
-
-        # Parse the request JSON
-        request = flask.request.get_json()
-        log.addtrace("request parsed.")
+        # Create a Pipeline for the truecolor workflow
+        pipeline = generate_pipeline("truecolor", tiled=True)
 
         try:
-            # Retrieve the 'bounds', 'timestamp', 'prefix' and 'bucket' keys from the request
-            bounds = request["bounds"]
-            timestamp = request["timestamp"]
-            bucket = request["bucket"]
-            prefix = request["prefix"]
-
-            # Check that bounds is a list.
-            if not isinstance(bounds, list):
-                # log and return the error
-                log.addtrace("invalid bounds.")
-                log.flush("ERROR", "runtime terminated")
-                return {"error": f"truecolor generation failed. invalid bounds. must be a list."}, 400
-
-            log.addtrace(f"bounds - {bounds}.")
-
-            # Check that timestamp is an str.
-            if not isinstance(timestamp, str):
-                # log and return the error
-                log.addtrace("invalid timestamp.")
-                log.flush("ERROR", "runtime terminated")
-                return {"error": f"truecolor generation failed. invalid timestamp. must be an str."}, 400
-
-            log.addtrace(f"timestamp - {timestamp}.")
-
-            # Check that bucket is an str.
-            if not isinstance(bucket, str):
-                # log and return the error
-                log.addtrace("invalid bucket.")
-                log.flush("ERROR", "runtime terminated")
-                return {"error": f"truecolor generation failed. invalid bucket. must be an str."}, 400
-
-            log.addtrace(f"bucket - {bucket}.")
-
-            # Check that prefix is an str.
-            if not isinstance(prefix, str):
-                # log and return the error
-                log.addtrace("invalid prefix.")
-                log.flush("ERROR", "runtime terminated")
-                return {"error": f"truecolor generation failed. invalid prefix. must be an str."}, 400
+            # Retrieve and check the request parameters
+            pipeline.validate(flask.request.get_json(), EXPORT_FIELDS)
 
-            log.addtrace(f"prefix - {prefix}.")
+            # Start the TCI image export
+            tasks = pipeline.export({
+                "TCI": lambda: pipeline.image("TCI", lambda: generate_spectralimage(pipeline.source(), "TCI"))
+            })
 
-        except KeyError as e:
-            # log and return the error
-            log.addtrace(f"missing request parameter {e}.")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"truecolor generation failed. missing request parameter. {e}"}, 400
+        except PipelineError as e:
+            # Return the error response
+            return e.body, e.status
 
-        log.addtrace(f"request parameters retrieved.")
+        # Return the completion response
+        return pipeline.respond(tasks, "TCI")
 
-        try:
-            # Initialize Earth Engine Session
-            initialize(os.environ.get("GCP_PROJECT")) if not ee.data._initialized else None
+class Spectral(flask_restful.Resource):
 
-        except Exception as e:
-            # log and return the error
-            log.addtrace(f"{e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"truecolor generation failed. {e}"}, 500
+    def post(self):
+        """ 
+        The runtime for when the '/spectral' endpoint recieves a POST request. If a list of indices is requested,
+        the spectral images for all the indices are generated from a single shared source image. In the
+        'multiband' mode, they are stacked into a single multi-band image with one export task, while in
+        the 'separate' mode, an export task is started for each index in parallel.
+        """
+        # Create a Pipeline for the spectral workflow
+        pipeline = generate_pipeline("spectral", tiled=True)
 
         try:
-            # Generate an Earth Engine Geometry from the bounds
-            geometry = spatial.generate_earthenginegeometry_frombounds(*bounds)
+            # Retrieve and check the request parameters and the 'index' and optional 'mode' keys
+            params = pipeline.validate(flask.request.get_json(), (
+                *EXPORT_FIELDS,
+                ("index", lambda value: isinstance(value, str) or (
+                    isinstance(value, list) and value and all(isinstance(item, str) for item in value)
+                ), "must be an str or a list of str", REQUIRED),
+                ("mode", lambda value: value in ("multiband", "separate"), "must be 'multiband' or 'separate'", "multiband"),
+            ))
+
+            index = params["index"]
+
+            def generate(index: str) -> ee.Image:
+                """ A function that generates the spectral image of an index from the shared source image of the request. """
+                return pipeline.image(index, lambda: generate_spectralimage(pipeline.source(), index))
+
+            if isinstance(index, str):
+                # Start the spectral image export
+                tasks = pipeline.export({index: lambda: generate(index)})
+
+            else:
+                # Remove the duplicate indices while preserving the order
+                indices = list(dict.fromkeys(item.upper() for item in index))
+
+                # Generate the mapping of export names to the indices they contain
+                if params["mode"] == "multiband":
+                    exports = {"-".join(indices): indices}
+                else:
+                    exports = {item: [item] for item in indices}
+
+                # Start the exports, generating the image of each index once
+                tasks = pipeline.export({
+                    name: (lambda items=items: generate_stackedimage(items, {item: generate(item) for item in items}))
+                    for name, items in exports.items()
+                })
+
+        except PipelineError as e:
+            # Return the error response
+            return e.body, e.status
+
+        # Return the completion response for a single index or the mapping of export names to their tasks
+        if isinstance(index, str):
+            return pipeline.respond(tasks, index)
+
+        return pipeline.respond(tasks)
 
-            # Obtain the datetime from the timestamp
-            date = datetime.datetime.fromisoformat(timestamp)
-
-        except RuntimeError as e:
-            # log and return the error
-            log.addtrace(f"could not generate geometry from bounds. {e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"truecolor generation failed. could not generate geometry from bounds. {e}"}, 400
-
-        except Exception as e:
-            # log and return the error
-            log.addtrace(f"could not generate date from timestamp. {e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"truecolor generation failed. could not generate date from timestamp. {e}"}, 400
+class SceneClassification(flask_restful.Resource):
 
-        log.addtrace(f"image parameters generated.")
+    def post(self):
+        """ 
+        The runtime for when the '/scl' endpoint recieves a POST request. The scene classification image is exported
+        while the area of each of its summary classes is computed with a single grouped reduction, so that the summary
+        is returned synchronously along with the export task.
+        """
+        # Create a Pipeline for the scl workflow
+        pipeline = generate_pipeline("scl")
 
         try:
-            # Generate the TCI image
-            image = spectral.generate_spectral_image(date, geometry, "TCI")
-
-        except Exception as e:
-            # log and return the error
-            log.addtrace(f"could not generate image. {e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"truecolor generation failed. could not generate image. {e}"}, 400
+            # Retrieve and check the request parameters
+            pipeline.validate(flask.request.get_json(), EXPORT_FIELDS)
 
-        log.addtrace(f"truecolor image generated.")
+            # Generate the scene classification image
+            image = pipeline.image("SCL", lambda: sceneclass.generate_image(pipeline.source()))
+            geometry = pipeline.geometry()
 
-        try:
-            # Append the tci asset id to the prefix
-            prefix = f"{prefix}/tci"
+            # Compute the class areas while the export is resolved and started
+            summary = summaries.submit(lambda: sceneclass.generate_classareas(image, geometry).getInfo())
 
-            # Generate an Earth Engine Export Task for the image
-            exporttask = export.export_image(image, bucket, prefix)
-            # Start the task
-            exporttask.start()
+            # Start the scene classification image export
+            tasks = pipeline.export({"SCL": lambda: image})
 
-        except Exception as e:
-            # log and return the error
-            log.addtrace(f"could not start export. {e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"truecolor generation failed. could not start export. {e}"}, 500
+            try:
+                # Retrieve the class areas of the image
+                classes = sceneclass.format_classareas(summary.result())
 
-        # log the task id
-        log.addtrace(f"image export started. export-task - {exporttask.id}")
+            except Exception as e:
+                pipeline.fail(500, "could not summarize scene classes. {}", e, **{pipeline.resultkey(True): tasks["SCL"]})
 
-        # Initialize PubSub client
-        # Compose the task creation PubSub message
-        # Publish the message the the 'taskstatus' PubSub topic
+        except PipelineError as e:
+            # Return the error response
+            return e.body, e.status
 
-        #log.addtrace(f"export task registered.")
-        log.flush("INFO", "runtime complete")
+        pipeline.log.addtrace("scene classes summarized.")
 
-        # Return the completion response
-        return {"completed": True, "export-task": exporttask.id}, 200
+        # Return the completion response with the class summary
+        return pipeline.respond(tasks, "SCL", classes=classes)
 
-class Spectral(flask_restful.Resource):
+class Altitude(flask_restful.Resource):
+    """ RESTful resource for the '/altitude' endpoint. """
 
     def post(self):
-        """ The runtime for when the '/spectral' endpoint recieves a POST request """
-        # Create a LogEntry object for the spectral workflow
-        log = LogEntry("spectral")
+        """ RESTful POST """
+        # Create a LogEntry object for the altitude workflow
+        log = LogEntry("altitude")
 
         # Parse the request JSON
         request = flask.request.get_json()
         log.addtrace("request parsed.")
 
+        # Check if the request is for a polygon and summarize its elevations
+        if isinstance(request, dict) and "geojson" in request:
+            return self.post_polygon(log, request["geojson"])
+
         try:
-            # Retrieve the 'bounds', 'timestamp', 'prefix', 
-            # 'bucket' and 'index' keys from the request
-            bounds = request["bounds"]
-            timestamp = request["timestamp"]
-            bucket = request["bucket"]
-            prefix = request["prefix"]
-            index = request["index"]
-
-            # Check that bounds is a list.
-            if not isinstance(bounds, list):
+            # Retrieve the 'coordinates' key from the request
+            coordinates = request["coordinates"]
+
+            # Check that coordinates is a non-empty list of dictionaries with numeric longitude and latitude keys.
+            if not isinstance(coordinates, list) or not coordinates or not all(
+                isinstance(pair, dict) and all(
+                    isinstance(pair.get(key), (int, float)) and not isinstance(pair.get(key), bool) for key in ("longitude", "latitude")
+                ) for pair in coordinates
+            ):
                 # log and return the error
-                log.addtrace("invalid bounds.")
+                log.addtrace("invalid coordinates.")
                 log.flush("ERROR", "runtime terminated")
-                return {"error": f"spectral generation failed. invalid bounds. must be a list."}, 400
+                return {"error": f"altitude generation failed. invalid coordinates. must be a non-empty list of dictionaries with longitude and latitude."}, 400
 
-            log.addtrace(f"bounds - {bounds}.")
+            log.addtrace("coordinate count - {}.", len(coordinates))
 
-            # Check that timestamp is an str.
-            if not isinstance(timestamp, str):
-                # log and return the error
-                log.addtrace("invalid timestamp.")
-                log.flush("ERROR", "runtime terminated")
-                return {"error": f"spectral generation failed. invalid timestamp. must be an str."}, 400
+        except (KeyError, TypeError) as e:
+            # log and return the error
+            log.addtrace("missing request parameter {}.", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"altitude generation failed. missing request parameter. {e}"}, 400
 
-            log.addtrace(f"timestamp - {timestamp}.")
+        log.addtrace("request parameters retrieved.")
 
-            # Check that bucket is an str.
-            if not isinstance(bucket, str):
-                # log and return the error
-                log.addtrace("invalid bucket.")
-                log.flush("ERROR", "runtime terminated")
-                return {"error": f"spectral generation failed. invalid bucket. must be an str."}, 400
+        # Sample the elevations of the points from the local DEM tiles
+        elevations, found = demstore.sample([pair["longitude"] for pair in coordinates], [pair["latitude"] for pair in coordinates])
+        altitudes = [None if value != value else round(value, 3) for value in elevations.tolist()]
 
-            log.addtrace(f"bucket - {bucket}.")
+        log.addtrace("local dem sampled. found - {}.", int(found.sum()))
 
-            # Check that prefix is an str.
-            if not isinstance(prefix, str):
-                # log and return the error
-                log.addtrace("invalid prefix.")
-                log.flush("ERROR", "runtime terminated")
-                return {"error": f"spectral generation failed. invalid prefix. must be an str."}, 400
+        # Retrieve the positions of the points whose tiles are not on disk
+        missing = [position for position, local in enumerate(found.tolist()) if not local]
 
-            log.addtrace(f"prefix - {prefix}.")
+        if missing:
+            try:
+                # Ensure that the Earth Engine Session is initialized
+                session.ensure()
 
-            # Check that index is a list.
-            if not isinstance(index, str):
+                # Sample the elevations of the remaining points from Earth Engine in a single request
+                sampled = generate_pointaltitudes([coordinates[position] for position in missing])
+                for position, value in zip(missing, sampled):
+                    altitudes[position] = value
+
+            except Exception as e:
                 # log and return the error
-                log.addtrace("invalid index.")
+                log.addtrace("could not sample earth engine dem. {}", e)
                 log.flush("ERROR", "runtime terminated")
-                return {"error": f"spectral generation failed. invalid index. must be an str."}, 400
-
-            log.addtrace(f"index - {index}.")
-
-        except KeyError as e:
-            # log and return the error
-            log.addtrace(f"missing request parameter {e}.")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"spectral generation failed. missing request parameter. {e}"}, 400
+                return {"error": f"altitude generation failed. could not sample earth engine dem. {e}"}, 500
 
-        log.addtrace(f"request parameters retrieved.")
+            log.addtrace("earth engine dem sampled. points - {}.", len(missing))
 
-        try:
-            # Initialize Earth Engine Session
-            initialize(os.environ.get("GCP_PROJECT")) if not ee.data._initialized else None
-
-        except Exception as e:
-            # log and return the error
-            log.addtrace(f"{e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"spectral generation failed. {e}"}, 500
-
-        try:
-            # Generate an Earth Engine Geometry from the bounds
-            geometry = spatial.generate_earthenginegeometry_frombounds(*bounds)
+        log.flush("INFO", "runtime complete")
 
-            # Obtain the datetime from the timestamp
-            date = datetime.datetime.fromisoformat(timestamp)
+        # Return the altitude response
+        return {"altitudes": altitudes}, 200
 
-        except RuntimeError as e:
-            # log and return the error
-            log.addtrace(f"could not generate geometry from bounds. {e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"spectral generation failed. could not generate geometry from bounds. {e}"}, 400
+    def post_polygon(self, log: LogEntry, geojson: dict):
+        """
+        The runtime for when the '/altitude' endpoint recieves a POST request with a polygon GeoJSON geometry or feature.
+        The elevations of the polygon are summarized from the local DEM tiles if they are all on disk and from Earth Engine otherwise.
+        """
+        # Retrieve the geometry of a feature
+        geometry = geojson.get("geometry") if isinstance(geojson, dict) and geojson.get("type") == "Feature" else geojson
 
-        except Exception as e:
+        # Check that geometry is a polygon geometry with rings of numeric positions.
+        if not isinstance(geometry, dict) or geometry.get("type") not in ("Polygon", "MultiPolygon") or not is_polygons(
+            [geometry.get("coordinates")] if geometry.get("type") == "Polygon" else geometry.get("coordinates")
+        ):
             # log and return the error
-            log.addtrace(f"could not generate date from timestamp. {e}")
+            log.addtrace("invalid geojson.")
             log.flush("ERROR", "runtime terminated")
-            return {"error": f"spectral generation failed. could not generate date from timestamp. {e}"}, 400
+            return {"error": f"altitude generation failed. invalid geojson. must be a Polygon or MultiPolygon."}, 400
 
-        log.addtrace(f"image parameters generated.")
+        # Generate the list of polygons with the [longitude, latitude] of their positions
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        polygons = [[[position[:2] for position in ring] for ring in polygon] for polygon in polygons]
+        log.addtrace("request parameters retrieved.")
 
         try:
-            # Generate the spectral image
-            image = spectral.generate_spectral_image(date, geometry, index)
+            # Summarize the elevations of the polygon from the local DEM tiles
+            altitude = demstore.summarize(polygons)
 
         except Exception as e:
             # log and return the error
-            log.addtrace(f"could not generate image. {e}")
+            log.addtrace("could not summarize local dem. {}", e)
             log.flush("ERROR", "runtime terminated")
-            return {"error": f"spectral generation failed. could not generate image. {e}"}, 400
+            return {"error": f"altitude generation failed. could not summarize local dem. {e}"}, 500
 
-        log.addtrace(f"{index} image generated.")
+        if altitude is None:
+            log.addtrace("local dem tiles missing.")
 
-        try:
-            # Append the tci asset id to the prefix
-            prefix = f"{prefix}/{index.lower()}"
+            try:
+                # Ensure that the Earth Engine Session is initialized
+                session.ensure()
 
-            # Generate an Earth Engine Export Task for the image
-            exporttask = export.export_image(image, bucket, prefix)
-            # Start the task
-            exporttask.start()
+                # Summarize the elevations of the polygon from Earth Engine
+                altitude = generate_polygonaltitude(geometry)
 
-        except Exception as e:
-            # log and return the error
-            log.addtrace(f"could not start export. {e}")
-            log.flush("ERROR", "runtime terminated")
-            return {"error": f"spectral generation failed. could not start export. {e}"}, 500
-
-        # log the task id
-        log.addtrace(f"image export started. export-task - {exporttask.id}")
-
-        # Initialize PubSub client
-        # Compose the task creation PubSub message
-        # Publish the message the the 'taskstatus' PubSub topic
+            except Exception as e:
+                # log and return the error
+                log.addtrace("could not summarize earth engine dem. {}", e)
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"altitude generation failed. could not summarize earth engine dem. {e}"}, 500
 
-        #log.addtrace(f"export task registered.")
+        log.addtrace("altitude summarized. altitude - {}.", altitude)
         log.flush("INFO", "runtime complete")
 
-        # Return the completion response
-        return {"completed": True, "export-task": exporttask.id}, 200
-
-class SceneClassification(flask_restful.Resource):
-
-    def post(self):
-        """ The runtime for when the '/scl' endpoint recieves a POST request """
-        logger = LogEntry("scl")
-
-        request = flask.request.get_json()
-        logger.flush("INFO", f"{request}")
-
-        return f"complete", 200
-
-class Altitude(flask_restful.Resource):
-
-    def post(self):
-        """ The runtime for when the '/altitude' endpoint recieves a POST request """
-        logger = LogEntry("altitude")
-
-        request = flask.request.get_json()
-        logger.flush("INFO", f"{request}")
-
-        return f"complete", 200
+        # Return the altitude response
+        return {"altitude": altitude}, 200
+
+def generate_pointaltitudes(coordinates: list) -> list:
+    """ A function that samples the elevations of a list of coordinate pairs from the Earth Engine DEM in a single request. """
+    # Create a FeatureCollection of the points tagged with their positions
+    points = ee.FeatureCollection([
+        ee.Feature(ee.Geometry.Point([pair["longitude"], pair["latitude"]]), {"position": position})
+        for position, pair in enumerate(coordinates)
+    ])
+
+    dem = ee.Image(os.environ.get("DEM_ASSET", "USGS/SRTMGL1_003")).select(0).rename("altitude")
+    sampled = dem.reduceRegions(collection=points, reducer=ee.Reducer.first(), scale=30).getInfo()
+
+    altitudes = [None] * len(coordinates)
+    for feature in sampled["features"]:
+        value = feature["properties"].get("first")
+        altitudes[int(feature["properties"]["position"])] = round(value, 3) if value is not None else None
+
+    return altitudes
+
+def generate_polygonaltitude(geometry: dict) -> dict:
+    """ A function that summarizes the mean, minimum and maximum elevation of a polygon GeoJSON geometry from the Earth Engine DEM. """
+    dem = ee.Image(os.environ.get("DEM_ASSET", "USGS/SRTMGL1_003")).select(0).rename("altitude")
+
+    reduced = dem.reduceRegion(
+        reducer=ee.Reducer.mean().combine(ee.Reducer.minMax(), sharedInputs=True),
+        geometry=ee.Geometry(geometry), scale=30, maxPixels=1e9
+    ).getInfo()
+
+    return {
+        statistic: round(reduced[f"altitude_{statistic}"], 3) if reduced.get(f"altitude_{statistic}") is not None else None
+        for statistic in ("mean", "min", "max")
+    }
+
+def generate_pipeline(workflow: str, tiled: bool = False) -> Pipeline:
+    """
+    A function that generates the Pipeline for a run of an export workflow with the shared memo, export registry, task tracker
+    and storage. The exports of large regions are split into tiles if 'tiled' is set.
+    """
+    # A download holds the whole NPY response in memory while the compressed tiles are spooled to temporary files under
+    # TMPDIR, which is an in-memory filesystem on Cloud Run. The peak memory of a download is up to about 2.5 times the raw
+    # size of its pixels, DOWNLOAD_MAXPIXELS times the bytes per pixel of all its bands, which must fit the instance memory.
+    return Pipeline(
+        LogEntry(workflow), workflow, memo=memo, registry=registry, tracker=tracker, storage=storage,
+        maxpixels=int(os.environ.get("DOWNLOAD_MAXPIXELS", 0)), tilepixels=int(os.environ.get("EXPORT_TILEPIXELS", 100000000)) if tiled else None
+    )
+
+def is_bandtriple(value) -> bool:
+    """ A function that checks if a value is a list of 3 Sentinel-2 band names. """
+    return isinstance(value, list) and len(value) == 3 and all(isinstance(band, str) and band.upper() in FALSECOLOR_BANDS for band in value)
+
+def is_polygons(value) -> bool:
+    """ A function that checks if a value is a non-empty list of polygons, each a non-empty list of non-empty rings of numeric positions. """
+    return isinstance(value, list) and bool(value) and all(
+        isinstance(polygon, list) and polygon and all(
+            isinstance(ring, list) and ring and all(
+                isinstance(position, list) and len(position) >= 2 and all(
+                    isinstance(number, (int, float)) and not isinstance(number, bool) and math.isfinite(number) for number in position
+                ) for position in ring
+            ) for ring in polygon
+        ) for polygon in value
+    )
+
+def generate_falsecolorimage(source: ee.Image, bands: list) -> ee.Image:
+    """ A function that generates the 8-bit RGB false color composite of a triple of bands of a Sentinel-2 source image. """
+    return source.visualize(bands=bands, min=0, max=FALSECOLOR_MAXIMUM)
+
+def generate_spectralimage(source: ee.Image, index: str) -> ee.Image:
+    """
+    A function that generates the spectral image of an index from a Sentinel-2 source image. The TCI is the 8-bit
+    true color composite while the other indices are single band normalized differences named after the index.
+    Raises a ValueError if the index is not supported.
+    """
+    index = index.upper()
+    if index == "TCI":
+        return generate_falsecolorimage(source, TRUECOLOR_BANDS)
+
+    if index in SPECTRAL_INDICES:
+        return source.normalizedDifference(SPECTRAL_INDICES[index]).rename(index)
+
+    raise ValueError(f"unsupported index. must be one of TCI, {', '.join(SPECTRAL_INDICES)}")
+
+def generate_stackedimage(indices: list, images: dict) -> ee.Image:
+    """
+    A function that generates the image to export for a list of indices from a mapping of indices to their
+    spectral images. A single index is exported as is, while multiple indices are stacked into a single 
+    float image with each band name prefixed by its index.
+    """
+    if len(indices) == 1:
+        return images[indices[0]]
+
+    return ee.Image.cat([
+        images[index].toFloat().rename(images[index].bandNames().map(lambda band: ee.String(f"{index}_").cat(band)))
+        for index in indices
+    ])
+
+class Tasks(flask_restful.Resource):
+    """ RESTful resource for the '/tasks' endpoint. """
+
+    def get(self):
+        """ RESTful GET """
+        # Retrieve the optional comma separated 'ids' query parameter
+        ids = flask.request.args.get("ids")
+        tasks = tracker.tasks()
+
+        if ids:
+            # Select the requested tasks, marking the untracked tasks as unknown
+            tasks = {task: tasks.get(task, {"state": "UNKNOWN"}) for task in ids.split(",")}
+
+        # Return the tracked tasks and the tracker counters
+        return {"tasks": tasks, "tracker": tracker.stats()}, 200
+
+def generate_taskstate(task: str) -> str:
+    """ 
+    A function that retrieves the state of an Earth Engine task from its task ID. 
+    The state known to the task tracker is used if the task is tracked.
+    """
+    return tracker.state(task) or ee.data.getTaskStatus(task)[0]["state"]
+
+def generate_taskstatuses(tasks: list) -> list:
+    """
+    A function that retrieves the statuses of a list of Earth Engine tasks with a single listing of the operations of
+    the project, filtered to the tasks, since 'ee.data.getTaskStatus' requests the operation of each task separately.
+    """
+    # Ensure that the Earth Engine Session is initialized, the task tracker polls outside of a request
+    session.ensure()
+    return generate_operationstatuses(ee.data.listOperations(), tasks)
+
+# Create the export task tracker for the service
+tracker = TaskTracker(
+    status=generate_taskstatuses,
+    publisher=PubSubPublisher(os.environ.get("GCP_PROJECT"), os.environ["TASKS_TOPIC"]) if os.environ.get("TASKS_TOPIC") else MemoryPublisher(),
+    interval=float(os.environ.get("TASKS_INTERVAL", 30))
+)
+# Expose the export task tracker counters as metrics
+metrics.registry.register("geocore_tasktracker", LogEntry.service, tracker.stats)
+
+# Create the export registry for the service
+registry = ExportRegistry(
+    backend=SQLiteBackend(os.environ["EXPORT_REGISTRY_PATH"]) if os.environ.get("EXPORT_REGISTRY_PATH") else MemoryBackend(),
+    status=generate_taskstate,
+    ttl=float(os.environ.get("EXPORT_REGISTRY_TTL", 86400))
+)
+
+# Create the object storage for the downloaded images, a local filesystem stand-in for Cloud Storage if a path is set
+storage = LocalStorage(os.environ["STORAGE_PATH"]) if os.environ.get("STORAGE_PATH") else CloudStorage()
+
+# Create the memo of the pipeline stages shared across requests
+memo = Memo(ttl=float(os.environ.get("PIPELINE_MEMO_TTL", 3600)), maxsize=int(os.environ.get("PIPELINE_MEMO_MAXSIZE", 1024)))
+# Expose the pipeline memo counters as metrics
+metrics.registry.register("geocore_pipelinememo", LogEntry.service, memo.stats)
+
+# Create the executor for the scene class summaries that are computed alongside their exports
+summaries = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.environ.get("SCL_WORKERS", 4)))
+
+# Create the local dem tile store for the service
+demstore = DEMStore(
+    path=os.environ.get("DEM_PATH"),
+    maxtiles=int(os.environ.get("DEM_MAXTILES", 64)),
+    nodata=float(os.environ.get("DEM_NODATA", -32768))
+)
+# Expose the local dem tile store counters as metrics
+metrics.registry.register("geocore_demstore", LogEntry.service, demstore.stats)
+
+# Expose the earth engine session counters as metrics
+metrics.registry.register("geocore_session", LogEntry.service, session.stats)
 
 app = flask.Flask(__name__)
 api = flask_restful.Api(app)
@@ -377,10 +499,14 @@ api.add_resource(FalseColor, '/falsecolor')
 api.add_resource(Spectral, '/spectral')
 api.add_resource(Altitude, '/altitude')
 api.add_resource(SceneClassification, '/scl')
+api.add_resource(Tasks, '/tasks')
+api.add_resource(metrics.Metrics, '/metrics')
+api.add_resource(Health, '/health')
 
 if __name__ == '__main__':
-    # Initialize Earth Engine Session
-    initialize(os.environ.get("GCP_PROJECT")) if not ee.data._initialized else None
+    # Initialize Earth Engine Session and report the startup times
+    startup.initialize_earthengine()
+    startup.report(LogEntry.service)
 
     # Run the Flask App
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
@@ -0,0 +1,534 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-raster service - export pipeline
+"""
+from __future__ import annotations
+
+import io
+import json
+import math
+import time
+import datetime
+import threading
+import collections
+import concurrent.futures
+
+import numpy
+
+from geocore import startup
+from geocore.session import session
+
+import cogwriter
+
+# Import Earth Engine and Terrarium lazily, they are only required once the session is initialized
+ee = startup.lazyimport("ee")
+spatial = startup.lazyimport("terrarium.spatial")
+export = startup.lazyimport("terrarium.export")
+
+# The maximum number of export tasks that are started in parallel for a request
+MAX_STARTS = 16
+
+# The CRS and the scale in meters of the images exported by Terrarium, which the downloads are gridded on
+EXPORT_CRS = "EPSG:4326"
+EXPORT_SCALE = 10
+
+# The length in meters of a degree at the equator, which Earth Engine uses to convert a scale in meters to degrees
+DEGREE_METERS = 111319.49079327357
+
+# The sentinel default of a required request field
+REQUIRED = object()
+
+# The request fields of every export workflow, as (name, check, requirement, default) tuples
+EXPORT_FIELDS = (
+    ("bounds", lambda value: isinstance(value, list), "must be a list", REQUIRED),
+    ("timestamp", lambda value: isinstance(value, str), "must be an str", REQUIRED),
+    ("bucket", lambda value: isinstance(value, str), "must be an str", REQUIRED),
+    ("prefix", lambda value: isinstance(value, str), "must be an str", REQUIRED),
+)
+
+class PipelineError(Exception):
+    """ An exception raised when a pipeline stage fails, carrying the error response body and status. """
+
+    def __init__(self, body: dict, status: int) -> None:
+        """ Initialization Method """
+        super().__init__(body["error"])
+        self.body: dict = body
+        self.status: int = status
+
+class Memo:
+    """
+    A class that represents a memo of the values generated by the pipeline stages, shared across requests.
+
+    Values are held in an LRU of up to 'maxsize' entries and regenerated once they are older than 'ttl'
+    seconds, so that a source image lookup picks up the acquisitions that are ingested later. Values are
+    generated outside the lock, so concurrent misses for the same key may each generate the value.
+    """
+
+    def __init__(self, ttl: float, maxsize: int) -> None:
+        """ Initialization Method """
+        self.ttl: float = ttl
+        self.maxsize: int = maxsize
+
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str, generate):
+        """ A method that returns the memoized value for a key, generating it with the 'generate' callable if it is not memoized. """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[0]
+
+            if entry is not None:
+                del self.entries[key]
+
+            self.counters["misses"] += 1
+
+        value = generate()
+
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+
+            # Evict the least recently used values beyond the maximum size
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+        return value
+
+    def stats(self) -> dict:
+        """ A method that returns the counters and the size of the memo. """
+        with self.lock:
+            return {**self.counters, "size": len(self.entries)}
+
+class Pipeline:
+    """
+    A class that represents the run of a raster export workflow for a request through the stages
+    validate -> geometry -> image -> export.
+
+    Each stage logs its trace to 'log' and raises a PipelineError with the error response of the
+    workflow when it fails. The geometry, date, source image and images of a request are generated
+    once and memoized for the request and in 'memo' for the following requests with the same bounds
+    and timestamp. The exports are deduplicated against 'registry' and tracked with 'tracker'.
+
+    The exports of a region that is at most 'maxpixels' pixels on the export grid are downloaded in the request
+    instead and written as Cloud-Optimized GeoTIFFs to 'storage', bypassing the batch queue, which is disabled
+    when 'maxpixels' is 0. The downloads are deduplicated against 'registry' like the exports. The exports of
+    a region that is more than 'tilepixels' pixels on the export grid are split into a grid of tile exports,
+    which is disabled when 'tilepixels' is None.
+    """
+
+    def __init__(self, log, workflow: str, memo: Memo, registry, tracker, storage, maxpixels: int, tilepixels: int = None) -> None:
+        """ Initialization Method """
+        self.log = log
+        self.workflow: str = workflow
+        self.memo: Memo = memo
+        self.registry = registry
+        self.tracker = tracker
+        self.storage = storage
+        self.maxpixels: int = maxpixels
+        self.tilepixels: int = tilepixels
+
+        self.downloaded: bool = False
+        self.tiled: bool = False
+        self.manifests: dict = {}
+        self.params: dict = {}
+        self.memoized: dict = {}
+
+    def fail(self, status: int, trace: str, *args, **extra):
+        """ A method that logs a failed stage and raises the PipelineError with the error response of the workflow. """
+        self.log.addtrace(trace, *args)
+        self.log.flush("ERROR", "runtime terminated")
+
+        raise PipelineError({"error": f"{self.workflow} generation failed. {trace.format(*args)}", **extra}, status)
+
+    def complete(self, body: dict) -> tuple:
+        """ A method that logs the completed run and returns the completion response. """
+        self.log.flush("INFO", "runtime complete")
+        return body, 200
+
+    def resultkey(self, single: bool) -> str:
+        """ A method that returns the response key of the export results, the export tasks or the downloaded objects. """
+        if self.downloaded:
+            return "object" if single else "objects"
+
+        # The tile task IDs of an export are always a list
+        return "export-task" if single and not self.tiled else "export-tasks"
+
+    def respond(self, results: dict, name: str = None, **extra) -> tuple:
+        """
+        A method that logs the completed run and returns the completion response with the export results of a single
+        export name, or of all the export names if no name is given, along with the manifests of a tiled region.
+        """
+        body = {"completed": True, self.resultkey(name is not None): results[name] if name is not None else results}
+
+        if self.tiled:
+            body["manifest" if name is not None else "manifests"] = self.manifests[name] if name is not None else self.manifests
+
+        return self.complete({**body, **extra})
+
+    def validate(self, request: dict, fields: tuple) -> dict:
+        """
+        The validate stage. Retrieves the request fields, given as (name, check, requirement, default) tuples, from
+        the request and checks them, then ensures that the Earth Engine session is initialized. Returns the fields.
+        """
+        self.log.addtrace("request parsed.")
+
+        try:
+            for name, check, requirement, default in fields:
+                # Retrieve the field from the request
+                value = request[name] if default is REQUIRED else request.get(name, default)
+
+                # Check that the field meets its requirement.
+                if not check(value):
+                    self.fail(400, "invalid {}. {}.", name, requirement)
+
+                self.log.addtrace("{} - {}.", name, value)
+                self.params[name] = value
+
+        except (KeyError, TypeError) as e:
+            self.fail(400, "missing request parameter. {}", e)
+
+        self.log.addtrace("request parameters retrieved.")
+
+        try:
+            # Ensure that the Earth Engine Session is initialized
+            session.ensure()
+
+        except Exception as e:
+            self.fail(500, "{}", e)
+
+        return self.params
+
+    def geometry(self) -> ee.Geometry:
+        """ The geometry stage. Returns the Earth Engine Geometry of the request bounds. """
+        try:
+            return self._memoize(["geometry", self.params["bounds"]], lambda: spatial.generate_earthenginegeometry_frombounds(*self.params["bounds"]))
+
+        except Exception as e:
+            self.fail(400, "could not generate geometry from bounds. {}", e)
+
+    def date(self) -> datetime.datetime:
+        """ A method that returns the datetime of the request timestamp. """
+        try:
+            return datetime.datetime.fromisoformat(self.params["timestamp"])
+
+        except Exception as e:
+            self.fail(400, "could not generate date from timestamp. {}", e)
+
+    def source(self) -> ee.Image:
+        """ A method that returns the source image of the Sentinel-2 acquisitions for the request bounds and timestamp. """
+        geometry, date = self.geometry(), self.date()
+        return self._memoize(["source", self.params["bounds"], self.params["timestamp"]], lambda: generate_sourceimage(date, geometry))
+
+    def image(self, name: str, generate) -> ee.Image:
+        """ The image stage. Returns the image of a name for the request bounds and timestamp, generating it with the 'generate' callable. """
+        try:
+            image = self._memoize(["image", self.params["bounds"], self.params["timestamp"], name], generate)
+
+        except PipelineError:
+            raise
+
+        except Exception as e:
+            self.fail(400, "could not generate image. {}", e)
+
+        self.log.addtrace("{} image generated.", name)
+        return image
+
+    def export(self, exports: dict) -> dict:
+        """
+        The export stage. Starts an export for each name in the mapping of export names to the callables that generate
+        their images, with the name appended to the request prefix. The exports that have a reusable task in the export
+        registry are not started and their images are not generated. The export tasks are started in parallel.
+        Returns the mapping of export names to their task IDs, or to their object paths if they were downloaded.
+
+        A region that is more than 'tilepixels' pixels on the export grid is split into a grid of tiles, each exported with the tile
+        appended to the prefix of its export, and a manifest of the tile layout is written for each export. The
+        mapping of export names to the lists of their tile task IDs is returned instead.
+        """
+        bucket, prefix, timestamp = self.params["bucket"], self.params["prefix"], self.params["timestamp"]
+
+        try:
+            # Generate the pixel grid of the region on the export grid
+            grid = generate_grid(self.params["bounds"], EXPORT_SCALE)
+
+        except Exception:
+            # Leave the invalid bounds to be reported by the geometry stage
+            grid = None
+
+        pixels = grid["dimensions"]["width"] * grid["dimensions"]["height"] if grid is not None else None
+
+        if pixels is not None and pixels <= self.maxpixels:
+            return self.download(exports, grid)
+
+        # Generate the tile layout of a region beyond the tile size, if the workflow tiles its exports
+        tiled = self.tilepixels is not None and pixels is not None and pixels > self.tilepixels
+        tiles = generate_tilelayout(grid, self.tilepixels) if tiled else None
+        self.tiled = tiles is not None
+
+        # Generate the parts of the exports as a mapping of (name, tile) to the bounds and prefix of the part
+        if tiles is None:
+            parts = {(name, None): (self.params["bounds"], f"{prefix}/{name.lower()}") for name in exports}
+        else:
+            parts = {
+                (name, tile["tile"]): (tile["bounds"], f"{prefix}/{name.lower()}/{tile['tile']}") for name in exports for tile in tiles
+            }
+            self.log.addtrace("region tiled. tiles - {}.", len(tiles))
+
+        # Generate the export registry keys for the parts, with the tile appended to the name for the tiles of an export
+        exportkeys = {
+            (name, tile): self.registry.generate_key(self.params["bounds"], timestamp, name if tile is None else f"{name}/{tile}", bucket, prefix)
+            for name, tile in parts
+        }
+
+        # Hold the export locks so that concurrent identical requests do not start duplicate exports
+        with self.registry.lockedall(list(exportkeys.values())):
+            try:
+                # Retrieve the reusable export tasks for the parts
+                tasks = {part: self.registry.lookup(key) for part, key in exportkeys.items()}
+
+            except Exception as e:
+                self.fail(500, "could not lookup export registry. {}", e)
+
+            # Isolate the parts that must be started
+            pending = [part for part, task in tasks.items() if task is None]
+            self.log.addtrace("exports resolved. reused - {}. pending - {}.", len(tasks) - len(pending), len(pending))
+
+            if pending:
+                # Generate the images of the exports with pending parts
+                images = {name: exports[name]() for name in dict.fromkeys(name for name, _ in pending)}
+
+                try:
+                    # Generate an Earth Engine Export Task for each pending part, clipping the image of a tile to its bounds
+                    exporttasks = {
+                        (name, tile): export.export_image(
+                            images[name] if tile is None else images[name].clip(self._tilegeometry(parts[(name, tile)][0])),
+                            bucket, parts[(name, tile)][1]
+                        ) for name, tile in pending
+                    }
+
+                except Exception as e:
+                    self.fail(500, "could not start export. {}", e)
+
+                def start(exporttask) -> Exception:
+                    """ A function that starts an export task and returns the error if it could not be started. """
+                    try:
+                        exporttask.start()
+
+                    except Exception as e:
+                        return e
+
+                # Start the export tasks in parallel
+                with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(exporttasks), MAX_STARTS)) as executor:
+                    errors = dict(zip(exporttasks, executor.map(start, exporttasks.values())))
+
+                for part, exporttask in exporttasks.items():
+                    if errors[part] is not None:
+                        continue
+
+                    # Register the started task in the export registry, so that a retry only starts the failed parts
+                    self.registry.register(exportkeys[part], exporttask.id)
+                    # Track the task until it completes and publish its completion event
+                    self.tracker.track(exporttask.id, {"workflow": self.workflow, "bucket": bucket, "prefix": parts[part][1]})
+                    tasks[part] = exporttask.id
+
+                failed = [error for error in errors.values() if error is not None]
+                if failed:
+                    self.fail(500, "could not start export. {}", failed[0])
+
+                self.log.addtrace("image exports started. export-tasks - {}", len(exporttasks))
+
+        if tiles is None:
+            return {name: tasks[(name, None)] for name in exports}
+
+        for name in exports:
+            try:
+                # Write the manifest of the tile layout of the export
+                self.manifests[name] = self.writemanifest(name, grid, tiles, {tile["tile"]: tasks[(name, tile["tile"])] for tile in tiles})
+
+            except Exception as e:
+                self.fail(500, "could not write manifest. {}", e)
+
+        self.log.addtrace("manifests written. manifests - {}", self.manifests)
+        return {name: [tasks[(name, tile["tile"])] for tile in tiles] for name in exports}
+
+    def writemanifest(self, name: str, grid: dict, tiles: list, tasks: dict) -> str:
+        """
+        A method that writes the manifest of the tile layout of an export as a JSON object next to its tiles, describing the
+        region, the pixel grid and the bounds, object prefix and task ID of every tile. Returns the path of the manifest.
+        """
+        prefix = f"{self.params['prefix']}/{name.lower()}"
+        manifest = {
+            "workflow": self.workflow,
+            "name": name,
+            "bounds": self.params["bounds"],
+            "timestamp": self.params["timestamp"],
+            "crs": grid["crsCode"],
+            "scale": EXPORT_SCALE,
+            "rows": max(tile["row"] for tile in tiles) + 1,
+            "cols": max(tile["col"] for tile in tiles) + 1,
+            "tiles": [
+                {**tile, "prefix": f"{prefix}/{tile['tile']}", "export-task": tasks[tile["tile"]]} for tile in tiles
+            ],
+        }
+
+        with self.storage.open(self.params["bucket"], f"{prefix}/manifest.json", "application/json") as file:
+            file.write(json.dumps(manifest, indent=2).encode("utf-8"))
+
+        return self.storage.url(self.params["bucket"], f"{prefix}/manifest.json")
+
+    def download(self, exports: dict, grid: dict) -> dict:
+        """
+        A method that downloads the images of the exports for the pixel grid of the region in the request and writes them
+        as Cloud-Optimized GeoTIFFs to the storage, with the name and the '.tif' extension appended to the request prefix.
+        The downloads are registered in the export registry with their object paths, so that a repeated request reuses the
+        objects instead of downloading them again. The images are downloaded in parallel. Returns the mapping of export
+        names to their object paths.
+        """
+        bucket, prefix, timestamp = self.params["bucket"], self.params["prefix"], self.params["timestamp"]
+        self.log.addtrace("download resolved. pixels - {}.", grid["dimensions"]["width"] * grid["dimensions"]["height"])
+
+        # Generate the export registry keys of the downloads, distinct from the keys of the export tasks
+        downloadkeys = {name: self.registry.generate_key(self.params["bounds"], timestamp, f"{name}.tif", bucket, prefix) for name in exports}
+
+        def write(name: str) -> str:
+            """ A function that downloads the pixels of an image and writes them to the storage. """
+            bands = generate_pixels(images[name], grid)
+            transform = grid["affineTransform"]
+
+            with self.storage.open(bucket, f"{prefix}/{name.lower()}.tif", "image/tiff") as file:
+                cogwriter.write(file, bands, (transform["translateX"], transform["translateY"], transform["scaleX"], -transform["scaleY"]))
+
+            return self.storage.url(bucket, f"{prefix}/{name.lower()}.tif")
+
+        # Hold the download locks so that concurrent identical requests do not download the images twice
+        with self.registry.lockedall(list(downloadkeys.values())):
+            try:
+                # Retrieve the reusable downloaded objects
+                objects = {name: self.registry.lookup(key) for name, key in downloadkeys.items()}
+
+            except Exception as e:
+                self.fail(500, "could not lookup export registry. {}", e)
+
+            # Isolate the images that must be downloaded
+            pending = [name for name, path in objects.items() if path is None]
+            self.log.addtrace("downloads resolved. reused - {}. pending - {}.", len(objects) - len(pending), len(pending))
+
+            if pending:
+                images = {name: exports[name]() for name in pending}
+
+                try:
+                    # Download and write the images in parallel
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                        written = dict(zip(pending, executor.map(write, pending)))
+
+                except Exception as e:
+                    self.fail(500, "could not download image. {}", e)
+
+                for name, path in written.items():
+                    # Register the written object as a completed download
+                    self.registry.register(downloadkeys[name], path, "COMPLETED")
+                    objects[name] = path
+
+        self.downloaded = True
+        self.log.addtrace("images downloaded. objects - {}", objects)
+        return objects
+
+    def _tilegeometry(self, bounds: list) -> ee.Geometry:
+        """ A method that returns the Earth Engine Geometry of the bounds of a tile. """
+        return self._memoize(["geometry", bounds], lambda: spatial.generate_earthenginegeometry_frombounds(*bounds))
+
+    def _memoize(self, key: list, generate):
+        """ A method that returns the value for a key memoized for the request and across requests. """
+        key = json.dumps(key)
+
+        if key not in self.memoized:
+            self.memoized[key] = self.memo.get(key, generate)
+
+        return self.memoized[key]
+
+def generate_sourceimage(date: datetime.datetime, geometry: ee.Geometry) -> ee.Image:
+    """
+    A function that generates the source image of the Sentinel-2 acquisitions over a geometry within
+    a 12 hour buffer around a date, mosaicked into a single image and clipped to the geometry.
+    """
+    # Create a Sentinel-2 MSI collection
+    collection = ee.ImageCollection("COPERNICUS/S2_SR")
+    # Filter the collection for the geometry and the buffered daterange
+    collection = collection.filterBounds(geometry).filterDate(date - datetime.timedelta(hours=12), date + datetime.timedelta(hours=12))
+
+    return collection.mosaic().clip(geometry)
+
+def generate_grid(bounds: list, scale: float) -> dict:
+    """
+    A function that generates the Earth Engine pixel grid of a region given by its west, south, east and north bounds
+    on the export grid, the grid of square pixels in the export CRS at the scale in meters, converted to degrees at the
+    equator and aligned to the origin of the CRS, that covers the region.
+    """
+    west, south, east, north = (float(bound) for bound in bounds)
+    if west >= east or south >= north:
+        raise ValueError("invalid bounds")
+
+    size = scale / DEGREE_METERS
+
+    # Snap the region outwards to the pixel edges, with a tolerance for the bounds that lie on an edge
+    left, right = math.floor(west / size + 1e-9), math.ceil(east / size - 1e-9)
+    bottom, top = math.floor(south / size + 1e-9), math.ceil(north / size - 1e-9)
+
+    return {
+        "dimensions": {"width": max(1, right - left), "height": max(1, top - bottom)},
+        "affineTransform": {
+            "scaleX": size, "shearX": 0, "translateX": left * size,
+            "shearY": 0, "scaleY": -size, "translateY": top * size,
+        },
+        "crsCode": EXPORT_CRS,
+    }
+
+def generate_pixels(image: ee.Image, grid: dict) -> list:
+    """
+    A function that downloads the pixels of an image for a pixel grid in a single request and returns the list of its
+    (rows, cols) bands. The bands are views into the downloaded NPY buffer, so the pixels are not copied.
+    """
+    pixels = ee.data.computePixels({"expression": image, "fileFormat": "NPY", "grid": grid})
+
+    if isinstance(pixels, bytes):
+        # Read the header of the NPY buffer and view the structured array of bands in place
+        buffer = io.BytesIO(pixels)
+        numpy.lib.format.read_magic(buffer)
+        shape, fortran, dtype = numpy.lib.format.read_array_header_1_0(buffer)
+        pixels = numpy.frombuffer(pixels, dtype=dtype, count=math.prod(shape), offset=buffer.tell()).reshape(shape, order="F" if fortran else "C")
+
+    return [pixels[band] for band in pixels.dtype.names]
+
+def generate_tilelayout(grid: dict, tilepixels: int) -> list:
+    """
+    A function that splits the pixel grid of a region into a grid of tiles of at most 'tilepixels' pixels. Returns the list
+    of tiles in row major order from the north west tile, each with its 'tile' name, 'row', 'col' and 'bounds'. The tiles
+    share their edges, which lie on the pixel edges of the grid, so that they reassemble the grid without overlapping pixels.
+    """
+    width, height = grid["dimensions"]["width"], grid["dimensions"]["height"]
+    transform = grid["affineTransform"]
+    side = max(1, math.isqrt(tilepixels))
+
+    cols = math.ceil(width / side)
+    rows = math.ceil(height / side)
+
+    # Generate the edges of the tiles from the pixel offsets of their edges
+    longitudes = [transform["translateX"] + transform["scaleX"] * min(col * side, width) for col in range(cols + 1)]
+    latitudes = [transform["translateY"] + transform["scaleY"] * min(row * side, height) for row in range(rows + 1)]
+
+    return [
+        {
+            "tile": f"tile-r{row}-c{col}", "row": row, "col": col,
+            "bounds": [longitudes[col], latitudes[row + 1], longitudes[col + 1], latitudes[row]],
+        }
+        for row in range(rows) for col in range(cols)
+    ]
@@ -0,0 +1,136 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-raster service - export registry
+"""
+import json
+import time
+import contextlib
+import threading
+
+from geocore.database import Database
+
+# The Earth Engine task states for which an existing export task is reused
+REUSABLE_STATES = ("UNSUBMITTED", "READY", "RUNNING", "COMPLETED")
+
+class MemoryBackend:
+    """ A class that represents an in-memory storage backend for the export registry. """
+
+    def __init__(self) -> None:
+        """ Initialization Method """
+        self.records = {}
+
+    def get(self, key: str) -> dict:
+        """ A method that returns the record for a key or None if it does not exist. """
+        return self.records.get(key)
+
+    def put(self, key: str, record: dict):
+        """ A method that stores the record for a key. """
+        self.records[key] = record
+
+    def purge(self, before: float):
+        """ A method that deletes the records created before the given epoch time. """
+        for key in [key for key, record in self.records.items() if record["created"] < before]:
+            del self.records[key]
+
+class SQLiteBackend:
+    """ A class that represents an SQLite storage backend for the export registry at the given path. """
+
+    def __init__(self, path: str) -> None:
+        """ Initialization Method """
+        self.database = Database(path, [
+            "CREATE TABLE IF NOT EXISTS exports (key TEXT PRIMARY KEY, record TEXT, created REAL)"
+        ])
+
+    def get(self, key: str) -> dict:
+        """ A method that returns the record for a key or None if it does not exist. """
+        row = self.database.execute("SELECT record FROM exports WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, record: dict):
+        """ A method that stores the record for a key. """
+        self.database.execute("INSERT OR REPLACE INTO exports VALUES (?, ?, ?)", (key, json.dumps(record), record["created"]))
+        self.database.commit()
+
+    def purge(self, before: float):
+        """ A method that deletes the records created before the given epoch time. """
+        self.database.execute("DELETE FROM exports WHERE created < ?", (before,))
+        self.database.commit()
+
+class ExportRegistry:
+    """
+    A class that represents a registry of started export tasks, used to deduplicate repeated export requests.
+
+    Export tasks are registered against a key generated from the export parameters. An export task is
+    reused for a repeated request while its state is pending or completed, and a new task must be started
+    once it has failed, been cancelled or is older than 'ttl' seconds. The 'status' callable is used to
+    refresh the state of a pending task and must return the Earth Engine task state for a task ID.
+    """
+
+    def __init__(self, backend, status, ttl: float) -> None:
+        """ Initialization Method """
+        self.backend = backend
+        self.status = status
+        self.ttl: float = ttl
+
+        # A fixed pool of locks striped over the keys, to serialize the requests for the same export
+        self.locks = [threading.Lock() for _ in range(64)]
+        self.backendlock = threading.Lock()
+
+    @staticmethod
+    def generate_key(bounds: list, timestamp: str, index: str, bucket: str, prefix: str) -> str:
+        """ A static method that generates the registry key for a set of export parameters. """
+        return json.dumps([bounds, timestamp, index.upper(), bucket, prefix])
+
+    def locked(self, key: str) -> threading.Lock:
+        """
+        A method that returns the lock for a key. Hold the lock while looking up and registering
+        an export, so that concurrent identical requests do not start duplicate export tasks.
+        """
+        return self.locks[hash(key) % len(self.locks)]
+
+    def lockedall(self, keys: list) -> contextlib.ExitStack:
+        """
+        A method that returns a context manager that holds the locks for a list of keys. 
+        The locks are acquired in a fixed order so that overlapping requests cannot deadlock.
+        """
+        stack = contextlib.ExitStack()
+        for position in sorted({hash(key) % len(self.locks) for key in keys}):
+            stack.enter_context(self.locks[position])
+
+        return stack
+
+    def lookup(self, key: str) -> str:
+        """ A method that returns the ID of the reusable export task for a key or None if a new task must be started. """
+        with self.backendlock:
+            record = self.backend.get(key)
+
+        if record is None or time.time() - record["created"] > self.ttl:
+            return None
+
+        if record["state"] not in REUSABLE_STATES:
+            return None
+
+        if record["state"] != "COMPLETED":
+            try:
+                # Refresh the state of the pending task
+                record["state"] = self.status(record["task"])
+
+            except Exception:
+                # Reuse the task if its state could not be refreshed, a duplicate costs more than a retry
+                return record["task"]
+
+            with self.backendlock:
+                self.backend.put(key, record)
+
+        return record["task"] if record["state"] in REUSABLE_STATES else None
+
+    def register(self, key: str, task: str, state: str = "READY"):
+        """ A method that registers a started export task for a key and purges the expired records. """
+        now = time.time()
+
+        with self.backendlock:
+            self.backend.put(key, {"task": task, "state": state, "created": now})
+            self.backend.purge(now - self.ttl)
@@ -0,0 +1,64 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-raster service - scene classification
+"""
+from __future__ import annotations
+
+from geocore import startup
+
+# Import Earth Engine lazily, it is only required once the session is initialized
+ee = startup.lazyimport("ee")
+
+# The summary classes and the Sentinel-2 scene classes that they group.
+# The remaining classes (saturated, dark area, bare soil and unclassified) are summarized as 'other'.
+SUMMARY_CLASSES = {
+    "vegetation": (4,),
+    "water": (6,),
+    "cloud": (8, 9, 10),
+    "shadow": (3,),
+    "snow": (11,),
+    "other": (1, 2, 5, 7),
+}
+
+# The native resolution of the scene classification band in meters
+SCALE = 20
+
+def generate_image(source: ee.Image) -> ee.Image:
+    """ A function that generates the scene classification image of a Sentinel-2 source image with the pixels without data masked. """
+    scl = source.select("SCL")
+    return scl.updateMask(scl.neq(0)).rename("SCL")
+
+def generate_classareas(image: ee.Image, geometry: ee.Geometry) -> ee.Dictionary:
+    """
+    A function that generates the server-side area in square meters of each summary class of a scene classification
+    image over a geometry. The scene classes are remapped to the positions of their summary classes and the pixel
+    areas are summed for all of them in a single grouped reduction.
+    """
+    positions = {sclass: position for position, name in enumerate(SUMMARY_CLASSES) for sclass in SUMMARY_CLASSES[name]}
+    summary = image.remap(list(positions), list(positions.values())).rename("class")
+
+    return ee.Image.pixelArea().addBands(summary).reduceRegion(
+        reducer=ee.Reducer.sum().group(groupField=1, groupName="class"),
+        geometry=geometry, scale=SCALE, maxPixels=1e10
+    )
+
+def format_classareas(reduced: dict) -> dict:
+    """
+    A function that formats the grouped reduction of the class areas into a mapping of every summary class
+    to its area in square meters and its fraction of the classified area, rounded to 6 decimals.
+    """
+    names = list(SUMMARY_CLASSES)
+    areas = dict.fromkeys(names, 0.0)
+
+    for group in reduced.get("groups", []):
+        areas[names[int(group["class"])]] += group["sum"]
+
+    total = sum(areas.values())
+
+    return {
+        name: {"area": round(area, 3), "fraction": round(area / total, 6) if total else None}
+        for name, area in areas.items()
+    }
@@ -0,0 +1,71 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-raster service - object storage
+"""
+import os
+import contextlib
+
+class LocalStorage:
+    """
+    A class that represents a local filesystem stand-in for Cloud Storage, with a directory for each bucket under 'root'.
+    Objects are written to a partial file that is renamed into place once the write completes.
+    """
+
+    def __init__(self, root: str) -> None:
+        """ Initialization Method """
+        self.root: str = root
+
+    @contextlib.contextmanager
+    def open(self, bucket: str, name: str, contenttype: str = "application/octet-stream"):
+        """ A method that returns a context manager for a writable binary file of an object that is stored when the context exits. """
+        path = os.path.join(self.root, bucket, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            with open(f"{path}.partial", "wb") as file:
+                yield file
+
+        except BaseException:
+            # Discard the partial object
+            os.remove(f"{path}.partial")
+            raise
+
+        os.replace(f"{path}.partial", path)
+
+    def url(self, bucket: str, name: str) -> str:
+        """ A method that returns the path of an object. """
+        return os.path.join(self.root, bucket, name)
+
+class CloudStorage:
+    """
+    A class that represents a Cloud Storage client. Objects are streamed to the bucket with a resumable
+    upload in chunks of 'chunksize' bytes, which must be a multiple of 256 KiB, and are only created
+    once the upload is finalized when the write completes.
+    """
+
+    def __init__(self, chunksize: int = 1024 * 1024) -> None:
+        """ Initialization Method """
+        self.chunksize: int = chunksize
+        self.client = None
+
+    @contextlib.contextmanager
+    def open(self, bucket: str, name: str, contenttype: str = "application/octet-stream"):
+        """ A method that returns a context manager for a writable binary file of an object that is stored when the context exits. """
+        if self.client is None:
+            # Import and create the Cloud Storage client only when it is used
+            from google.cloud import storage
+            self.client = storage.Client()
+
+        blob = self.client.bucket(bucket).blob(name)
+        file = blob.open("wb", chunk_size=self.chunksize, content_type=contenttype)
+
+        # The upload is abandoned without being finalized if the write fails
+        yield file
+        file.close()
+
+    def url(self, bucket: str, name: str) -> str:
+        """ A method that returns the gs:// URL of an object. """
+        return f"gs://{bucket}/{name}"
@@ -0,0 +1,11 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - test configuration
+"""
+import os
+import sys
+
+# Import the service modules and the shared geocore package as they are laid out in the container
+SERVICE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE, os.path.dirname(SERVICE)]
@@ -0,0 +1,70 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - altitude polygon tests
+"""
+import os
+
+import numpy
+import pytest
+
+import main
+from demstore import DEMStore, generate_synthetictile
+
+SQUARE = [[[77.1, 12.1], [77.2, 12.1], [77.2, 12.2], [77.1, 12.2], [77.1, 12.1]]]
+
+class BrokenStore:
+    """ A class that stands in for a local DEM store whose tiles cannot be read. """
+
+    def summarize(self, polygons: list) -> dict:
+        raise OSError("tile is corrupt")
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """ A fixture that returns a test client with a local DEM store that holds the synthetic tile of the test polygons. """
+    numpy.save(os.path.join(tmp_path, "N12E077.npy"), generate_synthetictile(77, 12, 100))
+
+    monkeypatch.setattr(main, "demstore", DEMStore(str(tmp_path), maxtiles=4))
+    monkeypatch.setattr(main.logentry.writer, "write", lambda entry: None)
+
+    return main.app.test_client()
+
+def post(client, geojson) -> tuple:
+    """ A function that posts a polygon to the '/altitude' endpoint and returns the status and the body. """
+    response = client.post("/altitude", json={"geojson": geojson})
+    return response.status_code, response.get_json()
+
+def test_polygon_is_summarized_from_the_local_dem(client):
+    status, body = post(client, {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": SQUARE}})
+
+    assert status == 200
+    assert set(body["altitude"]) == {"mean", "min", "max"}
+    assert body["altitude"]["min"] <= body["altitude"]["mean"] <= body["altitude"]["max"]
+
+def test_positions_with_an_altitude_are_summarized_by_their_coordinates(client):
+    _, flat = post(client, {"type": "Polygon", "coordinates": SQUARE})
+    status, body = post(client, {"type": "Polygon", "coordinates": [[[*position, 900.0] for position in SQUARE[0]]]})
+
+    assert (status, body) == (200, flat)
+
+@pytest.mark.parametrize("geojson", [
+    {"type": "Point", "coordinates": [77.1, 12.1]},
+    {"type": "Polygon", "coordinates": []},
+    {"type": "Polygon", "coordinates": [[]]},
+    {"type": "Polygon", "coordinates": [[[77.1], [77.2, 12.1]]]},
+    {"type": "Polygon", "coordinates": [[["77.1", 12.1], [77.2, 12.1]]]},
+    {"type": "MultiPolygon", "coordinates": SQUARE},
+])
+def test_invalid_geometries_are_rejected(client, geojson):
+    status, body = post(client, geojson)
+
+    assert status == 400
+    assert body["error"] == "altitude generation failed. invalid geojson. must be a Polygon or MultiPolygon."
+
+def test_local_dem_failures_are_server_errors(client, monkeypatch):
+    monkeypatch.setattr(main, "demstore", BrokenStore())
+
+    status, body = post(client, {"type": "Polygon", "coordinates": SQUARE})
+
+    assert status == 500
+    assert body["error"] == "altitude generation failed. could not summarize local dem. tile is corrupt"
@@ -0,0 +1,132 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - cloud optimized geotiff writer tests
+"""
+import io
+import zlib
+import struct
+
+import numpy
+
+import cogwriter
+
+# The struct formats and sizes of the TIFF field types written by the writer
+TYPES = {3: ("H", 2), 4: ("I", 4), 12: ("d", 8)}
+
+TRANSFORM = (77.0, 13.0, 0.0001, 0.0001)
+
+def parse(data: bytes) -> list:
+    """ A function that parses the chain of IFDs of a little endian TIFF into a list of lists of (tag, values) tuples. """
+    assert data[:4] == b"II*\x00"
+    offset, ifds = struct.unpack_from("<I", data, 4)[0], []
+
+    while offset:
+        count = struct.unpack_from("<H", data, offset)[0]
+        entries = []
+
+        for position in range(offset + 2, offset + 2 + 12 * count, 12):
+            tag, code, items, value = struct.unpack_from("<HHII", data, position)
+            fmt, size = TYPES[code]
+            start = position + 8 if items * size <= 4 else value
+            entries.append((tag, struct.unpack_from(f"<{items}{fmt}", data, start)))
+
+        ifds.append(entries)
+        offset = struct.unpack_from("<I", data, offset + 2 + 12 * count)[0]
+
+    return ifds
+
+def decode(data: bytes, tags: dict, dtype: numpy.dtype) -> list:
+    """ A function that reassembles the planar bands of a level from its decompressed tiles, cropped to the level dimensions. """
+    cols, rows, tilesize = tags[256][0], tags[257][0], tags[322][0]
+    across, down = -(-cols // tilesize), -(-rows // tilesize)
+    offsets, lengths = tags[324], tags[325]
+
+    bands = []
+    for band in range(tags[277][0]):
+        image = numpy.zeros((down * tilesize, across * tilesize), dtype=dtype)
+
+        for row in range(down):
+            for col in range(across):
+                index = (band * down + row) * across + col
+                tile = zlib.decompress(data[offsets[index]:offsets[index] + lengths[index]])
+                image[row * tilesize:(row + 1) * tilesize, col * tilesize:(col + 1) * tilesize] = numpy.frombuffer(tile, dtype=dtype).reshape(tilesize, tilesize)
+
+        bands.append(image[:rows, :cols])
+
+    return bands
+
+def write(bands, **kwargs) -> bytes:
+    file = io.BytesIO()
+    cogwriter.write(file, bands, TRANSFORM, **kwargs)
+    return file.getvalue()
+
+def test_bands_round_trip_byte_exact_with_partial_tiles():
+    rng = numpy.random.default_rng(0)
+    bands = [rng.integers(0, 256, (300, 520), dtype=numpy.uint8) for _ in range(3)]
+
+    data = write(bands, tilesize=128)
+    tags = dict(parse(data)[0])
+
+    assert (tags[256], tags[257]) == ((520,), (300,))
+    assert tags[258] == (8, 8, 8)
+    assert tags[262] == (2,)
+    assert tags[284] == (2,)
+
+    for decoded, band in zip(decode(data, tags, numpy.dtype("<u1")), bands):
+        assert decoded.tobytes() == band.tobytes()
+
+def test_float_structured_fields_round_trip_byte_exact():
+    rng = numpy.random.default_rng(1)
+    pixels = numpy.zeros((70, 90), dtype=[("NDVI", "<f4"), ("NDWI", "<f4")])
+    pixels["NDVI"] = rng.uniform(-1, 1, (70, 90))
+    pixels["NDWI"] = rng.uniform(-1, 1, (70, 90))
+
+    data = write([pixels[band] for band in pixels.dtype.names], tilesize=32)
+    tags = dict(parse(data)[0])
+
+    assert tags[258] == (32, 32)
+    assert tags[339] == (3, 3)
+    assert tags[338] == (0,)
+
+    for decoded, band in zip(decode(data, tags, numpy.dtype("<f4")), pixels.dtype.names):
+        assert decoded.tobytes() == numpy.ascontiguousarray(pixels[band]).tobytes()
+
+def test_overviews_halve_until_they_fit_a_single_tile():
+    bands = [numpy.arange(300 * 520, dtype=numpy.uint16).reshape(300, 520)]
+
+    data = write(bands, tilesize=64)
+    levels = [dict(entries) for entries in parse(data)]
+
+    assert [(tags[256][0], tags[257][0]) for tags in levels] == [(520, 300), (260, 150), (130, 75), (65, 38), (33, 19)]
+    assert [tags[254][0] for tags in levels] == [0, 1, 1, 1, 1]
+
+    # Only the full resolution image is georeferenced
+    assert levels[0][33922] == (0.0, 0.0, 0.0, 77.0, 13.0, 0.0)
+    assert all(33922 not in tags for tags in levels[1:])
+
+    # The overviews are nearest neighbour decimations of the full resolution image
+    for position, tags in enumerate(levels):
+        step = 2 ** position
+        assert decode(data, tags, numpy.dtype("<u2"))[0].tobytes() == bands[0][::step, ::step].tobytes()
+
+def test_tags_are_sorted_and_tiles_follow_the_ifds_from_the_smallest_level():
+    bands = [numpy.ones((200, 200), dtype=numpy.uint8) for _ in range(4)]
+
+    data = write(bands, tilesize=64)
+    ifds = parse(data)
+
+    for entries in ifds:
+        tags = [tag for tag, _ in entries]
+        assert tags == sorted(tags)
+
+    # The tiles follow the IFDs with the tiles of the smaller levels first and end with the file
+    levels = [dict(entries) for entries in ifds]
+    firstifd = struct.unpack_from("<I", data, 4)[0]
+    assert all(offset > firstifd for tags in levels for offset in tags[324])
+
+    starts = [min(tags[324]) for tags in levels]
+    assert starts == sorted(starts, reverse=True)
+
+    ends = [max(offset + length for offset, length in zip(tags[324], tags[325])) for tags in levels]
+    assert max(ends) == len(data)
@@ -0,0 +1,109 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - local dem tile store tests
+"""
+import math
+import os
+
+import numpy
+import pytest
+
+from demstore import DEMStore, contains, generate_synthetictile
+
+# The number of pixels along each side of the test tiles, so that a pixel is 0.1 degrees square
+SIZE = 10
+NODATA = -32768
+
+def elevation(longitude: float, latitude: float) -> float:
+    """ A function that returns the analytic elevation of the synthetic DEM at a pixel center. """
+    return 1000 + 500 * math.sin(math.radians(longitude * 10)) + 300 * math.cos(math.radians(latitude * 10))
+
+@pytest.fixture
+def store(tmp_path):
+    """ A fixture that writes the N12E077 and N12E078 synthetic tiles with a nodata pixel in the first and returns a store of them. """
+    tile = generate_synthetictile(77, 12, SIZE)
+    # The pixel from 77.2E to 77.3E and 12.9N to 13N has no data
+    tile[0, 2] = NODATA
+    numpy.save(os.path.join(tmp_path, "N12E077.npy"), tile)
+    numpy.save(os.path.join(tmp_path, "N12E078.npy"), generate_synthetictile(78, 12, SIZE))
+
+    return DEMStore(str(tmp_path), maxtiles=4, nodata=NODATA)
+
+def test_tilename():
+    assert DEMStore.tilename(77, 12) == "N12E077"
+    assert DEMStore.tilename(-1, -1) == "S01W001"
+
+def test_sample_matches_the_analytic_elevation(store):
+    elevations, found = store.sample([77.15, 78.55, 77.25], [12.35, 12.05, 12.95])
+
+    assert found.tolist() == [True, True, True]
+    assert elevations[0] == pytest.approx(elevation(77.15, 12.35), abs=1e-3)
+    assert elevations[1] == pytest.approx(elevation(78.55, 12.05), abs=1e-3)
+    # The nodata pixel is returned as NaN
+    assert math.isnan(elevations[2])
+
+def test_sample_reports_missing_tiles(store):
+    elevations, found = store.sample([77.15, 80.5], [12.35, 12.5])
+
+    assert found.tolist() == [True, False]
+    assert math.isnan(elevations[1])
+    assert store.stats()["missing"] == 1
+
+def test_tiles_are_evicted_least_recently_used(tmp_path):
+    for west in (77, 78, 79):
+        numpy.save(os.path.join(tmp_path, f"N12E{west:03d}.npy"), generate_synthetictile(west, 12, SIZE))
+
+    store = DEMStore(str(tmp_path), maxtiles=2)
+    store.tile(77, 12)
+    store.tile(78, 12)
+    # Reading the first tile again makes the second the least recently used
+    store.tile(77, 12)
+    store.tile(79, 12)
+
+    assert list(store.tiles) == ["N12E077", "N12E079"]
+    assert store.stats() == {"hits": 1, "opens": 3, "missing": 0, "evictions": 1, "open": 2}
+
+def test_summarize_excludes_the_hole_of_a_polygon(store):
+    # A square from 77.0E to 77.5E and 12.0N to 12.5N with a hole from 77.1E to 77.4E and 12.1N to 12.4N
+    outer = [[77.0, 12.0], [77.5, 12.0], [77.5, 12.5], [77.0, 12.5], [77.0, 12.0]]
+    hole = [[77.1, 12.1], [77.4, 12.1], [77.4, 12.4], [77.1, 12.4], [77.1, 12.1]]
+
+    summary = store.summarize([[outer, hole]])
+
+    centers = [round(77.05 + 0.1 * step, 2) for step in range(5)]
+    expected = [
+        elevation(longitude, latitude) for longitude in centers for latitude in [round(12.05 + 0.1 * step, 2) for step in range(5)]
+        if not (77.1 < longitude < 77.4 and 12.1 < latitude < 12.4)
+    ]
+
+    assert len(expected) == 16
+    assert summary["mean"] == pytest.approx(numpy.mean(expected), abs=1e-2)
+    assert summary["min"] == pytest.approx(min(expected), abs=1e-2)
+    assert summary["max"] == pytest.approx(max(expected), abs=1e-2)
+
+def test_summarize_a_polygon_smaller_than_a_pixel_uses_its_center_pixel(store):
+    polygon = [[[77.51, 12.31], [77.53, 12.31], [77.53, 12.33], [77.51, 12.33], [77.51, 12.31]]]
+
+    summary = store.summarize([polygon])
+
+    assert summary["mean"] == summary["min"] == summary["max"] == pytest.approx(elevation(77.55, 12.35), abs=1e-2)
+
+def test_summarize_reports_missing_tiles(store):
+    polygon = [[[79.1, 12.1], [79.2, 12.1], [79.2, 12.2], [79.1, 12.1]]]
+    assert store.summarize([polygon]) is None
+
+def test_contains_uses_the_even_odd_rule():
+    outer = [[0, 0], [4, 0], [4, 4], [0, 4]]
+    hole = [[1, 1], [3, 1], [3, 3], [1, 3]]
+    island = [[1.5, 1.5], [2.5, 1.5], [2.5, 2.5], [1.5, 2.5]]
+
+    longitudes = numpy.array([0.5, 2.0, 5.0, 1.2])
+    latitudes = numpy.array([0.5, 2.0, 2.0, 1.2])
+
+    assert contains([[outer]], longitudes, latitudes).tolist() == [True, True, False, True]
+    # The hole excludes its points
+    assert contains([[outer, hole]], longitudes, latitudes).tolist() == [True, False, False, False]
+    # A ring within the hole is inside again, and separate polygons are combined
+    assert contains([[outer, hole, island]], longitudes, latitudes).tolist() == [True, True, False, False]
+    assert contains([[hole], [[[4.5, 1.5], [5.5, 1.5], [5.5, 2.5], [4.5, 2.5]]]], longitudes, latitudes).tolist() == [False, True, True, True]
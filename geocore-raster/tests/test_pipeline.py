@@ -0,0 +1,67 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - export grid and tile layout tests
+"""
+import pytest
+
+from pipeline import DEGREE_METERS, EXPORT_CRS, generate_grid, generate_tilelayout
+
+# The scale of a pixel of a thousandth of a degree
+SCALE = DEGREE_METERS / 1000
+SIZE = 0.001
+
+def test_grid_snaps_the_bounds_outwards_to_the_pixel_edges():
+    grid = generate_grid([77.0003, 12.0002, 77.0105, 12.0071], SCALE)
+
+    assert grid["dimensions"] == {"width": 11, "height": 8}
+    assert grid["crsCode"] == EXPORT_CRS
+
+    transform = grid["affineTransform"]
+    assert transform["scaleX"] == pytest.approx(SIZE)
+    assert transform["scaleY"] == pytest.approx(-SIZE)
+    assert (transform["translateX"], transform["translateY"]) == (pytest.approx(77.0), pytest.approx(12.008))
+
+def test_grid_keeps_the_bounds_on_pixel_edges():
+    grid = generate_grid([77.0, 12.0, 77.01, 12.005], SCALE)
+    assert grid["dimensions"] == {"width": 10, "height": 5}
+
+    # A region within a single pixel covers that pixel
+    grid = generate_grid([77.0001, 12.0001, 77.0002, 12.0002], SCALE)
+    assert grid["dimensions"] == {"width": 1, "height": 1}
+
+@pytest.mark.parametrize("bounds", [[77.01, 12.0, 77.0, 12.005], [77.0, 12.005, 77.01, 12.005]])
+def test_grid_rejects_inverted_bounds(bounds):
+    with pytest.raises(ValueError):
+        generate_grid(bounds, SCALE)
+
+def test_tilelayout_of_a_grid_that_is_not_a_multiple_of_the_tile_size():
+    grid = generate_grid([77.0, 12.0, 77.011, 12.008], SCALE)
+    tiles = generate_tilelayout(grid, 10)
+
+    # Tiles of 3 by 3 pixels cover the 11 by 8 grid with partial tiles on the east and south edges
+    assert [(tile["row"], tile["col"]) for tile in tiles] == [(row, col) for row in range(3) for col in range(4)]
+    assert tiles[0]["tile"] == "tile-r0-c0"
+    assert tiles[-1]["tile"] == "tile-r2-c3"
+
+    assert tiles[0]["bounds"] == pytest.approx([77.0, 12.005, 77.003, 12.008])
+    assert tiles[-1]["bounds"] == pytest.approx([77.009, 12.0, 77.011, 12.002])
+
+    # The tiles share their edges and reassemble the grid
+    for position, tile in enumerate(tiles):
+        west, south, east, north = tile["bounds"]
+        if tile["col"] < 3:
+            assert tiles[position + 1]["bounds"][0] == east
+        if tile["row"] < 2:
+            assert tiles[position + 4]["bounds"][3] == south
+
+    widths = [round((tile["bounds"][2] - tile["bounds"][0]) / SIZE) for tile in tiles[:4]]
+    heights = [round((tile["bounds"][3] - tile["bounds"][1]) / SIZE) for tile in tiles[::4]]
+    assert (widths, heights) == ([3, 3, 3, 2], [3, 3, 2])
+
+def test_tilelayout_of_a_grid_within_the_tile_budget_is_a_single_tile():
+    grid = generate_grid([77.0, 12.0, 77.011, 12.008], SCALE)
+    tiles = generate_tilelayout(grid, 11 * 11)
+
+    assert len(tiles) == 1
+    assert tiles[0]["bounds"] == pytest.approx([77.0, 12.0, 77.011, 12.008])
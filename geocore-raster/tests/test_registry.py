@@ -0,0 +1,91 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - export registry tests
+"""
+import threading
+
+import pytest
+
+from registry import ExportRegistry, MemoryBackend, SQLiteBackend
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    """ A fixture that returns each of the registry storage backends. """
+    return MemoryBackend() if request.param == "memory" else SQLiteBackend(str(tmp_path / "registry.db"))
+
+def test_key_is_case_insensitive_on_the_index():
+    assert ExportRegistry.generate_key([1, 2, 3, 4], "2022-01-01", "ndvi", "b", "p") == \
+        ExportRegistry.generate_key([1, 2, 3, 4], "2022-01-01", "NDVI", "b", "p")
+
+def test_unregistered_key_must_be_started(backend):
+    registry = ExportRegistry(backend, status=lambda task: "RUNNING", ttl=60)
+    assert registry.lookup("key") is None
+
+def test_pending_task_is_reused_while_its_state_is_reusable(backend):
+    states = {"T1": "RUNNING"}
+    registry = ExportRegistry(backend, status=lambda task: states[task], ttl=60)
+    registry.register("key", "T1")
+
+    assert registry.lookup("key") == "T1"
+
+    states["T1"] = "COMPLETED"
+    assert registry.lookup("key") == "T1"
+
+    # A completed task is reused without refreshing its state
+    states["T1"] = "FAILED"
+    assert registry.lookup("key") == "T1"
+
+def test_failed_task_must_be_started_again(backend):
+    registry = ExportRegistry(backend, status=lambda task: "FAILED", ttl=60)
+    registry.register("key", "T1")
+
+    assert registry.lookup("key") is None
+
+    registry.register("key", "T2", "COMPLETED")
+    assert registry.lookup("key") == "T2"
+
+def test_task_is_reused_if_its_state_cannot_be_refreshed(backend):
+    def status(task):
+        raise RuntimeError("unavailable")
+
+    registry = ExportRegistry(backend, status=status, ttl=60)
+    registry.register("key", "T1")
+
+    assert registry.lookup("key") == "T1"
+
+def test_expired_records_are_not_reused_and_are_purged(backend, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("registry.time.time", lambda: now[0])
+
+    registry = ExportRegistry(backend, status=lambda task: "COMPLETED", ttl=60)
+    registry.register("old", "T1")
+
+    now[0] += 61
+    assert registry.lookup("old") is None
+
+    # Registering another task purges the expired record
+    registry.register("new", "T2")
+    assert backend.get("old") is None
+    assert backend.get("new")["task"] == "T2"
+
+def test_lockedall_serializes_overlapping_key_sets():
+    registry = ExportRegistry(MemoryBackend(), status=lambda task: "RUNNING", ttl=60)
+    inside, overlaps = [], []
+
+    def run(keys):
+        for _ in range(200):
+            with registry.lockedall(keys):
+                inside.append(keys)
+                if len(inside) > 1:
+                    overlaps.append(list(inside))
+                inside.remove(keys)
+
+    threads = [threading.Thread(target=run, args=(keys,)) for keys in (["a", "b"], ["b", "c"], ["c", "a"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert overlaps == []
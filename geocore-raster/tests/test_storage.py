@@ -0,0 +1,51 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - object storage tests
+"""
+import os
+
+import pytest
+
+from storage import LocalStorage
+
+def test_object_is_written_under_its_bucket(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    with storage.open("bucket", "prefix/tci.tif", "image/tiff") as file:
+        file.write(b"first")
+        file.write(b" second")
+
+    path = storage.url("bucket", "prefix/tci.tif")
+    assert path == os.path.join(str(tmp_path), "bucket", "prefix", "tci.tif")
+
+    with open(path, "rb") as file:
+        assert file.read() == b"first second"
+
+    assert os.listdir(os.path.dirname(path)) == ["tci.tif"]
+
+def test_object_only_appears_once_the_write_completes(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    path = storage.url("bucket", "tci.tif")
+
+    with storage.open("bucket", "tci.tif") as file:
+        file.write(b"partial")
+        assert not os.path.exists(path)
+
+    assert os.path.exists(path)
+
+def test_failed_write_discards_the_object_and_keeps_the_previous_one(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+
+    with storage.open("bucket", "tci.tif") as file:
+        file.write(b"previous")
+
+    with pytest.raises(RuntimeError):
+        with storage.open("bucket", "tci.tif") as file:
+            file.write(b"broken")
+            raise RuntimeError("download failed")
+
+    with open(storage.url("bucket", "tci.tif"), "rb") as file:
+        assert file.read() == b"previous"
+
+    assert os.listdir(os.path.join(str(tmp_path), "bucket")) == ["tci.tif"]
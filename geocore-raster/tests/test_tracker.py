@@ -0,0 +1,126 @@
+"""
+GeoSentry GeoCore API
+
+geocore-raster service - export task tracker tests
+"""
+import time
+import concurrent.futures
+
+from geocore import logentry
+from tracker import MemoryPublisher, PubSubPublisher, TaskTracker, generate_operationstatuses
+
+def wait(condition, timeout: float = 2.0) -> bool:
+    """ A function that waits for a condition to hold, polling it until the timeout. """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+
+    return True
+
+def test_poller_publishes_completed_tasks_and_stops():
+    states = {"a": "RUNNING", "b": "RUNNING"}
+    calls = []
+
+    def status(tasks):
+        calls.append(sorted(tasks))
+        return [{"id": task, "state": states[task]} for task in tasks]
+
+    publisher = MemoryPublisher()
+    tracker = TaskTracker(status, publisher, interval=0.01)
+    tracker.track("a", {"name": "first"})
+    tracker.track("b", {"name": "second"})
+
+    assert wait(lambda: tracker.stats()["polls"] >= 1)
+    assert tracker.state("a") == "RUNNING"
+
+    states["a"] = "COMPLETED"
+    assert wait(lambda: tracker.state("a") == "COMPLETED")
+    assert list(publisher.messages) == [{"task": "a", "state": "COMPLETED", "name": "first"}]
+
+    states["b"] = "FAILED"
+    assert wait(lambda: tracker.poller is None)
+
+    # Every poll retrieves all the pending tasks in one batch
+    assert ["a", "b"] in calls and all(call in (["a", "b"], ["b"]) for call in calls)
+    assert [message["task"] for message in publisher.messages] == ["a", "b"]
+    stats = tracker.stats()
+    assert (stats["pending"], stats["finished"], stats["published"]) == (0, 2, 2)
+
+def test_poller_restarts_for_new_tasks():
+    tracker = TaskTracker(lambda tasks: [{"id": task, "state": "COMPLETED"} for task in tasks], MemoryPublisher(), interval=0.01)
+
+    tracker.track("a", {})
+    assert wait(lambda: tracker.poller is None)
+
+    tracker.track("b", {})
+    assert wait(lambda: tracker.state("b") == "COMPLETED")
+    assert tracker.tasks() == {"a": {"state": "COMPLETED"}, "b": {"state": "COMPLETED"}}
+
+def test_finished_tasks_are_retained_up_to_the_limit():
+    tracker = TaskTracker(lambda tasks: [{"id": task, "state": "COMPLETED"} for task in tasks], MemoryPublisher(), interval=60, retain=2)
+
+    for task in ("a", "b", "c"):
+        tracker.pending[task] = {"state": "READY", "started": time.time(), "metadata": {}}
+
+    tracker.poll()
+
+    assert tracker.state("a") is None
+    assert tracker.state("c") == "COMPLETED"
+    assert tracker.stats()["finished"] == 2
+
+def test_poll_errors_are_counted_and_logged(monkeypatch):
+    logs = []
+    monkeypatch.setattr(logentry.writer, "write", lambda entry: logs.append(entry.render()))
+
+    failures = iter([True])
+
+    def status(tasks):
+        if next(failures, False):
+            raise RuntimeError("unavailable")
+        return [{"id": task, "state": "COMPLETED"} for task in tasks]
+
+    tracker = TaskTracker(status, MemoryPublisher(), interval=0.01)
+    tracker.track("a", {})
+
+    assert wait(lambda: tracker.poller is None)
+    assert tracker.stats()["errors"] == 1
+    assert tracker.state("a") == "COMPLETED"
+    assert logs == [{"severity": "WARNING", "message": "could not poll export tasks. unavailable", "service": "geocore-raster"}]
+
+def test_operation_statuses_are_filtered_and_converted():
+    operations = [
+        {"name": "projects/p/operations/A", "metadata": {"state": "SUCCEEDED"}, "done": True},
+        {"name": "projects/p/operations/B", "metadata": {"state": "PENDING"}},
+        {"name": "projects/p/operations/C", "metadata": {"state": "RUNNING"}},
+        {"name": "projects/p/operations/D", "metadata": {"state": "FAILED"}},
+    ]
+
+    statuses = generate_operationstatuses(operations, ["A", "B", "D", "E"])
+
+    assert statuses == [{"id": "A", "state": "COMPLETED"}, {"id": "B", "state": "READY"}, {"id": "D", "state": "FAILED"}]
+
+def test_publish_failures_are_logged(monkeypatch):
+    logs = []
+    monkeypatch.setattr(logentry.writer, "write", lambda entry: logs.append(entry.render()))
+
+    futures = []
+
+    class Client:
+        def publish(self, topic, data):
+            futures.append(concurrent.futures.Future())
+            return futures[-1]
+
+    publisher = PubSubPublisher.__new__(PubSubPublisher)
+    publisher.client, publisher.topic = Client(), "projects/p/topics/t"
+
+    publisher.publish({"task": "A"})
+    publisher.publish({"task": "B"})
+
+    futures[0].set_result("message-id")
+    futures[1].set_exception(RuntimeError("unavailable"))
+
+    assert logs == [{
+        "severity": "WARNING", "message": "could not publish task event. unavailable", "service": "geocore-raster", "event": {"task": "B"}
+    }]
@@ -0,0 +1,182 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-raster service - export task tracker
+"""
+import json
+import time
+import threading
+import collections
+
+from geocore import logentry
+
+# The Earth Engine task states after which a task no longer changes
+TERMINAL_STATES = ("COMPLETED", "FAILED", "CANCELLED")
+
+# The task states of the Earth Engine operation states that differ from them
+OPERATION_STATES = {"PENDING": "READY", "SUCCEEDED": "COMPLETED", "CANCELLING": "CANCEL_REQUESTED"}
+
+class MemoryPublisher:
+    """ A class that represents a local in-memory stand-in for a Pub/Sub topic that retains the last 'maxsize' messages. """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        """ Initialization Method """
+        self.messages = collections.deque(maxlen=maxsize)
+
+    def publish(self, message: dict):
+        """ A method that publishes a message to the topic. """
+        self.messages.append(message)
+
+class PubSubPublisher:
+    """ A class that represents a publisher for a Pub/Sub topic in a GCP project. """
+
+    def __init__(self, project: str, topic: str) -> None:
+        """ Initialization Method """
+        # Import the Pub/Sub client only when it is used
+        from google.cloud import pubsub_v1
+
+        self.client = pubsub_v1.PublisherClient()
+        self.topic = self.client.topic_path(project, topic)
+
+    def publish(self, message: dict):
+        """ A method that publishes a message to the topic. Publish failures are logged once the publish resolves. """
+        future = self.client.publish(self.topic, json.dumps(message).encode("utf-8"))
+        future.add_done_callback(lambda future: self.published(future, message))
+
+    @staticmethod
+    def published(future, message: dict):
+        """ A static method that logs the failure of a resolved publish of a message. """
+        error = future.exception()
+        if error is not None:
+            logentry.ServiceLog("geocore-raster", "WARNING", f"could not publish task event. {error}", event=message).flush()
+
+class TaskTracker:
+    """
+    A class that represents a tracker of started Earth Engine export tasks.
+
+    A single background poller retrieves the state of all the pending tasks every 'interval' seconds
+    with one call to the 'status' callable, which must accept a list of task IDs and return a list of
+    task status dictionaries with the 'id' and 'state' keys. When a task reaches a terminal state, a
+    completion event is published with the 'publisher' and the task is retained for 'retain' tasks.
+    """
+
+    def __init__(self, status, publisher, interval: float, retain: int = 1000) -> None:
+        """ Initialization Method """
+        self.status = status
+        self.publisher = publisher
+        self.interval: float = interval
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.finished = collections.OrderedDict()
+        self.retain: int = retain
+
+        self.poller = None
+        self.counters = {"polls": 0, "errors": 0, "published": 0}
+
+    def track(self, task: str, metadata: dict):
+        """ A method that starts tracking a task with a dictionary of metadata that is added to its completion event. """
+        with self.lock:
+            self.pending[task] = {"state": "READY", "started": time.time(), "metadata": metadata}
+
+            # Start the poller in the serving process when the first task is tracked
+            if self.poller is None or not self.poller.is_alive():
+                self.poller = threading.Thread(target=self._poll, name="tasktracker", daemon=True)
+                self.poller.start()
+
+    def state(self, task: str) -> str:
+        """ A method that returns the last known state of a task or None if it is not tracked. """
+        with self.lock:
+            record = self.pending.get(task) or self.finished.get(task)
+            return record["state"] if record else None
+
+    def tasks(self) -> dict:
+        """ A method that returns a mapping of the tracked task IDs to their state and metadata. """
+        with self.lock:
+            return {
+                task: {"state": record["state"], **record["metadata"]}
+                for task, record in [*self.pending.items(), *self.finished.items()]
+            }
+
+    def stats(self) -> dict:
+        """ A method that returns the counters and the number of pending and finished tasks. """
+        with self.lock:
+            return {**self.counters, "pending": len(self.pending), "finished": len(self.finished)}
+
+    def poll(self):
+        """ A method that retrieves the state of all the pending tasks in one batch and publishes the completed tasks. """
+        with self.lock:
+            tasks = list(self.pending)
+
+        if not tasks:
+            return
+
+        statuses = self.status(tasks)
+        events = []
+
+        with self.lock:
+            self.counters["polls"] += 1
+
+            for status in statuses:
+                record = self.pending.get(status.get("id"))
+                if record is None:
+                    continue
+
+                record["state"] = status.get("state", record["state"])
+                if record["state"] not in TERMINAL_STATES:
+                    continue
+
+                # Move the task to the finished tasks and compose its completion event
+                del self.pending[status["id"]]
+                self.finished[status["id"]] = record
+                events.append({"task": status["id"], "state": record["state"], **record["metadata"]})
+
+                # Discard the oldest finished tasks beyond the retention size
+                while len(self.finished) > self.retain:
+                    self.finished.popitem(last=False)
+
+        for event in events:
+            self.publisher.publish(event)
+
+        with self.lock:
+            self.counters["published"] += len(events)
+
+    def _poll(self):
+        """ A method that runs the poll loop until there are no more pending tasks. """
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                self.poll()
+
+            except Exception as e:
+                with self.lock:
+                    self.counters["errors"] += 1
+                logentry.ServiceLog("geocore-raster", "WARNING", f"could not poll export tasks. {e}").flush()
+
+            with self.lock:
+                if not self.pending:
+                    self.poller = None
+                    return
+
+def generate_operationstatuses(operations: list, tasks: list) -> list:
+    """
+    A function that generates the task status dictionaries with the 'id' and 'state' keys of a list of task IDs from
+    a listing of Earth Engine operations, such as the one returned by a single 'ee.data.listOperations' call. The task
+    ID of an operation is the last part of its name and the operation states are converted into task states. Tasks
+    that are not in the listing are omitted.
+    """
+    selected = set(tasks)
+    statuses = []
+
+    for operation in operations:
+        task = operation.get("name", "").rsplit("/", 1)[-1]
+        if task not in selected:
+            continue
+
+        state = operation.get("metadata", {}).get("state")
+        statuses.append({"id": task, "state": OPERATION_STATES.get(state, state)})
+
+    return statuses
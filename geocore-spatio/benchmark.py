@@ -0,0 +1,56 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-spatio service - geojson ingestion benchmark
+
+A micro-benchmark that compares the cost of generating a shape geometry for the '/reshape' endpoint
+from a large polygon GeoJSON dictionary with the previous string round trip (json.dumps followed by
+spatial.generate_shape_fromgeojson) against the direct dictionary ingestion (generate_shape_fromdict).
+If the Terrarium package is not installed, the round trip is modelled as json.dumps and json.loads
+followed by the same direct ingestion.
+
+Usage: python benchmark.py [--vertices 1000 10000 100000] [--repeat 20]
+"""
+import json
+import math
+import timeit
+import argparse
+
+from features import generate_shape_fromdict
+
+def generate_polygon(vertices: int) -> dict:
+    """ A function that generates a GeoJSON Feature dictionary of a circular polygon with the given number of vertices. """
+    ring = [
+        [77.5 + 0.1 * math.cos(2 * math.pi * step / vertices), 12.9 + 0.1 * math.sin(2 * math.pi * step / vertices)]
+        for step in range(vertices)
+    ]
+    ring.append(ring[0])
+
+    return {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+def roundtrip(geojson: dict):
+    """ A function that generates a shape geometry with the previous dict -> string -> geometry round trip. """
+    try:
+        from terrarium import spatial
+        return spatial.generate_shape_fromgeojson(json.dumps(geojson))
+
+    except ImportError:
+        return generate_shape_fromdict(json.loads(json.dumps(geojson)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="geojson ingestion benchmark for the '/reshape' endpoint")
+    parser.add_argument("--vertices", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    arguments = parser.parse_args()
+
+    print(f"{'vertices':>10} {'roundtrip (ms)':>16} {'direct (ms)':>14} {'speedup':>9}")
+
+    for vertices in arguments.vertices:
+        geojson = generate_polygon(vertices)
+
+        before = min(timeit.repeat(lambda: roundtrip(geojson), number=1, repeat=arguments.repeat)) * 1000
+        after = min(timeit.repeat(lambda: generate_shape_fromdict(geojson), number=1, repeat=arguments.repeat)) * 1000
+
+        print(f"{vertices:>10} {before:>16.3f} {after:>14.3f} {before / after:>8.2f}x")
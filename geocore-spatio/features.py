@@ -0,0 +1,99 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-spatio service - geojson features
+"""
+import shapely.geometry
+import shapely.geometry.base
+
+from geocore import startup
+
+# Import Terrarium lazily, it is only required once a geometry is reshaped
+spatial = startup.lazyimport("terrarium.spatial")
+
+def generate_shape_fromdict(geojson: dict) -> shapely.geometry.base.BaseGeometry:
+    """
+    A function that generates a shapely geometry directly from a parsed GeoJSON dictionary, without
+    serializing it back into a string. The GeoJSON can be a FeatureCollection, a Feature or a bare
+    geometry. Only the first feature of a FeatureCollection is converted.
+
+    Raises a RuntimeError if the GeoJSON could not be converted into a geometry.
+    """
+    try:
+        if geojson.get("type") == "FeatureCollection":
+            geojson = geojson["features"][0]
+
+        if geojson.get("type") == "Feature":
+            geojson = geojson["geometry"]
+
+        return shapely.geometry.shape(geojson)
+
+    except Exception as e:
+        raise RuntimeError(f"could not parse geojson. {e}")
+
+def reshape_shape(shape: shapely.geometry.base.BaseGeometry) -> shapely.geometry.base.BaseGeometry:
+    """
+    A function that reshapes a shapely geometry into its square bounding box with the Terrarium reshape
+    runtime of its geometry type, a square buffer of 2.5 kms around a Point and a square bound around a
+    Polygon or LineString.
+
+    Raises a ValueError if the geometry is empty or of an unsupported type.
+    """
+    if shape.is_empty:
+        raise ValueError(f"empty geometry: {shape.geom_type}")
+
+    if shape.geom_type == "Polygon":
+        return spatial.reshape_polygon(shape)
+
+    if shape.geom_type == "Point":
+        return spatial.reshape_point(shape)
+
+    if shape.geom_type == "LineString":
+        return spatial.reshape_linestring(shape)
+
+    raise ValueError(f"unsupported geometry type: {shape.geom_type}")
+
+def reshape_features(features: list) -> list:
+    """
+    A function that reshapes each of a list of GeoJSON features into its square bounding box and generates
+    the bounds, areas and centroid of the reshaped geometry with the same Terrarium runtimes as '/reshape'.
+    Returns a list of results in the same order as the features, each of which is either a dictionary with
+    the 'bounds', 'areas' and 'centroid' keys, in the same form as the '/reshape' response, or a dictionary
+    with an 'error' key.
+    """
+    results = []
+
+    for feature in features:
+        try:
+            # Retrieve the geometry of the feature and generate its shape
+            geometry = feature["geometry"] if feature.get("type") == "Feature" else feature
+            shape = shapely.geometry.shape(geometry)
+
+        except Exception as e:
+            results.append({"error": f"spatial reshape failed. could not generate shape geometry. {e}"})
+            continue
+
+        try:
+            reshaped = reshape_shape(shape)
+
+        except ValueError as e:
+            results.append({"error": f"spatial reshape failed. {e}"})
+            continue
+
+        except RuntimeError as e:
+            results.append({"error": f"spatial reshape failed. could not reshape geometry. {e}"})
+            continue
+
+        try:
+            results.append({
+                "bounds": list(reshaped.bounds),
+                "areas": spatial.generate_area(reshaped),
+                "centroid": spatial.generate_centroid(reshaped)
+            })
+
+        except RuntimeError as e:
+            results.append({"error": f"spatial reshape failed. could not generate reshaped geometry data. {e}"})
+
+    return results
@@ -0,0 +1,105 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-spatio service - geocode cache
+"""
+import time
+import threading
+import collections
+
+from geocore.database import Database
+
+class GeocodeCache:
+    """
+    A class that represents a cache of geocode locations for coordinate pairs.
+
+    Coordinates are quantized to 'precision' decimal places before they are used as keys, so that
+    nearby coordinates share a single geocode location. The cache has an in-memory LRU tier that
+    holds up to 'maxsize' locations and an optional SQLite tier at 'path' that survives container
+    restarts. Locations in both tiers expire after 'ttl' seconds.
+    """
+
+    def __init__(self, precision: int, ttl: float, maxsize: int, path: str = None) -> None:
+        """ Initialization Method """
+        self.precision: int = precision
+        self.ttl: float = ttl
+        self.maxsize: int = maxsize
+
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.counters = {"hits": 0, "diskhits": 0, "misses": 0, "evictions": 0}
+
+        self.database = None
+
+        if path:
+            self.database = Database(path, [
+                "CREATE TABLE IF NOT EXISTS geocache (coordinates TEXT PRIMARY KEY, geocode TEXT, fetched REAL)"
+            ])
+
+    def quantize(self, longitude: float, latitude: float) -> str:
+        """ A method that generates the cache key for a coordinate pair by quantizing it to the cache precision. """
+        return f"{float(longitude):.{self.precision}f},{float(latitude):.{self.precision}f}"
+
+    def get(self, longitude: float, latitude: float) -> str:
+        """ A method that returns the cached geocode location for a coordinate pair or None if it is not cached. """
+        key = self.quantize(longitude, latitude)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[0]
+
+            if entry is not None:
+                del self.entries[key]
+
+            if self.database is not None:
+                row = self.database.execute(
+                    "SELECT geocode, fetched FROM geocache WHERE coordinates = ? AND fetched >= ?",
+                    (key, time.time() - self.ttl)
+                ).fetchone()
+
+                if row is not None:
+                    self._insert(key, row[0], row[1])
+                    self.counters["diskhits"] += 1
+                    return row[0]
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, longitude: float, latitude: float, geocode: str):
+        """ A method that caches the geocode location for a coordinate pair in both tiers. """
+        key = self.quantize(longitude, latitude)
+        fetched = time.time()
+
+        with self.lock:
+            self._insert(key, geocode, fetched)
+
+            if self.database is not None:
+                self.database.execute("INSERT OR REPLACE INTO geocache VALUES (?, ?, ?)", (key, geocode, fetched))
+                self.database.execute("DELETE FROM geocache WHERE fetched < ?", (fetched - self.ttl,))
+                self.database.commit()
+
+    def stats(self) -> dict:
+        """ A method that returns the counters, the hit rate and the size of the cache. """
+        with self.lock:
+            stats = dict(self.counters)
+            lookups = stats["hits"] + stats["diskhits"] + stats["misses"]
+
+            stats["hitrate"] = round((stats["hits"] + stats["diskhits"]) / lookups, 4) if lookups else 0.0
+            stats["size"] = len(self.entries)
+            return stats
+
+    def _insert(self, key: str, geocode: str, fetched: float):
+        """ A method that inserts a location into the in-memory tier. Must be called while holding the lock. """
+        self.entries[key] = (geocode, fetched)
+        self.entries.move_to_end(key)
+
+        # Evict the least recently used locations beyond the maximum size
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
@@ -0,0 +1,26 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-spatio service - gUnicorn configuration
+"""
+import os
+
+# Serve the requests on a pool of threads in each worker, so that a request that is blocked on a call
+# to Earth Engine or another API does not hold up the other requests sent to the container
+worker_class = "gthread"
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 20))
+timeout = 60
+
+# Load the application in the master process, so that the startup hook runs before the workers fork
+preload_app = True
+
+def on_starting(server):
+    """ A gUnicorn server hook that reports the startup times before the workers fork. """
+    # Import the startup module here, the app directory is only on the path once the app is loaded
+    from geocore import startup
+
+    # Log the startup times of the service
+    startup.report("geocore-spatio")
@@ -6,53 +6,27 @@ Google Cloud Platform - Cloud Run
 geocore-spatio service
 """
 import os
-import json
+import time
+import concurrent.futures
 
 import flask
 import flask_restful
 
-from terrarium import spatial
+from geocore import logentry
+from geocore import metrics
+from geocore import startup
+from geocore.singleflight import SingleFlight
 
-class LogEntry:
-    """ A class that represents a serverless log compliant with Google Cloud Platform. """
-
-    service = "geocore-spatio"
-
-    def __init__(self, workflow: str) -> None:
-        """ Initialization Method """
-        self.workflow: str = workflow
-        self.logtrace: list = [f"execution started. worflow - {workflow}."]
-
-        self.baselog = {
-            "trace": self.logtrace, 
-            "service":self.service
-        }
-
-        project = os.environ.get('GCP_PROJECT')
-        reqtrace = flask.request.headers.get('X-Cloud-Trace-Context')
+from features import generate_shape_fromdict, reshape_features
+from geocache import GeocodeCache
 
-        if reqtrace and project:
-            tracedata = f"projects/{project}/traces/{reqtrace.split('/')[0]}"
-            self.baselog.update({"logging.googleapis.com/trace": tracedata})
+# Import Terrarium lazily, it is only required for reverse geocode and reshape lookups
+spatial = startup.lazyimport("terrarium.spatial")
 
-    def addtrace(self, trace: str):
-        """ A method that adds a trace string to the list of logtraces. """
-        self.logtrace.append(trace)
-
-    def flush(self, severity: str, message: str):
-        """
-        A method of LogEntry that creates and flushes the built log to Cloud Logging as
-        a structured log given that it is called within a Cloud Run/Functions Service.
-        The method accepts a log severity string and a log message string.
-
-        Accepted log severity values are - EMERGENCY, ALERT, CRITICAL, ERROR, WARNING, NOTICE, INFO, DEBUG and DEFAULT.
-        Refer to https://cloud.google.com/logging/docs/reference/v2/rest/v2/LogEntry#logseverity for more information.
-        """
-        self.addtrace("execution ended.")
-        logentry = dict(severity=severity, message=message)
-        logentry.update(self.baselog)
+class LogEntry(logentry.LogEntry):
+    """ A class that represents a serverless log compliant with Google Cloud Platform. """
 
-        print(json.dumps(logentry))
+    service = "geocore-spatio"
 
 class Geocode(flask_restful.Resource):
     """ RESTful resource for the '/geocode' endpoint. """
@@ -93,17 +67,29 @@ class Geocode(flask_restful.Resource):
 
         except KeyError as e:
             # log and return the error
-            log.addtrace(f"missing request parameter {e}.")
+            log.addtrace("missing request parameter {}.", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"spatial geocode failed. missing request parameter. {e}"}, 400
 
-        log.addtrace(f"request parameters retrieved.")
+        log.addtrace("request parameters retrieved.")
 
         try:
-            # Genertae the geocode location for the coordinates
-            geocode = spatial.generate_location(**coordinates)
+            # Retrieve the geocode location for the coordinates from the cache
+            geocode = geocache.get(coordinates["longitude"], coordinates["latitude"])
+
+            if geocode is None:
+                log.addtrace("geocode location cache miss.")
+
+                # Generate and cache the geocode location for the coordinates, sharing the lookup
+                # with the identical geocodes that are already in flight
+                flightkey = geocache.quantize(coordinates["longitude"], coordinates["latitude"])
+                geocode, shared = flights.do(flightkey, generate_cachedlocation, coordinates["longitude"], coordinates["latitude"])
+
+                if shared:
+                    log.addtrace("coalesced with an in-flight geocode.")
+
             # log the generated values
-            log.addtrace(f"geocode location generated. location - {geocode}")
+            log.addtrace("geocode location generated. location - {}", geocode)
             log.flush("INFO", "runtime complete")
 
             # Return the geocode response
@@ -140,15 +126,15 @@ class Reshape(flask_restful.Resource):
 
         except KeyError as e:
             # log and return the error
-            log.addtrace(f"missing request parameter {e}.")
+            log.addtrace("missing request parameter {}.", e)
             log.flush("ERROR", "runtime terminated")
             return {"error": f"spatial reshape failed. missing request parameter. {e}"}, 400
 
         log.addtrace("request parameters retrieved.")
 
         try:
-            # Generate a shape geometry from the geojson 
-            shape = spatial.generate_shape_fromgeojson(json.dumps(geojson))
+            # Generate a shape geometry directly from the geojson dictionary
+            shape = generate_shape_fromdict(geojson)
 
         except RuntimeError as e:
             # log and return the error
@@ -158,26 +144,33 @@ class Reshape(flask_restful.Resource):
 
         log.addtrace("spatial parameters generated.")
 
+        # Check that the shape geometry is not empty.
+        if shape.is_empty:
+            # log and return the error
+            log.addtrace("empty geometry detected.")
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"spatial reshape failed. empty geometry: {shape.geom_type}"}, 400
+
         try:
             # Check the type of the shape geometry and 
             # call the appropriate reshape runtime
 
-            if shape.type == "Polygon":
+            if shape.geom_type == "Polygon":
                 log.addtrace("polygon geometry detected.")
                 reshaped = spatial.reshape_polygon(shape)
 
-            elif shape.type == "Point":
+            elif shape.geom_type == "Point":
                 log.addtrace("point geometry detected.")
                 reshaped = spatial.reshape_point(shape)
 
-            elif shape.type == "LineString":
+            elif shape.geom_type == "LineString":
                 log.addtrace("linestring geometry detected.")
                 reshaped = spatial.reshape_linestring(shape)
 
             else:
                 log.addtrace("invalid geometry detected.")
                 log.flush("ERROR", "runtime terminated")
-                return {"error": f"spatial reshape failed. unsupported geometry type: {shape.type}"}, 400
+                return {"error": f"spatial reshape failed. unsupported geometry type: {shape.geom_type}"}, 400
 
         except RuntimeError as e:
             # log and return the error
@@ -198,7 +191,7 @@ class Reshape(flask_restful.Resource):
             # Isolate the square metres area value
             sqm = areas["SQM"]
             # log the generated values
-            log.addtrace(f"reshape data. bounds - {bounds}. area - {sqm}. centroid - {centroid}.")
+            log.addtrace("reshape data. bounds - {}. area - {}. centroid - {}.", bounds, sqm, centroid)
             log.flush("INFO", "runtime complete")
             
             # Return the reshape response
@@ -215,11 +208,228 @@ class Reshape(flask_restful.Resource):
             return {"error": f"spatial reshape failed. could not generate reshaped geometry data. {e}"}, 500
 
 
+class ReshapeBatch(flask_restful.Resource):
+    """ RESTful resource for the '/reshape/batch' endpoint. """
+
+    def post(self):
+        """ RESTful POST """
+        # Create a LogEntry object for the batch reshape workflow
+        log = LogEntry("reshape-batch")
+
+        # Parse the request JSON
+        request = flask.request.get_json()
+        log.addtrace("request parsed.")
+
+        try:
+            # Retrieve the 'geojson' key from the request
+            geojson = request["geojson"]
+
+            # Check that geojson is a FeatureCollection dictionary.
+            if not isinstance(geojson, dict) or geojson.get("type") != "FeatureCollection":
+                # log and return the error
+                log.addtrace("invalid geojson.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"spatial batch reshape failed. invalid geojson. not a FeatureCollection"}, 400
+
+            # Retrieve the features of the geojson
+            features = geojson.get("features")
+
+            # Check that features is a list.
+            if not isinstance(features, list):
+                # log and return the error
+                log.addtrace("invalid geojson features.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"spatial batch reshape failed. invalid geojson. features must be a list"}, 400
+
+        except KeyError as e:
+            # log and return the error
+            log.addtrace("missing request parameter {}.", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"spatial batch reshape failed. missing request parameter. {e}"}, 400
+
+        log.addtrace("request parameters retrieved. feature count - {}.", len(features))
+
+        try:
+            # Reshape each of the features and generate their data
+            results = reshape_features(features)
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not reshape features.")
+            log.flush("ERROR", "runtime error")
+            return {"error": f"spatial batch reshape failed. could not reshape features. {e}"}, 500
+
+        # log the generated values
+        log.addtrace("features reshaped. errors - {}.", sum("error" in result for result in results))
+        log.flush("INFO", "runtime complete")
+
+        # Return the reshape response for the features
+        return {"features": results}, 200
+
+class GeocodeBatch(flask_restful.Resource):
+    """ RESTful resource for the '/geocode/batch' endpoint. """
+
+    def post(self):
+        """ RESTful POST """
+        # Create a LogEntry object for the geocodebatch workflow
+        log = LogEntry("geocodebatch")
+
+        # Parse the request JSON
+        request = flask.request.get_json()
+        log.addtrace("request parsed.")
+
+        try:
+            # Retrieve the 'coordinates' key from the request
+            coordinates = request["coordinates"]
+
+            # Check that coordinates is a list.
+            if not isinstance(coordinates, list):
+                # log and return the error
+                log.addtrace("invalid coordinates.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"spatial batch geocode failed. invalid coordinates. not a list"}, 400
+
+            log.addtrace("coordinate count - {}.", len(coordinates))
+
+            # Retrieve the maximum number of coordinate pairs in a batch
+            batchmax = int(os.environ.get("GEOCODE_BATCHMAX", 1000))
+
+            # Check that the batch is within the maximum size.
+            if len(coordinates) > batchmax:
+                # log and return the error
+                log.addtrace("batch too large.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"spatial batch geocode failed. invalid coordinates. must have at most {batchmax} coordinate pairs"}, 400
+
+        except KeyError as e:
+            # log and return the error
+            log.addtrace("missing request parameter {}.", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"spatial batch geocode failed. missing request parameter. {e}"}, 400
+
+        log.addtrace("request parameters retrieved.")
+
+        # Create a result slot for each coordinate pair to preserve the request order
+        results = [None] * len(coordinates)
+        # Create a mapping of quantized coordinates to the positions of the coordinate pairs that share them
+        positions = {}
+        # Create a mapping of quantized coordinates to the first coordinate pair with them
+        unique = {}
+
+        for position, pair in enumerate(coordinates):
+            # Check that the coordinate pair is a dictionary with a longitude and latitude.
+            if not isinstance(pair, dict) or "longitude" not in pair or "latitude" not in pair:
+                results[position] = {"error": "spatial geocode failed. invalid coordinates. must be a dictionary with longitude and latitude."}
+                continue
+
+            try:
+                # Generate the quantized key for the coordinate pair
+                key = geocache.quantize(pair["longitude"], pair["latitude"])
+
+            except (TypeError, ValueError) as e:
+                results[position] = {"error": f"spatial geocode failed. invalid coordinates. {e}"}
+                continue
+
+            positions.setdefault(key, []).append(position)
+            unique.setdefault(key, pair)
+
+        log.addtrace("coordinates deduplicated. unique - {}.", len(unique))
+
+        # Create a mapping of quantized coordinates to the geocode lookups submitted to the pool
+        futures = {}
+
+        for key, pair in unique.items():
+            # Retrieve the geocode location for the coordinates from the cache
+            geocode = geocache.get(pair["longitude"], pair["latitude"])
+
+            if geocode is not None:
+                for position in positions[key]:
+                    results[position] = {"geocode": geocode}
+                continue
+
+            # Submit the geocode lookup for the coordinates to the pool, sharing it with the identical geocodes in flight
+            futures[key] = geocoder.submit(flights.do, key, generate_cachedlocation, pair["longitude"], pair["latitude"])
+
+        log.addtrace("geocode lookups submitted. lookups - {}.", len(futures))
+
+        # Retrieve the number of seconds to wait for all the geocode lookups, a single deadline for the whole batch
+        timeout = float(os.environ.get("GEOCODE_TIMEOUT", 10))
+        deadline = time.monotonic() + timeout
+
+        # Wait for the geocode lookups until the deadline
+        concurrent.futures.wait(list(futures.values()), timeout=max(0.0, deadline - time.monotonic()))
+
+        for key, future in futures.items():
+            if not future.done():
+                # Cancel the lookup if it has not started yet, a running lookup completes in the background
+                future.cancel()
+                result = {"error": "spatial geocode failed. could not generate geocode location. timed out."}
+
+            else:
+                try:
+                    # Retrieve the geocode location for the coordinates
+                    result = {"geocode": future.result()[0]}
+
+                except Exception as e:
+                    result = {"error": f"spatial geocode failed. could not generate geocode location. {e}"}
+
+            for position in positions[key]:
+                results[position] = result
+
+        # log the generated values
+        log.addtrace("geocode locations generated. errors - {}.", sum('error' in result for result in results))
+        log.flush("INFO", "runtime complete")
+
+        # Return the batch geocode response
+        return {"geocodes": results}, 200
+
+class GeocodeCacheStats(flask_restful.Resource):
+    """ RESTful resource for the '/geocache' endpoint. """
+
+    def get(self):
+        """ RESTful GET """
+        # Return the geocode cache counters
+        return {"geocache": geocache.stats()}, 200
+
+def generate_cachedlocation(longitude: float, latitude: float) -> str:
+    """ A function that generates the geocode location for a coordinate pair and caches it. """
+    # Genertae the geocode location for the coordinates
+    geocode = spatial.generate_location(longitude=longitude, latitude=latitude)
+    # Cache the geocode location for the coordinates
+    geocache.put(longitude, latitude, geocode)
+
+    return geocode
+
+# Create the bounded thread pool for batch geocode lookups
+geocoder = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.environ.get("GEOCODE_WORKERS", 16)))
+
+# Create the geocode cache for the service
+geocache = GeocodeCache(
+    precision=int(os.environ.get("GEOCACHE_PRECISION", 4)),
+    ttl=float(os.environ.get("GEOCACHE_TTL", 2592000)),
+    maxsize=int(os.environ.get("GEOCACHE_MAXSIZE", 50000)),
+    path=os.environ.get("GEOCACHE_PATH")
+)
+# Expose the geocode cache counters as metrics
+metrics.registry.register("geocore_geocache", LogEntry.service, geocache.stats)
+
+# Create the request coalescing group for the service
+flights = SingleFlight()
+# Expose the request coalescing counters as metrics
+metrics.registry.register("geocore_singleflight", LogEntry.service, flights.stats)
+
 app = flask.Flask(__name__)
 api = flask_restful.Api(app)
 
 api.add_resource(Geocode, '/geocode')
+api.add_resource(GeocodeBatch, '/geocode/batch')
 api.add_resource(Reshape, '/reshape')
+api.add_resource(ReshapeBatch, '/reshape/batch')
+api.add_resource(GeocodeCacheStats, '/geocache')
+api.add_resource(metrics.Metrics, '/metrics')
 
 if __name__ == '__main__':
+    # Report the startup times
+    startup.report(LogEntry.service)
+
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
@@ -0,0 +1,76 @@
+"""
+GeoSentry GeoCore API
+
+geocore-spatio service - geocode cache tests
+"""
+import types
+
+import pytest
+
+import geocache
+from geocache import GeocodeCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ A fixture that returns a mutable clock of epoch seconds that the cache reads instead of the system time. """
+    clock = types.SimpleNamespace(now=1700000000.0)
+    monkeypatch.setattr(geocache, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def test_nearby_coordinates_share_a_quantized_key():
+    cache = GeocodeCache(precision=3, ttl=60, maxsize=10)
+
+    assert cache.quantize(77.12345, 12.5) == "77.123,12.500"
+    assert cache.quantize("77.1234", -0.0001) == cache.quantize(77.12349, -0.0004)
+
+def test_hit_and_miss(clock):
+    cache = GeocodeCache(precision=3, ttl=60, maxsize=10)
+    assert cache.get(77.1, 12.1) is None
+
+    cache.put(77.1, 12.1, "Bengaluru")
+    assert cache.get(77.1001, 12.1001) == "Bengaluru"
+    assert cache.get(77.2, 12.2) is None
+
+    assert cache.stats() == {"hits": 1, "diskhits": 0, "misses": 2, "evictions": 0, "hitrate": 0.3333, "size": 1}
+
+def test_locations_expire_after_the_ttl(clock):
+    cache = GeocodeCache(precision=3, ttl=60, maxsize=10)
+    cache.put(77.1, 12.1, "Bengaluru")
+
+    clock.now += 60
+    assert cache.get(77.1, 12.1) == "Bengaluru"
+
+    clock.now += 1
+    assert cache.get(77.1, 12.1) is None
+    assert cache.stats()["size"] == 0
+
+def test_least_recently_used_locations_are_evicted(clock):
+    cache = GeocodeCache(precision=3, ttl=60, maxsize=2)
+    cache.put(1, 1, "first")
+    cache.put(2, 2, "second")
+
+    # Using the first location makes the second the least recently used
+    cache.get(1, 1)
+    cache.put(3, 3, "third")
+
+    assert cache.get(2, 2) is None
+    assert (cache.get(1, 1), cache.get(3, 3)) == ("first", "third")
+    assert cache.stats()["evictions"] == 1
+
+def test_disk_tier_survives_restarts_and_expires(clock, tmp_path):
+    path = str(tmp_path / "geocache.db")
+    GeocodeCache(precision=3, ttl=60, maxsize=1, path=path).put(77.1, 12.1, "Bengaluru")
+
+    restarted = GeocodeCache(precision=3, ttl=60, maxsize=1, path=path)
+    assert restarted.get(77.1, 12.1) == "Bengaluru"
+    # The disk hit is promoted to the in-memory tier
+    assert restarted.get(77.1, 12.1) == "Bengaluru"
+    assert (restarted.stats()["diskhits"], restarted.stats()["hits"]) == (1, 1)
+
+    # A location evicted from memory is still answered from disk
+    restarted.put(78.1, 13.1, "Chennai")
+    assert restarted.get(77.1, 12.1) == "Bengaluru"
+    assert restarted.stats()["diskhits"] == 2
+
+    clock.now += 61
+    assert GeocodeCache(precision=3, ttl=60, maxsize=1, path=path).get(77.1, 12.1) is None
@@ -0,0 +1,116 @@
+"""
+GeoSentry GeoCore API
+
+geocore-spatio service - batch geocode tests
+"""
+import time
+import types
+import threading
+
+import pytest
+
+import main
+from geocache import GeocodeCache
+
+@pytest.fixture
+def client(monkeypatch):
+    """ A fixture that returns a test client with an empty geocode cache and a geocoder that can be delayed and failed per coordinate pair. """
+    calls, delays, failures = [], {}, {}
+    release = threading.Event()
+
+    def generate_location(longitude: float, latitude: float) -> str:
+        calls.append((longitude, latitude))
+
+        if (longitude, latitude) in delays:
+            release.wait(delays[(longitude, latitude)])
+        if (longitude, latitude) in failures:
+            raise RuntimeError(failures[(longitude, latitude)])
+
+        return f"location {longitude} {latitude}"
+
+    monkeypatch.setattr(main, "spatial", types.SimpleNamespace(generate_location=generate_location))
+    monkeypatch.setattr(main, "geocache", GeocodeCache(precision=4, ttl=60, maxsize=100))
+    monkeypatch.setattr(main.logentry.writer, "write", lambda entry: None)
+
+    client = main.app.test_client()
+    client.calls, client.delays, client.failures = calls, delays, failures
+    yield client
+
+    # Release the lookups that are still waiting
+    release.set()
+
+def post(client, coordinates: list):
+    """ A function that posts a batch of coordinate pairs and returns the status and the geocodes. """
+    response = client.post("/geocode/batch", json={"coordinates": coordinates})
+    return response.status_code, response.get_json()
+
+def test_results_keep_the_request_order_and_share_lookups(client):
+    status, body = post(client, [
+        {"longitude": 77.1, "latitude": 12.1},
+        {"longitude": 77.2, "latitude": 12.2},
+        {"longitude": 77.10001, "latitude": 12.10001},
+    ])
+
+    assert status == 200
+    assert [result["geocode"] for result in body["geocodes"]] == ["location 77.1 12.1", "location 77.2 12.2", "location 77.1 12.1"]
+    # The pairs that quantize to the same key are looked up once
+    assert sorted(client.calls) == [(77.1, 12.1), (77.2, 12.2)]
+
+def test_cached_pairs_are_not_looked_up_again(client):
+    post(client, [{"longitude": 77.1, "latitude": 12.1}])
+    status, body = post(client, [{"longitude": 77.1, "latitude": 12.1}, {"longitude": 77.3, "latitude": 12.3}])
+
+    assert status == 200
+    assert body["geocodes"][0] == {"geocode": "location 77.1 12.1"}
+    assert client.calls == [(77.1, 12.1), (77.3, 12.3)]
+
+def test_invalid_and_failed_pairs_are_reported_per_item(client):
+    client.failures[(77.2, 12.2)] = "quota"
+
+    status, body = post(client, [
+        {"longitude": 77.1, "latitude": 12.1},
+        {"longitude": 77.2, "latitude": 12.2},
+        {"longitude": 77.3},
+        {"longitude": "east", "latitude": 12.4},
+    ])
+
+    assert status == 200
+    results = body["geocodes"]
+    assert results[0] == {"geocode": "location 77.1 12.1"}
+    assert results[1] == {"error": "spatial geocode failed. could not generate geocode location. quota"}
+    assert results[2]["error"].startswith("spatial geocode failed. invalid coordinates.")
+    assert results[3]["error"].startswith("spatial geocode failed. invalid coordinates.")
+
+def test_batch_waits_for_a_single_deadline(client, monkeypatch):
+    monkeypatch.setenv("GEOCODE_TIMEOUT", "0.3")
+
+    # Every slow lookup outlives the deadline on its own, so a wait for each lookup in turn takes 0.3s per lookup
+    slow = [(77.0 + position / 10, 13.0) for position in range(4)]
+    for pair in slow:
+        client.delays[pair] = 5
+
+    started = time.monotonic()
+    status, body = post(client, [{"longitude": 77.5, "latitude": 12.5}] + [{"longitude": x, "latitude": y} for x, y in slow])
+    elapsed = time.monotonic() - started
+
+    assert status == 200
+    assert elapsed < 1.0
+    # The completed lookup is returned along with a timeout error for each of the slow lookups
+    assert body["geocodes"][0] == {"geocode": "location 77.5 12.5"}
+    assert body["geocodes"][1:] == [{"error": "spatial geocode failed. could not generate geocode location. timed out."}] * 4
+
+def test_batches_over_the_maximum_are_rejected(client, monkeypatch):
+    monkeypatch.setenv("GEOCODE_BATCHMAX", "2")
+
+    status, body = post(client, [{"longitude": 77.1, "latitude": 12.1}] * 3)
+
+    assert status == 400
+    assert body == {"error": "spatial batch geocode failed. invalid coordinates. must have at most 2 coordinate pairs"}
+    assert client.calls == []
+
+def test_default_maximum_accepts_a_thousand_pairs(client):
+    status, body = post(client, [{"longitude": 77.0 + position / 1000, "latitude": 12.0} for position in range(1000)])
+
+    assert status == 200
+    assert len(body["geocodes"]) == 1000
+    assert all("geocode" in result for result in body["geocodes"])
@@ -0,0 +1,72 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-vector service - cloud cover
+"""
+from __future__ import annotations
+
+import datetime
+
+from geocore import startup
+
+# Import Earth Engine lazily, it is only required once the session is initialized
+ee = startup.lazyimport("ee")
+
+# The Sentinel-2 scene classes that are counted as clouds.
+# Medium and high probability clouds and thin cirrus.
+CLOUD_CLASSES = (8, 9, 10)
+
+def generate_cloudseries(geometry: ee.Geometry, start: datetime.datetime, end: datetime.datetime, scale: float) -> ee.Dictionary:
+    """
+    A function that generates the server-side series of the cloud fraction over a geometry for every Sentinel-2
+    acquisition within a daterange. The fraction of the pixels of the geometry that are classified as clouds
+    by the scene classification band is reduced for the whole filtered collection in a single request, as a
+    dictionary of the 'timestamps', 'fractions' and 'counts' arrays, where the counts are the number of pixels
+    with data within the geometry. Acquisitions without any data over the geometry are dropped.
+    """
+    # Create a Sentinel-2 MSI collection
+    collection = ee.ImageCollection("COPERNICUS/S2_SR")
+    # Filter the collection for the geometry and daterange
+    collection = collection.filterBounds(geometry).filterDate(start, end)
+
+    def reduce(image: ee.Image) -> ee.Feature:
+        """ A function that reduces an acquisition to its cloud fraction and pixel count over the geometry. """
+        scl = image.select("SCL")
+        # Generate a binary cloud band that is masked where there is no data
+        cloud = scl.remap(list(CLOUD_CLASSES), [1] * len(CLOUD_CLASSES), 0).updateMask(scl.neq(0)).rename("cloud")
+
+        reduced = cloud.reduceRegion(
+            reducer=ee.Reducer.mean().combine(ee.Reducer.count(), sharedInputs=True),
+            geometry=geometry, scale=scale, maxPixels=1e9
+        )
+
+        return ee.Feature(None, {
+            "timestamp": image.get("system:time_start"),
+            "fraction": reduced.get("cloud_mean"),
+            "count": reduced.get("cloud_count"),
+        })
+
+    # Reduce every acquisition and drop the acquisitions without data
+    features = ee.FeatureCollection(collection.map(reduce)).filter(ee.Filter.gt("count", 0))
+
+    return ee.Dictionary({
+        "timestamps": features.aggregate_array("timestamp"),
+        "fractions": features.aggregate_array("fraction"),
+        "counts": features.aggregate_array("count"),
+    })
+
+def merge_cloudseries(timestamps: list, fractions: list, counts: list) -> dict:
+    """
+    A function that merges the epoch millisecond timestamps and cloud fractions of a series into a mapping of
+    timestamps to cloud fractions. The fractions of the acquisitions with the same timestamp, which occur where
+    a geometry overlaps several Sentinel-2 tiles, are weighted by their pixel counts.
+    """
+    merged = {}
+
+    for timestamp, fraction, count in zip(timestamps, fractions, counts):
+        clouded, total = merged.get(timestamp, (0.0, 0))
+        merged[timestamp] = (clouded + fraction * count, total + count)
+
+    return {timestamp: round(clouded / total, 6) for timestamp, (clouded, total) in merged.items()}
@@ -5,98 +5,415 @@ Google Cloud Platform - Cloud Run
 
 geocore-vector service
 """
+from __future__ import annotations
+
 import os
-import sys
 import json
+import datetime
+import concurrent.futures
 
 import flask
 import flask_restful
 
-import ee
-
-def init():
-    """ 
-    A function that generates Earth Engine Credentials from the default application 
-    credentials and authenticates an Earth Engine Session with Terrarium. 
-    """
-    try:
-        from terrarium import initialize
-
-        # Retrieve the location of the credentials file from the environment variables set by Google Cloud Platform
-        keyfile = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-        # Generate a new Earth Engine credential object
-        credentials = ee.ServiceAccountCredentials(email=None, key_file=keyfile)
+from geocore import logentry
+from geocore import metrics
+from geocore import startup
+from geocore.session import session, Health
 
-        # Initialize Earth Engine Session
-        initialize(credentials)
+import timeseries
+import zonalstats
+import cloudcover
+from seriesstore import SeriesStore
 
-    except Exception as e:
-        logentry = dict(severity="EMERGENCY", message=f"could not intialize earth engine session. error: {e}")
-        print(json.dumps(logentry))
-        sys.exit(0)
+# Import Earth Engine and Terrarium lazily, they are only required once the session is initialized
+ee = startup.lazyimport("ee")
+spatial = startup.lazyimport("terrarium.spatial")
 
-class LogEntry:
+class LogEntry(logentry.LogEntry):
     """ A class that represents a serverless log compliant with Google Cloud Platform. """
 
     service = "geocore-vector"
 
-    def __init__(self, workflow: str) -> None:
-        """ Initialization Method """
-        self.workflow: str = workflow
-        self.logtrace: list = [f"execution started. worflow - {workflow}."]
-
-        self.baselog = {
-            "trace": self.logtrace, 
-            "service":self.service
-        }
+class Trend(flask_restful.Resource):
+    """ RESTful resource for the '/trend' endpoint. """
 
-        project = os.environ.get('GCP_PROJECT')
-        reqtrace = flask.request.headers.get('X-Cloud-Trace-Context')
+    def post(self):
+        """ RESTful POST """
+        # Create a LogEntry object for the trend workflow
+        log = LogEntry("trend")
 
-        if reqtrace and project:
-            tracedata = f"projects/{project}/traces/{reqtrace.split('/')[0]}"
-            self.baselog.update({"logging.googleapis.com/trace": tracedata})
+        # Parse the request JSON
+        request = flask.request.get_json()
+        log.addtrace("request parsed.")
+
+        try:
+            # Retrieve the 'bounds', 'start', 'end' and 'index' keys from the request
+            bounds = request["bounds"]
+            start = request["start"]
+            end = request["end"]
+            index = request["index"]
+
+            # Check that bounds is a list.
+            if not isinstance(bounds, list):
+                # log and return the error
+                log.addtrace("invalid bounds.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"trend generation failed. invalid bounds. must be a list."}, 400
+
+            log.addtrace("bounds - {}.", bounds)
+
+            # Check that start and end are str.
+            if not isinstance(start, str) or not isinstance(end, str):
+                # log and return the error
+                log.addtrace("invalid daterange.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"trend generation failed. invalid daterange. start and end must be an str."}, 400
+
+            log.addtrace("daterange - {} to {}.", start, end)
+
+            # Check that index is a supported index.
+            if not isinstance(index, str) or index.upper() not in timeseries.INDICES:
+                # log and return the error
+                log.addtrace("invalid index.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"trend generation failed. invalid index. must be one of {', '.join(timeseries.INDICES)}."}, 400
+
+            index = index.upper()
+            log.addtrace("index - {}.", index)
+
+            # Retrieve the optional 'scale' key from the request
+            scale = request.get("scale", 10)
+
+            # Check that scale is a positive number.
+            if not isinstance(scale, (int, float)) or isinstance(scale, bool) or scale <= 0:
+                # log and return the error
+                log.addtrace("invalid scale.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"trend generation failed. invalid scale. must be a positive number."}, 400
+
+        except KeyError as e:
+            # log and return the error
+            log.addtrace("missing request parameter {}.", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"trend generation failed. missing request parameter. {e}"}, 400
+
+        log.addtrace("request parameters retrieved.")
+
+        try:
+            # Ensure that the Earth Engine Session is initialized
+            session.ensure()
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("{}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"trend generation failed. {e}"}, 500
+
+        try:
+            # Generate an Earth Engine Geometry from the bounds
+            geometry = spatial.generate_earthenginegeometry_frombounds(*bounds)
+
+            # Obtain the datetimes from the start and end timestamps
+            startdate = datetime.datetime.fromisoformat(start)
+            enddate = datetime.datetime.fromisoformat(end)
+
+        except RuntimeError as e:
+            # log and return the error
+            log.addtrace("could not generate geometry from bounds. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"trend generation failed. could not generate geometry from bounds. {e}"}, 400
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not generate dates from daterange. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"trend generation failed. could not generate dates from daterange. {e}"}, 400
+
+        # Check that the daterange is not empty.
+        if startdate >= enddate:
+            # log and return the error
+            log.addtrace("empty daterange.")
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"trend generation failed. invalid daterange. start must be before end."}, 400
+
+        log.addtrace("trend parameters generated.")
+
+        # Generate the store key for the series and the epoch daterange
+        storekey = store.generate_key(bounds, index, scale)
+        start, end = timeseries.generate_epoch(startdate), timeseries.generate_epoch(enddate)
+
+        try:
+            if request.get("refresh", False) is True:
+                # Invalidate the stored series
+                store.invalidate(storekey)
+                log.addtrace("stored series invalidated.")
+
+            # Lookup the stored points and the missing dateranges of the series
+            points, missing = store.lookup(storekey, start, end)
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not lookup series store. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"trend generation failed. could not lookup series store. {e}"}, 500
+
+        log.addtrace("series store looked up. stored - {}. missing - {}.", len(points), len(missing))
+
+        def compute(chunkstart: datetime.datetime, chunkend: datetime.datetime) -> dict:
+            """ A function that generates the time series points for a chunk with a single server-side reduction. """
+            series = timeseries.generate_series(geometry, chunkstart, chunkend, index, scale).getInfo()
+            return timeseries.merge_series(series["timestamps"], series["values"])
+
+        try:
+            # Generate the points of the missing dateranges and merge them into the store
+            computed, chunks = generate_missingpoints(store, storekey, missing, int(os.environ.get("TREND_CHUNKDAYS", 365)), compute)
+            points.update({timestamp: value for timestamp, value in computed.items() if start <= timestamp < end})
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not generate time series. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"trend generation failed. could not generate time series. {e}"}, 500
+
+        # Format the points into sorted columnar arrays
+        timestamps, values = timeseries.format_series(points)
+
+        # log the generated values
+        log.addtrace("time series generated. chunks - {}. points - {}.", chunks, len(timestamps))
+        log.flush("INFO", "runtime complete")
+
+        # Return the trend response
+        return {"index": index, "timestamps": timestamps, "values": values}, 200
+
+def generate_missingpoints(store: SeriesStore, storekey: str, missing: list, chunkdays: int, compute) -> tuple:
+    """
+    A function that generates the points of the missing epoch dateranges of a stored series and merges them into the
+    store. Each missing daterange is split into chunks of 'chunkdays' days and the 'compute' callable must generate
+    the mapping of epoch timestamps to values for a chunk from its start and end datetimes in a single Earth Engine
+    request. Returns a tuple of the mapping of all the computed timestamps to values and the number of chunks.
+    """
+    computed, chunks = {}, 0
 
-    def addtrace(self, trace: str):
-        """ A method that adds a trace string to the list of logtraces. """
-        self.logtrace.append(trace)
+    for missingstart, missingend in missing:
+        points = {}
 
-    def flush(self, severity: str, message: str):
-        """
-        A method of LogEntry that creates and flushes the built log to Cloud Logging as
-        a structured log given that it is called within a Cloud Run/Functions Service.
-        The method accepts a log severity string and a log message string.
+        # Split the missing daterange into chunks, each of which is computed in a single Earth Engine request
+        for chunkstart, chunkend in timeseries.generate_dateranges(
+            timeseries.generate_datetime(missingstart), timeseries.generate_datetime(missingend), chunkdays
+        ):
+            points.update(compute(chunkstart, chunkend))
+            chunks += 1
 
-        Accepted log severity values are - EMERGENCY, ALERT, CRITICAL, ERROR, WARNING, NOTICE, INFO, DEBUG and DEFAULT.
-        Refer to https://cloud.google.com/logging/docs/reference/v2/rest/v2/LogEntry#logseverity for more information.
-        """
-        self.addtrace("execution ended.")
-        logentry = dict(severity=severity, message=message)
-        logentry.update(self.baselog)
+        # Merge the computed points into the store
+        store.update(storekey, missingstart, missingend, points)
+        computed.update(points)
 
-        print(json.dumps(logentry))
+    return computed, chunks
 
-class Trend(flask_restful.Resource):
+class Stat(flask_restful.Resource):
+    """ RESTful resource for the '/stat' endpoint. """
 
     def post(self):
-        """ The runtime for when the '/trend' endpoint recieves a POST request """
-        logger = LogEntry("trend")
+        """ RESTful POST """
+        # Create a LogEntry object for the stat workflow
+        log = LogEntry("stat")
 
+        # Parse the request JSON
         request = flask.request.get_json()
-        logger.flush("INFO", f"{request}")
+        log.addtrace("request parsed.")
+
+        try:
+            # Retrieve the 'geojson', 'timestamp' and 'index' keys from the request
+            geojson = request["geojson"]
+            timestamp = request["timestamp"]
+            index = request["index"]
+
+            # Check that geojson is a FeatureCollection of features with polygon geometries.
+            if not isinstance(geojson, dict) or geojson.get("type") != "FeatureCollection" or \
+                not isinstance(geojson.get("features"), list) or not geojson["features"]:
+                # log and return the error
+                log.addtrace("invalid geojson.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"zonal statistics failed. invalid geojson. must be a non-empty FeatureCollection."}, 400
+
+            features = geojson["features"]
+
+            for position, feature in enumerate(features):
+                if not isinstance(feature, dict) or not isinstance(feature.get("geometry"), dict) or \
+                    feature["geometry"].get("type") not in ("Polygon", "MultiPolygon"):
+                    # log and return the error
+                    log.addtrace("invalid feature at position {}.", position)
+                    log.flush("ERROR", "runtime terminated")
+                    return {"error": f"zonal statistics failed. invalid feature at position {position}. must have a polygon geometry."}, 400
+
+            log.addtrace("feature count - {}.", len(features))
+
+            # Check that timestamp is an str.
+            if not isinstance(timestamp, str):
+                # log and return the error
+                log.addtrace("invalid timestamp.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"zonal statistics failed. invalid timestamp. must be an str."}, 400
+
+            log.addtrace("timestamp - {}.", timestamp)
+
+            # Check that index is a supported index.
+            if not isinstance(index, str) or index.upper() not in timeseries.INDICES:
+                # log and return the error
+                log.addtrace("invalid index.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"zonal statistics failed. invalid index. must be one of {', '.join(timeseries.INDICES)}."}, 400
+
+            index = index.upper()
+            log.addtrace("index - {}.", index)
+
+            # Retrieve the optional 'scale', 'tileScale' and 'percentiles' keys from the request
+            scale = request.get("scale", 10)
+            tilescale = request.get("tileScale", 1)
+            percentiles = request.get("percentiles", [10, 50, 90])
+
+            # Check that scale and tileScale are positive numbers.
+            if any(not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0 for value in (scale, tilescale)):
+                # log and return the error
+                log.addtrace("invalid scale.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"zonal statistics failed. invalid scale or tileScale. must be a positive number."}, 400
+
+            # Check that percentiles is a list of int between 0 and 100.
+            if not isinstance(percentiles, list) or not all(
+                isinstance(percentile, int) and not isinstance(percentile, bool) and 0 <= percentile <= 100 for percentile in percentiles
+            ):
+                # log and return the error
+                log.addtrace("invalid percentiles.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"zonal statistics failed. invalid percentiles. must be a list of int between 0 and 100."}, 400
+
+        except KeyError as e:
+            # log and return the error
+            log.addtrace("missing request parameter {}.", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"zonal statistics failed. missing request parameter. {e}"}, 400
+
+        log.addtrace("request parameters retrieved.")
+
+        try:
+            # Ensure that the Earth Engine Session is initialized
+            session.ensure()
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("{}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"zonal statistics failed. {e}"}, 500
+
+        try:
+            # Obtain the datetime from the timestamp
+            date = datetime.datetime.fromisoformat(timestamp)
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not generate date from timestamp. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"zonal statistics failed. could not generate date from timestamp. {e}"}, 400
+
+        try:
+            # Generate the index image over the bounds of all the features
+            geometry = ee.Geometry.Rectangle(zonalstats.generate_bounds(features))
+            image = zonalstats.generate_image(date, geometry, index)
+
+            # Generate the combined reducer for the statistics
+            percentiles = sorted(set(percentiles))
+            reducer = zonalstats.generate_reducer(percentiles)
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not generate image. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"zonal statistics failed. could not generate image. {e}"}, 400
+
+        log.addtrace("{} image generated.", index)
+
+        # Retrieve the number of features reduced per Earth Engine request
+        chunksize = int(os.environ.get("STAT_CHUNKSIZE", 500))
+
+        # Submit the reduction of each chunk of features to the pool
+        futures = {}
+        for start in range(0, len(features), chunksize):
+            positions = list(range(start, min(start + chunksize, len(features))))
+            future = reducers.submit(generate_chunkstatistics, image, features, positions, reducer, percentiles, scale, tilescale)
+            futures[future] = positions
+
+        log.addtrace("reductions submitted. chunks - {}.", len(futures))
+
+        completed = concurrent.futures.as_completed(futures)
+        failures = []
+
+        # Wait for the first chunk that is reduced before streaming, so that the
+        # request fails with an error status if every chunk could not be reduced
+        for first in completed:
+            if first.exception() is None:
+                break
+            failures.append(first)
+
+        else:
+            # log and return the error
+            log.addtrace("could not reduce features. {}", failures[0].exception())
+            log.flush("ERROR", "runtime error")
+            return {"error": f"zonal statistics failed. could not reduce features. {failures[0].exception()}"}, 500
+
+        def line(future: concurrent.futures.Future) -> str:
+            """ A function that generates the JSON line of the results of a chunk or of its error. """
+            if future.exception() is not None:
+                return json.dumps({"error": f"zonal statistics failed. could not reduce features. {future.exception()}", "positions": futures[future]}) + "\n"
+
+            return json.dumps({"results": future.result()}) + "\n"
+
+        def stream():
+            """ A generator that streams the results of each chunk as a JSON line as soon as it completes. """
+            errors = len(failures)
+
+            # Stream the chunks that completed before the first reduced chunk
+            for failure in failures:
+                yield line(failure)
+            yield line(first)
+
+            for pending in completed:
+                errors += pending.exception() is not None
+                yield line(pending)
+
+            # log the generated values
+            log.addtrace("zonal statistics generated. errors - {}.", errors)
+            log.flush("INFO", "runtime complete")
+
+            # Close the stream with a summary line that counts the chunks that could not be reduced
+            yield json.dumps({"completed": True, "features": len(features), "chunks": len(futures), "errors": errors}) + "\n"
+
+        # Return the streamed stat response
+        return flask.Response(stream(), mimetype="application/x-ndjson")
+
+def generate_chunkstatistics(image: ee.Image, features: list, positions: list, reducer: ee.Reducer, percentiles: list, scale: float, tilescale: float) -> list:
+    """
+    A function that generates the zonal statistics for the features at a list of positions in a single Earth Engine request.
+    Returns a list of dictionaries with the position, the ID of the feature if it has one and its statistics, which are
+    None if the feature has no unmasked pixels.
+    """
+    chunk = [features[position] for position in positions]
+    reduced = zonalstats.generate_statistics(image, chunk, positions, reducer, scale, tilescale).getInfo()
 
-        return f"complete", 200
+    statnames = zonalstats.generate_statnames(percentiles)
+    results = []
 
-class Stat(flask_restful.Resource):
+    for feature in reduced["features"]:
+        properties = feature["properties"]
+        position = int(properties["position"])
 
-    def post(self):
-        """ The runtime for when the '/stat' endpoint recieves a POST request """
-        logger = LogEntry("stat")
+        result = {"position": position, **{name: properties.get(name) for name in statnames}}
+        if "id" in features[position]:
+            result["id"] = features[position]["id"]
 
-        request = flask.request.get_json()
-        logger.flush("INFO", f"{request}")
+        results.append(result)
 
-        return f"complete", 200
+    return sorted(results, key=lambda result: result["position"])
 
 class Atmosphere(flask_restful.Resource):
 
@@ -110,23 +427,199 @@ class Atmosphere(flask_restful.Resource):
         return f"complete", 200
 
 class Cloud(flask_restful.Resource):
+    """ RESTful resource for the '/cloud' endpoint. """
 
     def post(self):
-        """ The runtime for when the '/cloud' endpoint recieves a POST request """
-        logger = LogEntry("cloud")
+        """ RESTful POST """
+        # Create a LogEntry object for the cloud workflow
+        log = LogEntry("cloud")
 
+        # Parse the request JSON
         request = flask.request.get_json()
-        logger.flush("INFO", f"{request}")
-
-        return f"complete", 200
+        log.addtrace("request parsed.")
+
+        try:
+            # Retrieve the 'bounds', 'start' and 'end' keys from the request
+            bounds = request["bounds"]
+            start = request["start"]
+            end = request["end"]
+
+            # Check that bounds is a list.
+            if not isinstance(bounds, list):
+                # log and return the error
+                log.addtrace("invalid bounds.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"cloud cover failed. invalid bounds. must be a list."}, 400
+
+            log.addtrace("bounds - {}.", bounds)
+
+            # Check that start and end are str.
+            if not isinstance(start, str) or not isinstance(end, str):
+                # log and return the error
+                log.addtrace("invalid daterange.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"cloud cover failed. invalid daterange. start and end must be an str."}, 400
+
+            log.addtrace("daterange - {} to {}.", start, end)
+
+            # Retrieve the optional 'scale' key from the request
+            scale = request.get("scale", 20)
+
+            # Check that scale is a positive number.
+            if not isinstance(scale, (int, float)) or isinstance(scale, bool) or scale <= 0:
+                # log and return the error
+                log.addtrace("invalid scale.")
+                log.flush("ERROR", "runtime terminated")
+                return {"error": f"cloud cover failed. invalid scale. must be a positive number."}, 400
+
+        except KeyError as e:
+            # log and return the error
+            log.addtrace("missing request parameter {}.", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"cloud cover failed. missing request parameter. {e}"}, 400
+
+        log.addtrace("request parameters retrieved.")
+
+        try:
+            # Ensure that the Earth Engine Session is initialized
+            session.ensure()
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("{}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"cloud cover failed. {e}"}, 500
+
+        try:
+            # Generate an Earth Engine Geometry from the bounds
+            geometry = spatial.generate_earthenginegeometry_frombounds(*bounds)
+
+            # Obtain the datetimes from the start and end timestamps
+            startdate = datetime.datetime.fromisoformat(start)
+            enddate = datetime.datetime.fromisoformat(end)
+
+        except RuntimeError as e:
+            # log and return the error
+            log.addtrace("could not generate geometry from bounds. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"cloud cover failed. could not generate geometry from bounds. {e}"}, 400
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not generate dates from daterange. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"cloud cover failed. could not generate dates from daterange. {e}"}, 400
+
+        # Check that the daterange is not empty.
+        if startdate >= enddate:
+            # log and return the error
+            log.addtrace("empty daterange.")
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"cloud cover failed. invalid daterange. start must be before end."}, 400
+
+        log.addtrace("cloud parameters generated.")
+
+        # Generate the store key for the cloud series and the epoch daterange
+        storekey = cloudstore.generate_key(bounds, "CLOUD", scale)
+        start, end = timeseries.generate_epoch(startdate), timeseries.generate_epoch(enddate)
+
+        try:
+            # Lookup the stored cloud fractions and the missing dateranges of the series
+            points, missing = cloudstore.lookup(storekey, start, end)
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not lookup cloud store. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"cloud cover failed. could not lookup cloud store. {e}"}, 500
+
+        log.addtrace("cloud store looked up. stored - {}. missing - {}.", len(points), len(missing))
+
+        def compute(chunkstart: datetime.datetime, chunkend: datetime.datetime) -> dict:
+            """ A function that generates the cloud fractions for a chunk with a single server-side reduction. """
+            series = cloudcover.generate_cloudseries(geometry, chunkstart, chunkend, scale).getInfo()
+            return cloudcover.merge_cloudseries(series["timestamps"], series["fractions"], series["counts"])
+
+        try:
+            # Generate the cloud fractions of the missing dateranges and merge them into the store
+            computed, chunks = generate_missingpoints(cloudstore, storekey, missing, int(os.environ.get("CLOUD_CHUNKDAYS", 365)), compute)
+            points.update({timestamp: value for timestamp, value in computed.items() if start <= timestamp < end})
+
+        except Exception as e:
+            # log and return the error
+            log.addtrace("could not generate cloud cover. {}", e)
+            log.flush("ERROR", "runtime terminated")
+            return {"error": f"cloud cover failed. could not generate cloud cover. {e}"}, 500
+
+        # Format the cloud fractions into sorted columnar arrays
+        timestamps, fractions = timeseries.format_series(points)
+
+        # log the generated values
+        log.addtrace("cloud cover generated. chunks - {}. acquisitions - {}.", chunks, len(timestamps))
+        log.flush("INFO", "runtime complete")
+
+        # Return the cloud response
+        return {"timestamps": timestamps, "cloud": fractions}, 200
+
+class TrendStore(flask_restful.Resource):
+    """ RESTful resource for the '/trend/store' endpoint. """
+
+    def get(self):
+        """ RESTful GET """
+        # Return the series store counters
+        return {"store": store.stats()}, 200
+
+class CloudStore(flask_restful.Resource):
+    """ RESTful resource for the '/cloud/store' endpoint. """
+
+    def get(self):
+        """ RESTful GET """
+        # Return the cloud cover store counters
+        return {"store": cloudstore.stats()}, 200
+
+# Create the bounded thread pool for the zonal statistics reductions
+reducers = concurrent.futures.ThreadPoolExecutor(max_workers=int(os.environ.get("STAT_WORKERS", 4)))
+
+# Create the time series store for the service
+store = SeriesStore(
+    ttl=float(os.environ.get("TREND_STORE_TTL", 2592000)),
+    settle=float(os.environ.get("TREND_STORE_SETTLE", 259200)),
+    maxpoints=int(os.environ.get("TREND_STORE_MAXPOINTS", 1000000)),
+    path=os.environ.get("TREND_STORE_PATH")
+)
+
+# Expose the series store counters as metrics
+metrics.registry.register("geocore_seriesstore", LogEntry.service, store.stats)
+
+# Create the cloud cover store for the service
+cloudstore = SeriesStore(
+    ttl=float(os.environ.get("CLOUD_STORE_TTL", 31536000)),
+    settle=float(os.environ.get("CLOUD_STORE_SETTLE", 259200)),
+    maxpoints=int(os.environ.get("CLOUD_STORE_MAXPOINTS", 1000000)),
+    path=os.environ.get("CLOUD_STORE_PATH")
+)
+
+# Expose the cloud cover store counters as metrics
+metrics.registry.register("geocore_cloudstore", LogEntry.service, cloudstore.stats)
+
+# Expose the earth engine session counters as metrics
+metrics.registry.register("geocore_session", LogEntry.service, session.stats)
 
 app = flask.Flask(__name__)
 api = flask_restful.Api(app)
 
 api.add_resource(Trend, '/trend')
+api.add_resource(TrendStore, '/trend/store')
 api.add_resource(Stat, '/stat')
 api.add_resource(Atmosphere, '/atmosphere')
 api.add_resource(Cloud, '/cloud')
+api.add_resource(CloudStore, '/cloud/store')
+api.add_resource(metrics.Metrics, '/metrics')
+api.add_resource(Health, '/health')
 
 if __name__ == '__main__':
+    # Initialize Earth Engine Session and report the startup times
+    startup.initialize_earthengine()
+    startup.report(LogEntry.service)
+
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
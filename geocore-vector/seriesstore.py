@@ -0,0 +1,206 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-vector service - time series store
+"""
+import json
+import time
+import threading
+
+from geocore.database import Database
+
+class SeriesStore:
+    """
+    A class that represents an SQLite store of computed spectral index time series points.
+
+    Each series is keyed by its region, index and scale and holds a list of disjoint covered dateranges of epoch
+    millisecond timestamps [start, end), each with the time that it was computed, along with the (timestamp, value)
+    points within them, which are stored as rows of a points table with the time that they were computed. A covered
+    daterange never extends past 'settle' seconds before the time of the update, so that the late acquisitions of the
+    recent days are still computed by the next request. A covered daterange and its points are invalidated once they
+    are older than 'ttl' seconds, so that the dateranges that are extended later expire later. The points computed
+    past the settle time are not covered, but expire in the same way. When the store holds more than 'maxpoints' points,
+    it is compacted by evicting the least recently used series. The database is held at 'path', which defaults to
+    an in-memory database for each process.
+    """
+
+    def __init__(self, ttl: float, settle: float, maxpoints: int, path: str = None) -> None:
+        """ Initialization Method """
+        self.ttl: float = ttl
+        self.settle: float = settle
+        self.maxpoints: int = maxpoints
+
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "partials": 0, "misses": 0, "invalidations": 0, "evictions": 0, "compactions": 0}
+
+        self.database = Database(path or ":memory:", [
+            "CREATE TABLE IF NOT EXISTS series "
+            "(key TEXT PRIMARY KEY, accessed REAL, points INTEGER)",
+            "CREATE TABLE IF NOT EXISTS coverage "
+            "(key TEXT, startdate INTEGER, enddate INTEGER, created REAL, PRIMARY KEY (key, startdate)) WITHOUT ROWID",
+            "CREATE TABLE IF NOT EXISTS points "
+            "(key TEXT, timestamp INTEGER, value REAL, created REAL, PRIMARY KEY (key, timestamp)) WITHOUT ROWID",
+        ])
+
+    @staticmethod
+    def generate_key(bounds: list, index: str, scale: float) -> str:
+        """ A static method that generates the store key for the series of an index over a region at a scale. """
+        return json.dumps([[round(float(bound), 6) for bound in bounds], index.upper(), float(scale)])
+
+    def lookup(self, key: str, start: int, end: int) -> tuple:
+        """
+        A method that looks up the stored points of a series within the daterange [start, end).
+        Returns a tuple of the mapping of stored timestamps to values within the daterange and
+        a list of (start, end) dateranges that are not covered by the store.
+        """
+        with self.lock:
+            # Invalidate the expired covered dateranges of the series
+            if self._expire(key):
+                self.database.commit()
+                self.counters["invalidations"] += 1
+
+            covered = self.database.execute(
+                "SELECT startdate, enddate FROM coverage WHERE key = ? AND enddate > ? AND startdate < ? ORDER BY startdate", (key, start, end)
+            ).fetchall()
+
+            if not covered:
+                self.counters["misses"] += 1
+                return {}, [(start, end)]
+
+            # Compute the gaps between the covered dateranges within the daterange
+            missing, cursor = [], start
+            for coveredstart, coveredend in covered:
+                if coveredstart > cursor:
+                    missing.append((cursor, coveredstart))
+                cursor = max(cursor, coveredend)
+
+            if cursor < end:
+                missing.append((cursor, end))
+
+            self.counters["partials" if missing else "hits"] += 1
+
+            points = dict(self.database.execute(
+                "SELECT timestamp, value FROM points WHERE key = ? AND timestamp >= ? AND timestamp < ?", (key, start, end)
+            ).fetchall())
+
+            self.database.execute("UPDATE series SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.database.commit()
+
+            return points, missing
+
+    def update(self, key: str, start: int, end: int, points: dict):
+        """
+        A method that merges the computed points of a series within the daterange [start, end) into the store
+        and adds the daterange, up to the settle time before now, to the covered dateranges of the series with
+        the current time. The parts of the covered dateranges that it overlaps are replaced by it.
+        """
+        now = time.time()
+        end = min(end, int((now - self.settle) * 1000))
+
+        with self.lock:
+            self.database.executemany(
+                "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)", [(key, timestamp, value, now) for timestamp, value in points.items()]
+            )
+
+            if end > start:
+                overlapping = self.database.execute(
+                    "SELECT startdate, enddate, created FROM coverage WHERE key = ? AND enddate > ? AND startdate < ?", (key, start, end)
+                ).fetchall()
+
+                # Keep the parts of the overlapping covered dateranges on either side of the daterange
+                for coveredstart, coveredend, created in overlapping:
+                    self.database.execute("DELETE FROM coverage WHERE key = ? AND startdate = ?", (key, coveredstart))
+                    if coveredstart < start:
+                        self.database.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (key, coveredstart, start, created))
+                    if coveredend > end:
+                        self.database.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (key, end, coveredend, created))
+
+                self.database.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)", (key, start, end, now))
+
+            # Record the series even if nothing within the settled daterange was computed, so that its points are counted and evicted
+            count = self.database.execute("SELECT COUNT(*) FROM points WHERE key = ?", (key,)).fetchone()[0]
+            self.database.execute("INSERT OR REPLACE INTO series (key, accessed, points) VALUES (?, ?, ?)", (key, now, count))
+            self.database.commit()
+
+            # Compact the store once it holds more than the maximum number of points
+            total = self.database.execute("SELECT COALESCE(SUM(points), 0) FROM series").fetchone()[0]
+            if total > self.maxpoints:
+                self._compact()
+
+    def invalidate(self, key: str = None):
+        """ A method that invalidates the stored series for a key, or all the stored series if no key is given. """
+        with self.lock:
+            if key is None:
+                self.database.execute("DELETE FROM points")
+                self.database.execute("DELETE FROM coverage")
+                self.database.execute("DELETE FROM series")
+            else:
+                self._delete(key)
+
+            self.database.commit()
+            self.counters["invalidations"] += 1
+
+    def compact(self):
+        """ A method that compacts the store, removing the expired dateranges and the least recently used series beyond the maximum size. """
+        with self.lock:
+            self._compact()
+
+    def stats(self) -> dict:
+        """ A method that returns the hit/miss counters and the size of the store. """
+        with self.lock:
+            series, points = self.database.execute("SELECT COUNT(*), COALESCE(SUM(points), 0) FROM series").fetchone()
+            return {**self.counters, "series": series, "points": points}
+
+    def _delete(self, key: str):
+        """ A method that deletes a series, its covered dateranges and its points. Must be called while holding the lock. """
+        self.database.execute("DELETE FROM points WHERE key = ?", (key,))
+        self.database.execute("DELETE FROM coverage WHERE key = ?", (key,))
+        self.database.execute("DELETE FROM series WHERE key = ?", (key,))
+
+    def _expire(self, key: str = None) -> int:
+        """
+        A method that deletes the expired covered dateranges and the expired points for a key, or for all the keys if no
+        key is given, and recounts the points of their series. The points are expired by the time that they were computed,
+        so the points of the expired dateranges are deleted along with the uncovered points past the settle time. Returns
+        the number of expired dateranges and points. Must be called while holding the lock.
+        """
+        expiry = time.time() - self.ttl
+        condition, parameters = ("created < ?", (expiry,)) if key is None else ("key = ? AND created < ?", (key, expiry))
+
+        # Retrieve the series with expired dateranges or points before they are deleted
+        expired = {row[0] for row in self.database.execute(f"SELECT key FROM coverage WHERE {condition}", parameters)}
+        expired.update(row[0] for row in self.database.execute(f"SELECT DISTINCT key FROM points WHERE {condition}", parameters))
+
+        count = self.database.execute(f"DELETE FROM coverage WHERE {condition}", parameters).rowcount
+        count += self.database.execute(f"DELETE FROM points WHERE {condition}", parameters).rowcount
+
+        for expiredkey in expired:
+            self.database.execute(
+                "UPDATE series SET points = (SELECT COUNT(*) FROM points WHERE key = ?) WHERE key = ?", (expiredkey, expiredkey)
+            )
+
+        return count
+
+    def _compact(self):
+        """
+        A method that deletes the expired dateranges, then evicts the least recently used series until the store holds
+        at most 'maxpoints' points and reclaims the free space of the database. Must be called while holding the lock.
+        """
+        self._expire()
+
+        total = self.database.execute("SELECT COALESCE(SUM(points), 0) FROM series").fetchone()[0]
+
+        for key, points in self.database.execute("SELECT key, points FROM series ORDER BY accessed").fetchall():
+            if total <= self.maxpoints:
+                break
+
+            self._delete(key)
+            total -= points
+            self.counters["evictions"] += 1
+
+        self.database.commit()
+        # Reclaim the space of the deleted points
+        self.database.execute("VACUUM")
+        self.counters["compactions"] += 1
@@ -0,0 +1,122 @@
+"""
+GeoSentry GeoCore API
+
+geocore-vector service - time series store tests
+"""
+import os
+import types
+
+import pytest
+
+import seriesstore
+from seriesstore import SeriesStore
+
+NOW = 1700000000.0
+DAY = 86400000
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ A fixture that returns a mutable clock of epoch seconds that the store reads instead of the system time. """
+    clock = types.SimpleNamespace(now=NOW)
+    monkeypatch.setattr(seriesstore, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def test_generate_key_normalizes_the_series_parameters():
+    assert SeriesStore.generate_key([77.1234567, 12, 77.2, 12.2], "ndvi", 10) == SeriesStore.generate_key([77.123457, 12.0, 77.2, 12.2], "NDVI", 10.0)
+    assert SeriesStore.generate_key([77.1, 12.1, 77.2, 12.2], "NDVI", 10) != SeriesStore.generate_key([77.1, 12.1, 77.2, 12.2], "NDVI", 20)
+
+def test_lookup_returns_the_gaps_between_covered_dateranges(clock):
+    store = SeriesStore(ttl=60, settle=0, maxpoints=100)
+    assert store.lookup("series", 0, 400) == ({}, [(0, 400)])
+
+    store.update("series", 0, 100, {10: 0.1, 90: 0.9})
+    store.update("series", 200, 300, {250: 0.25})
+
+    assert store.lookup("series", 0, 100) == ({10: 0.1, 90: 0.9}, [])
+    assert store.lookup("series", 0, 400) == ({10: 0.1, 90: 0.9, 250: 0.25}, [(100, 200), (300, 400)])
+    assert store.lookup("other", 0, 400) == ({}, [(0, 400)])
+
+    assert store.stats() == {
+        "hits": 1, "partials": 1, "misses": 2, "invalidations": 0, "evictions": 0, "compactions": 0, "series": 1, "points": 3
+    }
+
+def test_update_replaces_the_overlapping_parts_of_covered_dateranges(clock):
+    store = SeriesStore(ttl=60, settle=0, maxpoints=100)
+    store.update("series", 0, 100, {10: 0.1, 60: 0.6})
+
+    clock.now += 10
+    store.update("series", 50, 150, {60: 0.7, 120: 1.2})
+    assert store.lookup("series", 0, 150) == ({10: 0.1, 60: 0.7, 120: 1.2}, [])
+
+    # Only the part of the first daterange that was not computed again expires with its points
+    clock.now += 51
+    assert store.lookup("series", 0, 150) == ({60: 0.7, 120: 1.2}, [(0, 50)])
+    assert store.stats()["invalidations"] == 1
+    assert store.stats()["points"] == 2
+
+def test_points_past_the_settle_time_are_not_covered_and_expire(clock):
+    store = SeriesStore(ttl=60, settle=86400, maxpoints=100)
+    now = int(NOW * 1000)
+
+    store.update("series", now - 4 * DAY, now, {now - 3 * DAY: 0.3, now - DAY // 2: 0.5})
+
+    # The recent point is returned but its day is computed again
+    assert store.lookup("series", now - 4 * DAY, now) == ({now - 3 * DAY: 0.3, now - DAY // 2: 0.5}, [(now - DAY, now)])
+
+    clock.now += 61
+    assert store.lookup("series", now - 4 * DAY, now) == ({}, [(now - 4 * DAY, now)])
+    assert store.stats()["points"] == 0
+
+def test_compaction_evicts_the_least_recently_used_series_beyond_maxpoints(clock):
+    store = SeriesStore(ttl=60, settle=0, maxpoints=4)
+    store.update("first", 0, 100, {10: 1.0, 20: 2.0})
+    clock.now += 1
+    store.update("second", 0, 100, {10: 1.0, 20: 2.0})
+
+    # Using the first series makes the second the least recently used
+    clock.now += 1
+    store.lookup("first", 0, 100)
+
+    clock.now += 1
+    store.update("third", 0, 100, {10: 1.0, 20: 2.0})
+
+    assert store.lookup("second", 0, 100) == ({}, [(0, 100)])
+    assert store.lookup("first", 0, 100)[1] == []
+    assert store.lookup("third", 0, 100)[1] == []
+
+    stats = store.stats()
+    assert (stats["series"], stats["points"], stats["evictions"], stats["compactions"]) == (2, 4, 1, 1)
+
+def test_compaction_removes_expired_points_and_reclaims_space(clock, tmp_path):
+    path = str(tmp_path / "series.db")
+    store = SeriesStore(ttl=60, settle=86400, maxpoints=100000, path=path)
+    now = int(NOW * 1000)
+
+    # Store settled daily points and as many points past the settle time
+    points = {now - offset * DAY: 1.0 for offset in range(2, 5000)}
+    points.update({now - offset * 1000: 1.0 for offset in range(1, 5000)})
+    store.update("series", now - 5000 * DAY, now, points)
+    size = os.path.getsize(path)
+
+    clock.now += 61
+    store.compact()
+
+    stats = store.stats()
+    assert (stats["series"], stats["points"], stats["evictions"], stats["compactions"]) == (1, 0, 0, 1)
+    assert os.path.getsize(path) < size
+
+    # The store persists across restarts
+    store.update("series", 0, 100, {10: 1.0})
+    assert SeriesStore(ttl=60, settle=86400, maxpoints=100000, path=path).lookup("series", 0, 100) == ({10: 1.0}, [])
+
+def test_invalidate_a_series_or_the_whole_store(clock):
+    store = SeriesStore(ttl=60, settle=0, maxpoints=100)
+    store.update("first", 0, 100, {10: 1.0})
+    store.update("second", 0, 100, {10: 1.0})
+
+    store.invalidate("first")
+    assert store.lookup("first", 0, 100) == ({}, [(0, 100)])
+    assert store.lookup("second", 0, 100) == ({10: 1.0}, [])
+
+    store.invalidate()
+    assert store.stats()["series"] == 0
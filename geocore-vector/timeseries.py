@@ -0,0 +1,128 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-vector service - spectral index time series
+"""
+from __future__ import annotations
+
+import datetime
+
+from geocore import startup
+
+# Import Earth Engine lazily, it is only required once the session is initialized
+ee = startup.lazyimport("ee")
+
+# The Sentinel-2 scene classes that are masked out of the time series.
+# Cloud shadows, medium and high probability clouds and thin cirrus.
+MASKED_CLASSES = (3, 8, 9, 10)
+
+# The spectral indices supported for a time series
+INDICES = ("NDVI", "NDWI", "NDMI", "NBR", "EVI", "SAVI")
+
+def generate_index(image: ee.Image, index: str) -> ee.Image:
+    """
+    A function that generates a single band spectral index image named 'value' from a Sentinel-2 image.
+    Raises a ValueError if the index is not supported.
+    """
+    if index == "NDVI":
+        return image.normalizedDifference(["B8", "B4"]).rename("value")
+
+    if index == "NDWI":
+        return image.normalizedDifference(["B3", "B8"]).rename("value")
+
+    if index == "NDMI":
+        return image.normalizedDifference(["B8", "B11"]).rename("value")
+
+    if index == "NBR":
+        return image.normalizedDifference(["B8", "B12"]).rename("value")
+
+    if index == "EVI":
+        return image.expression(
+            "2.5 * (NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1)",
+            {"NIR": image.select("B8").divide(10000), "RED": image.select("B4").divide(10000), "BLUE": image.select("B2").divide(10000)}
+        ).rename("value")
+
+    if index == "SAVI":
+        return image.expression(
+            "1.5 * (NIR - RED) / (NIR + RED + 0.5)",
+            {"NIR": image.select("B8").divide(10000), "RED": image.select("B4").divide(10000)}
+        ).rename("value")
+
+    raise ValueError(f"unsupported index. must be one of {', '.join(INDICES)}")
+
+def mask_clouds(image: ee.Image) -> ee.Image:
+    """ A function that masks the clouds and cloud shadows of a Sentinel-2 image with its scene classification band. """
+    return image.updateMask(image.select("SCL").remap(list(MASKED_CLASSES), [0] * len(MASKED_CLASSES), 1))
+
+def generate_dateranges(start: datetime.datetime, end: datetime.datetime, chunkdays: int) -> list:
+    """ A function that splits a daterange into consecutive dateranges of at most 'chunkdays' days. """
+    dateranges = []
+
+    while start < end:
+        chunkend = min(start + datetime.timedelta(days=chunkdays), end)
+        dateranges.append((start, chunkend))
+        start = chunkend
+
+    return dateranges
+
+def generate_series(geometry: ee.Geometry, start: datetime.datetime, end: datetime.datetime, index: str, scale: float) -> ee.Dictionary:
+    """
+    A function that generates the server-side time series of the mean of a spectral index over a geometry
+    within a daterange. The reduction is mapped over the whole filtered Sentinel-2 collection, so that the
+    series is retrieved in a single request, as a dictionary of the 'timestamps' and 'values' arrays.
+    The clouds and cloud shadows are masked with the scene classification band and the acquisitions
+    that are fully masked over the geometry are dropped.
+    """
+    # Create a Sentinel-2 MSI collection
+    collection = ee.ImageCollection("COPERNICUS/S2_SR")
+    # Filter the collection for the geometry and daterange
+    collection = collection.filterBounds(geometry).filterDate(start, end)
+
+    def reduce(image: ee.Image) -> ee.Feature:
+        """ A function that reduces an acquisition to the mean of its index over the geometry. """
+        # Mask the clouds and cloud shadows from the acquisition
+        value = generate_index(mask_clouds(image), index).reduceRegion(
+            reducer=ee.Reducer.mean(), geometry=geometry, scale=scale, maxPixels=1e9
+        ).get("value")
+
+        return ee.Feature(None, {"timestamp": image.get("system:time_start"), "value": value})
+
+    # Reduce every acquisition and drop the fully masked acquisitions
+    features = ee.FeatureCollection(collection.map(reduce)).filter(ee.Filter.notNull(["value"]))
+
+    return ee.Dictionary({
+        "timestamps": features.aggregate_array("timestamp"),
+        "values": features.aggregate_array("value"),
+    })
+
+def merge_series(timestamps: list, values: list) -> dict:
+    """
+    A function that merges the epoch millisecond timestamps and values of a time series into a mapping
+    of timestamps to values. The values of the acquisitions with the same timestamp, which occur where
+    a geometry overlaps several Sentinel-2 tiles, are averaged.
+    """
+    merged = {}
+
+    for timestamp, value in zip(timestamps, values):
+        merged.setdefault(timestamp, []).append(value)
+
+    return {timestamp: round(sum(items) / len(items), 6) for timestamp, items in merged.items()}
+
+def format_series(points: dict) -> tuple:
+    """ A function that formats a mapping of epoch millisecond timestamps to values into sorted columnar lists of ISO8601 timestamps and values. """
+    timestamps = sorted(points)
+
+    return (
+        [datetime.datetime.utcfromtimestamp(timestamp / 1000).isoformat() for timestamp in timestamps],
+        [points[timestamp] for timestamp in timestamps]
+    )
+
+def generate_epoch(date: datetime.datetime) -> int:
+    """ A function that converts a naive UTC datetime into an epoch millisecond timestamp. """
+    return int(date.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+def generate_datetime(epoch: int) -> datetime.datetime:
+    """ A function that converts an epoch millisecond timestamp into a naive UTC datetime. """
+    return datetime.datetime.utcfromtimestamp(epoch / 1000)
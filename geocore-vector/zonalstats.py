@@ -0,0 +1,81 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore-vector service - zonal statistics
+"""
+from __future__ import annotations
+
+import datetime
+
+from geocore import startup
+
+# Import Earth Engine lazily, it is only required once the session is initialized
+ee = startup.lazyimport("ee")
+
+from timeseries import generate_index, mask_clouds
+
+def generate_image(date: datetime.datetime, geometry: ee.Geometry, index: str) -> ee.Image:
+    """
+    A function that generates the cloud masked spectral index image of the Sentinel-2 acquisitions over a
+    geometry within a 12 hour buffer around a date, mosaicked into a single image.
+    """
+    # Create a Sentinel-2 MSI collection
+    collection = ee.ImageCollection("COPERNICUS/S2_SR")
+    # Filter the collection for the geometry and the buffered daterange
+    collection = collection.filterBounds(geometry).filterDate(date - datetime.timedelta(hours=12), date + datetime.timedelta(hours=12))
+
+    return generate_index(collection.map(mask_clouds).mosaic(), index)
+
+def generate_bounds(features: list) -> list:
+    """
+    A function that generates the west, south, east and north bounds of a list of GeoJSON polygon features. The bounds are
+    used to filter the acquisitions, so that the Earth Engine request of each chunk does not carry every feature geometry.
+    """
+    longitudes, latitudes = [], []
+
+    def walk(coordinates: list):
+        """ A function that collects the positions of a nested GeoJSON coordinates list. """
+        if coordinates and isinstance(coordinates[0], (int, float)):
+            longitudes.append(coordinates[0])
+            latitudes.append(coordinates[1])
+            return
+
+        for item in coordinates:
+            walk(item)
+
+    for feature in features:
+        walk(feature["geometry"]["coordinates"])
+
+    return [min(longitudes), min(latitudes), max(longitudes), max(latitudes)]
+
+def generate_reducer(percentiles: list) -> ee.Reducer:
+    """ A function that generates a combined reducer for the mean, minimum, maximum and the given percentiles, sharing its inputs. """
+    reducer = ee.Reducer.mean().combine(ee.Reducer.minMax(), sharedInputs=True)
+
+    if percentiles:
+        reducer = reducer.combine(ee.Reducer.percentile(percentiles), sharedInputs=True)
+
+    return reducer
+
+def generate_statistics(image: ee.Image, features: list, positions: list, reducer: ee.Reducer, scale: float, tilescale: float) -> ee.FeatureCollection:
+    """
+    A function that generates the server-side zonal statistics of an image for a list of GeoJSON features in a
+    single reduceRegions pass. Each feature is tagged with its position in the request, and the geometries
+    are dropped from the result so that only the positions and the statistics are transferred.
+    """
+    collection = ee.FeatureCollection({
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "geometry": feature["geometry"], "properties": {"position": position}}
+            for position, feature in zip(positions, features)
+        ]
+    })
+
+    reduced = image.reduceRegions(collection=collection, reducer=reducer, scale=scale, tileScale=tilescale)
+    return reduced.map(lambda feature: ee.Feature(None, feature.toDictionary()))
+
+def generate_statnames(percentiles: list) -> list:
+    """ A function that generates the names of the statistics computed by the combined reducer. """
+    return ["mean", "min", "max", *[f"p{percentile}" for percentile in percentiles]]
@@ -0,0 +1,8 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+Shared runtime modules for the GeoCore services. The package is copied 
+into each service container alongside the service's main.py.
+"""
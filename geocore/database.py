@@ -0,0 +1,55 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore shared module - sqlite database
+"""
+import os
+import sqlite3
+import threading
+
+class Database:
+    """
+    A class that represents an SQLite database at a path that is connected lazily in each process. 
+    SQLite connections must not be carried across a fork, so this allows the database to be created
+    while the application is preloaded in the gUnicorn master before the workers are forked. 
+    The 'schema' is a list of statements that are executed when the database is connected.
+    """
+
+    def __init__(self, path: str, schema: list) -> None:
+        """ Initialization Method """
+        self.path: str = path
+        self.schema: list = schema
+
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def execute(self, statement: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        """ A method that executes a statement with its parameters on the connection of the current process. """
+        return self.connect().execute(statement, parameters)
+
+    def executemany(self, statement: str, parameters: list) -> sqlite3.Cursor:
+        """ A method that executes a statement for each set of parameters on the connection of the current process. """
+        return self.connect().executemany(statement, parameters)
+
+    def commit(self):
+        """ A method that commits the current transaction on the connection of the current process. """
+        self.connect().commit()
+
+    def connect(self) -> sqlite3.Connection:
+        """ A method that returns the connection of the current process, connecting and applying the schema if required. """
+        if self.connection is not None and self.pid == os.getpid():
+            return self.connection
+
+        with self.lock:
+            if self.connection is None or self.pid != os.getpid():
+                connection = sqlite3.connect(self.path, check_same_thread=False)
+                for statement in self.schema:
+                    connection.execute(statement)
+                connection.commit()
+
+                self.connection, self.pid = connection, os.getpid()
+
+        return self.connection
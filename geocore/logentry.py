@@ -0,0 +1,223 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore shared module - structured logging
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+
+import flask
+
+from geocore import metrics
+
+class LogWriter:
+    """
+    A class that represents a background writer of structured log lines.
+
+    Log entries are put on a bounded queue of 'maxsize' entries and rendered into JSON lines and written to
+    stdout by a single writer thread, off the request thread. The 'overflow' policy determines what happens
+    when the queue is full - 'inline' renders and writes the entry on the calling thread, 'block' waits
+    for space on the queue and 'drop' discards the entry and counts it.
+    """
+
+    def __init__(self, maxsize: int, overflow: str) -> None:
+        """ Initialization Method """
+        if overflow not in ("inline", "block", "drop"):
+            raise ValueError(f"invalid log overflow policy: {overflow}")
+
+        self.overflow: str = overflow
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped: int = 0
+
+        self.lock = threading.Lock()
+        self.thread = None
+
+        atexit.register(self.drain)
+
+        # Write the queued entries of the parent before a fork and give the child its own queue and writer
+        # thread, since the thread does not survive the fork and the queue locks may be held by it
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self.drain, after_in_child=self._reset)
+
+    def write(self, entry):
+        """ A method that queues a log entry to be rendered and written by the writer thread. """
+        self._ensure_started()
+
+        try:
+            self.queue.put(entry, block=self.overflow == "block")
+
+        except queue.Full:
+            if self.overflow == "inline":
+                self._emit(entry)
+            else:
+                with self.lock:
+                    self.dropped += 1
+
+    def drain(self):
+        """ A method that renders and writes all the queued log entries on the calling thread. """
+        while True:
+            try:
+                entry = self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+            self._emit(entry)
+            self.queue.task_done()
+
+    def _ensure_started(self):
+        """ A method that starts the writer thread in the current process if it is not running. """
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="logwriter", daemon=True)
+                self.thread.start()
+
+    def _reset(self):
+        """ A method that replaces the queue, lock and writer thread inherited from the parent in a forked child process. """
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.dropped = 0
+
+    def _run(self):
+        """ A method that runs the writer loop. """
+        while True:
+            entry = self.queue.get()
+            self._emit(entry)
+            self.queue.task_done()
+
+    def _emit(self, entry):
+        """ A method that renders a log entry and writes it to stdout. Rendering errors are written as a log line. """
+        try:
+            line = json.dumps(entry.render())
+
+        except Exception as e:
+            line = json.dumps(dict(severity="ERROR", message=f"could not render log entry. {e}"))
+
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+# The log writer shared by all the log entries of the process
+writer = LogWriter(
+    maxsize=int(os.environ.get("LOG_QUEUESIZE", 10000)), 
+    overflow=os.environ.get("LOG_OVERFLOW", "inline")
+)
+
+# The maximum length of a rendered trace argument, beyond which it is truncated
+TRACE_MAXLENGTH = int(os.environ.get("LOG_TRACE_MAXLENGTH", 2000))
+
+class LogEntry:
+    """ 
+    A class that represents a serverless log compliant with Google Cloud Platform. 
+    Each service subclasses it and sets the 'service' class attribute to its name.
+    """
+
+    service = "geocore"
+
+    def __init__(self, workflow: str) -> None:
+        """ Initialization Method """
+        self.workflow: str = workflow
+        self.started: float = time.monotonic()
+        self.logtrace: list = [("execution started. worflow - {}.", (workflow,), self.started)]
+
+        self.baselog = {
+            "service": self.service
+        }
+
+        project = os.environ.get('GCP_PROJECT')
+        reqtrace = flask.request.headers.get('X-Cloud-Trace-Context')
+
+        if reqtrace and project:
+            tracedata = f"projects/{project}/traces/{reqtrace.split('/')[0]}"
+            self.baselog.update({"logging.googleapis.com/trace": tracedata})
+
+        self.severity: str = None
+        self.message: str = None
+
+    def addtrace(self, trace: str, *args):
+        """ 
+        A method that adds a trace to the list of logtraces. The trace is a format string with a '{}' 
+        placeholder for each argument and is only formatted when the log is rendered on the writer thread. 
+        The arguments must not be modified after the log is flushed.
+
+        Each trace is timestamped with a monotonic clock and the time since the previous trace is recorded
+        as the duration of the stage that the unformatted trace represents.
+        """
+        self.logtrace.append((trace, args, time.monotonic()))
+
+    def flush(self, severity: str, message: str):
+        """
+        A method of LogEntry that queues the built log to be flushed to Cloud Logging as
+        a structured log given that it is called within a Cloud Run/Functions Service.
+        The method accepts a log severity string and a log message string.
+
+        Accepted log severity values are - EMERGENCY, ALERT, CRITICAL, ERROR, WARNING, NOTICE, INFO, DEBUG and DEFAULT.
+        Refer to https://cloud.google.com/logging/docs/reference/v2/rest/v2/LogEntry#logseverity for more information.
+        """
+        self.addtrace("execution ended.")
+        self.severity = severity
+        self.message = message
+
+        # Record the workflow and stage durations in the latency histograms
+        metrics.registry.observe(self.service, self.workflow, self.logtrace[-1][2] - self.started, self.stages())
+
+        writer.write(self)
+
+    def stages(self) -> list:
+        """ A method that returns the list of (stage, duration) pairs of the log, with the unformatted trace as the stage. """
+        return [
+            (trace, stamp - previous) 
+            for (_, _, previous), (trace, _, stamp) in zip(self.logtrace, self.logtrace[1:])
+        ]
+
+    def render(self) -> dict:
+        """ 
+        A method that renders the log into the structured log dictionary, formatting its traces. The 
+        'durations' field holds the duration in milliseconds of the stage that ended at each trace
+        and the 'duration' field holds the total duration of the workflow in milliseconds.
+        """
+        logentry = dict(
+            severity=self.severity, 
+            message=self.message, 
+            trace=[render(trace, args) for trace, args, _ in self.logtrace],
+            durations=[0.0, *[round(elapsed * 1000, 3) for _, elapsed in self.stages()]],
+            duration=round((self.logtrace[-1][2] - self.started) * 1000, 3)
+        )
+        logentry.update(self.baselog)
+
+        return logentry
+
+class ServiceLog:
+    """ 
+    A class that represents a structured log of a service that is not part of a request workflow, 
+    such as a startup report. The 'fields' are added to the log alongside the severity and message.
+    """
+
+    def __init__(self, service: str, severity: str, message: str, **fields) -> None:
+        """ Initialization Method """
+        self.logentry = dict(severity=severity, message=message, service=service, **fields)
+
+    def flush(self):
+        """ A method that queues the log to be flushed to Cloud Logging. """
+        writer.write(self)
+
+    def render(self) -> dict:
+        """ A method that renders the log into the structured log dictionary. """
+        return self.logentry
+
+def render(trace: str, args: tuple) -> str:
+    """ A function that formats a trace with its arguments, truncating the long arguments. """
+    if not args:
+        return trace
+
+    strings = [str(arg) for arg in args]
+    return trace.format(*[string if len(string) <= TRACE_MAXLENGTH else f"{string[:TRACE_MAXLENGTH]}..." for string in strings])
@@ -0,0 +1,123 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore shared module - latency metrics
+"""
+import re
+import bisect
+import threading
+
+import flask
+import flask_restful
+
+# The upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    """ A class that represents a cumulative latency histogram over the fixed buckets. """
+
+    def __init__(self) -> None:
+        """ Initialization Method """
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float):
+        """ A method that records an observed latency in seconds. """
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """
+    A class that represents the in-process metrics of a service. It holds the latency histograms of
+    each workflow and of each stage of a workflow, along with counter collectors registered by the
+    service, and renders them in the Prometheus text exposition format.
+    """
+
+    def __init__(self) -> None:
+        """ Initialization Method """
+        self.lock = threading.Lock()
+        self.workflows = {}
+        self.stages = {}
+        self.collectors = {}
+
+    def observe(self, service: str, workflow: str, duration: float, stages: list):
+        """ A method that records the total duration of a workflow and a list of (stage, duration) pairs in seconds. """
+        with self.lock:
+            self.workflows.setdefault((service, workflow), Histogram()).observe(duration)
+
+            for stage, elapsed in stages:
+                self.stages.setdefault((service, workflow, stage), Histogram()).observe(elapsed)
+
+    def register(self, name: str, service: str, collector):
+        """
+        A method that registers a counter collector, a callable that returns a mapping of counter names to
+        numeric values. Each counter is exposed as a gauge named '<name>_<counter>' with a service label.
+        """
+        self.collectors[name] = (service, collector)
+
+    def render(self) -> str:
+        """ A method that renders the metrics in the Prometheus text exposition format. """
+        lines = []
+
+        with self.lock:
+            lines.append("# HELP geocore_workflow_latency_seconds The latency of each request workflow.")
+            lines.append("# TYPE geocore_workflow_latency_seconds histogram")
+            for (service, workflow), histogram in sorted(self.workflows.items()):
+                lines.extend(renderhistogram("geocore_workflow_latency_seconds", {"service": service, "workflow": workflow}, histogram))
+
+            lines.append("# HELP geocore_stage_latency_seconds The latency of each stage of a request workflow.")
+            lines.append("# TYPE geocore_stage_latency_seconds histogram")
+            for (service, workflow, stage), histogram in sorted(self.stages.items()):
+                labels = {"service": service, "workflow": workflow, "stage": stage}
+                lines.extend(renderhistogram("geocore_stage_latency_seconds", labels, histogram))
+
+        for name, (service, collector) in sorted(self.collectors.items()):
+            try:
+                counters = collector()
+            except Exception:
+                continue
+
+            for counter, value in sorted(counters.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = re.sub(r"[^a-zA-Z0-9_]", "_", f"{name}_{counter}")
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric}{renderlabels({'service': service})} {value}")
+
+        return "\n".join(lines) + "\n"
+
+def renderlabels(labels: dict) -> str:
+    """ A function that renders a mapping of labels into a Prometheus label set, escaping the label values. """
+    escaped = {
+        key: str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        for key, value in labels.items()
+    }
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+def renderhistogram(name: str, labels: dict, histogram: Histogram) -> list:
+    """ A function that renders a histogram into the lines of its Prometheus buckets, sum and count. """
+    lines = []
+    cumulative = 0
+
+    for bound, count in zip([*BUCKETS, "+Inf"], histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{renderlabels({**labels, 'le': bound})} {cumulative}")
+
+    lines.append(f"{name}_sum{renderlabels(labels)} {histogram.sum}")
+    lines.append(f"{name}_count{renderlabels(labels)} {histogram.count}")
+
+    return lines
+
+# The metrics registry shared by all the log entries of the process
+registry = MetricsRegistry()
+
+class Metrics(flask_restful.Resource):
+    """ RESTful resource for the '/metrics' endpoint. """
+
+    def get(self):
+        """ RESTful GET """
+        # Return the metrics in the Prometheus text exposition format
+        return flask.Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,190 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore shared module - earth engine session
+"""
+import os
+import time
+import datetime
+import threading
+
+import flask_restful
+
+class ConnectionPool:
+    """
+    A class that represents an HTTP transport for Earth Engine that is shared by all the threads of a process.
+
+    An httplib2 connection must not be used by two threads at once, so each thread is given its own
+    persistent connection, which is reused across all the requests served by that thread. The pool
+    has the interface of an httplib2 transport, and its connections can be closed after a fork so
+    that a worker does not reuse a socket that it inherited from the gUnicorn master.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        """ Initialization Method """
+        self.timeout: float = timeout
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.transports = []
+
+    def transport(self):
+        """ A method that returns the httplib2 transport of the current thread, creating it if required. """
+        transport = getattr(self.local, "transport", None)
+
+        if transport is None:
+            import httplib2
+
+            transport = httplib2.Http(timeout=self.timeout)
+            self.local.transport = transport
+
+            with self.lock:
+                self.transports.append(transport)
+
+        return transport
+
+    def request(self, *args, **kwargs):
+        """ A method that sends a request on the connection of the current thread. """
+        return self.transport().request(*args, **kwargs)
+
+    def close(self):
+        """ A method that closes the connections of all the threads. """
+        with self.lock:
+            transports, self.transports = self.transports, []
+            self.local = threading.local()
+
+        for transport in transports:
+            transport.close()
+
+    def __getattr__(self, attribute: str):
+        """ A method that returns the attributes of the httplib2 transport of the current thread. """
+        if attribute in ("timeout", "lock", "local", "transports"):
+            raise AttributeError(attribute)
+
+        return getattr(self.transport(), attribute)
+
+class EarthEngineSession:
+    """
+    A class that represents the Earth Engine session of a process.
+
+    The session is initialized exactly once per process under a lock, with the default application
+    credentials of the environment and an HTTP transport shared by all the threads. The credentials
+    are refreshed proactively 'margin' seconds before they expire, so that no request waits on a
+    token refresh or fails with an expired token. The session remembers the process that initialized
+    it and closes the connections it inherited when it is first used in a forked worker.
+    """
+
+    def __init__(self, project: str, margin: float, timeout: float) -> None:
+        """ Initialization Method """
+        self.project: str = project
+        self.margin: float = margin
+
+        self.lock = threading.Lock()
+        self.pool = ConnectionPool(timeout)
+
+        self.credentials = None
+        self.ready: bool = False
+        self.refreshat: float = 0.0
+        self.pid = None
+
+        self.error = None
+        self.counters = {"initializations": 0, "refreshes": 0, "errors": 0}
+
+    def ensure(self):
+        """
+        A method that ensures that the session is initialized and that its credentials are valid.
+        It returns immediately when the session is ready, and raises a RuntimeError if it could not
+        be initialized.
+        """
+        if self.ready and self.pid == os.getpid() and time.time() < self.refreshat:
+            return
+
+        with self.lock:
+            try:
+                if self.pid != os.getpid():
+                    # Close the connections inherited from the parent process
+                    self.pool.close()
+                    self.pid = os.getpid()
+
+                if not self.ready:
+                    self._initialize()
+
+                elif time.time() >= self.refreshat:
+                    self._refresh()
+
+                self.error = None
+
+            except Exception as e:
+                self.error = str(e)
+                self.counters["errors"] += 1
+                raise RuntimeError(f"could not initialize earth engine session. {e}")
+
+    def health(self) -> dict:
+        """ A method that returns the readiness of the session along with its counters. """
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "project": self.project,
+                "expires": round(self.refreshat + self.margin - time.time(), 3) if self.ready else None,
+                "error": self.error,
+                **self.counters
+            }
+
+    def stats(self) -> dict:
+        """ A method that returns the counters of the session. """
+        with self.lock:
+            return {**self.counters, "ready": int(self.ready)}
+
+    def _initialize(self):
+        """ A method that generates the credentials and initializes the Earth Engine session. Must be called while holding the lock. """
+        import ee
+        import google.auth
+
+        # Generate the default application credentials with the Earth Engine scopes
+        credentials, project = google.auth.default(scopes=ee.oauth.SCOPES)
+
+        self.credentials = credentials
+        self._refresh()
+
+        # Initialize the Earth Engine session on the shared transport
+        ee.Initialize(self.credentials, project=self.project or project, http_transport=self.pool)
+
+        self.ready = True
+        self.counters["initializations"] += 1
+
+    def _refresh(self):
+        """ A method that refreshes the credentials and schedules their next refresh. Must be called while holding the lock. """
+        import google.auth.transport.requests
+
+        self.credentials.refresh(google.auth.transport.requests.Request())
+        self.counters["refreshes"] += 1
+
+        if self.credentials.expiry is None:
+            # Credentials without an expiry are refreshed after an hour
+            self.refreshat = time.time() + 3600
+        else:
+            expiry = self.credentials.expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+            self.refreshat = expiry - self.margin
+
+# The Earth Engine session shared by all the threads of the process
+session = EarthEngineSession(
+    project=os.environ.get("GCP_PROJECT"),
+    margin=float(os.environ.get("SESSION_REFRESH_MARGIN", 300)),
+    timeout=float(os.environ.get("SESSION_TIMEOUT", 60)),
+)
+
+class Health(flask_restful.Resource):
+    """ RESTful resource for the '/health' endpoint. """
+
+    def get(self):
+        """ RESTful GET """
+        try:
+            # Initialize the session if required, so that the endpoint can be used as a startup probe
+            session.ensure()
+
+        except RuntimeError:
+            return session.health(), 503
+
+        return session.health(), 200
@@ -0,0 +1,78 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore shared module - request coalescing
+"""
+import threading
+
+class Flight:
+    """ A class that represents an in-flight computation, whose result or error is shared with the requests waiting on it. """
+
+    def __init__(self) -> None:
+        """ Initialization Method """
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    A class that represents a group of coalesced computations.
+
+    Concurrent calls with the same key share a single computation. The first call runs it and the
+    calls that arrive while it is in flight wait for it and receive its result, or raise its error.
+    A key is forgotten as soon as its computation ends, so results are never reused by later calls.
+    """
+
+    def __init__(self) -> None:
+        """ Initialization Method """
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.counters = {"flights": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key, function, *args, **kwargs) -> tuple:
+        """
+        A method that runs a function with its arguments for a key, unless a computation for the key is already
+        in flight. Returns a tuple of the result and a boolean that is True if the result was shared.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.counters["flights"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            # Wait for the in-flight computation and share its outcome
+            flight.event.wait()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.result, True
+
+        try:
+            flight.result = function(*args, **kwargs)
+
+        except Exception as e:
+            flight.error = e
+
+            with self.lock:
+                self.counters["errors"] += 1
+            raise
+
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
+
+        return flight.result, False
+
+    def stats(self) -> dict:
+        """ A method that returns the counters and the number of computations in flight. """
+        with self.lock:
+            return {**self.counters, "inflight": len(self.flights)}
@@ -0,0 +1,88 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore shared module - service startup
+"""
+import time
+import types
+import importlib
+import threading
+import contextlib
+
+from geocore import logentry
+from geocore import metrics
+
+# The monotonic time at which the startup module was imported, as the reference for the boot time
+BOOTED = time.monotonic()
+
+# The mapping of startup stages to their durations in seconds
+timings = {}
+
+@contextlib.contextmanager
+def timed(stage: str):
+    """ A context manager that records the duration of a startup stage. """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.monotonic() - started, 6)
+
+class LazyModule(types.ModuleType):
+    """
+    A class that represents a module that is only imported on the first access to one of its attributes.
+    The import time of the module is recorded as a startup stage named 'import <module>'.
+    """
+
+    def __init__(self, name: str) -> None:
+        """ Initialization Method """
+        super().__init__(name)
+        self.__dict__["_lock"] = threading.Lock()
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attribute: str):
+        """ A method that imports the module if required and returns its attribute. """
+        return getattr(self.load(), attribute)
+
+    def load(self) -> types.ModuleType:
+        """ A method that imports the module if it has not been imported and returns it. """
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    with timed(f"import {self.__name__}"):
+                        self.__dict__["_module"] = importlib.import_module(self.__name__)
+
+        return self._module
+
+def lazyimport(name: str) -> LazyModule:
+    """ A function that returns a lazily imported module for a module name. """
+    return LazyModule(name)
+
+def initialize_earthengine():
+    """
+    A function that initializes the Earth Engine session of the process, recording the import and 
+    initialization times. Errors are logged and not raised, so that the session can still be 
+    initialized when the first request is served.
+    """
+    from geocore.session import session
+
+    try:
+        # Import Earth Engine ahead of the session to record its import time
+        lazyimport("ee").load()
+
+        with timed("initialize earthengine"):
+            session.ensure()
+
+    except Exception as e:
+        logentry.ServiceLog("geocore", "ERROR", f"could not initialize earth engine session at startup. {e}").flush()
+
+def report(service: str):
+    """ 
+    A function that records the total boot time and logs the startup stage durations of a service. 
+    The durations are also exposed as metrics on the '/metrics' endpoint.
+    """
+    timings["boot"] = round(time.monotonic() - BOOTED, 6)
+
+    logentry.ServiceLog(service, "INFO", "service started", startup=dict(timings)).flush()
+    metrics.registry.register("geocore_startup_seconds", service, lambda: dict(timings))
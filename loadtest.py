@@ -0,0 +1,135 @@
+"""
+GeoSentry GeoCore API
+
+Google Cloud Platform - Cloud Run
+
+geocore load test
+
+A load test that compares the throughput of the previous single sync gUnicorn worker against the threaded
+gthread workers configured in the gunicorn.conf.py file of each service. The services are stood in for by
+a Flask-RESTful app whose endpoint blocks on a simulated Earth Engine call, a getInfo() that sleeps for a
+fixed latency, since the latency of a GeoCore request is dominated by its blocking Earth Engine calls.
+Each server configuration is loaded with 1, 5 and 20 concurrent clients and the throughput is reported.
+
+Usage: python loadtest.py [--latency 0.2] [--requests 100] [--concurrency 1 5 20] [--threads 20]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+import concurrent.futures
+
+import flask
+import flask_restful
+
+class EarthEngineStandIn:
+    """ A class that represents a stand-in for an Earth Engine computed object whose getInfo() blocks for a fixed latency. """
+
+    def __init__(self, latency: float) -> None:
+        """ Initialization Method """
+        self.latency: float = latency
+
+    def getInfo(self) -> dict:
+        """ A method that simulates the round trip of a blocking Earth Engine computation. """
+        time.sleep(self.latency)
+        return {"type": "Image", "bands": []}
+
+class Check(flask_restful.Resource):
+    """ RESTful resource for the stand-in '/check' endpoint. """
+
+    def post(self):
+        """ RESTful POST """
+        info = EarthEngineStandIn(float(os.environ.get("LOADTEST_LATENCY", 0.2))).getInfo()
+        return {"check": info is not None}, 200
+
+app = flask.Flask(__name__)
+api = flask_restful.Api(app)
+
+api.add_resource(Check, '/check')
+
+def generate_port() -> int:
+    """ A function that returns a free local port. """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def serve(options: list, latency: float) -> tuple:
+    """ A function that starts a gUnicorn server for the stand-in app with the given options and waits for it to accept connections. """
+    port = generate_port()
+    command = [sys.executable, "-c", "from gunicorn.app.wsgiapp import run; run()", "--bind", f"127.0.0.1:{port}", "--log-level", "warning", *options, "loadtest:app"]
+
+    server = subprocess.Popen(
+        command, cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, "LOADTEST_LATENCY": str(latency)}
+    )
+
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return server, port
+
+        except OSError:
+            time.sleep(0.1)
+
+    server.terminate()
+    raise RuntimeError(f"could not start server with options {options}")
+
+def request(port: int) -> float:
+    """ A function that sends a request to the stand-in endpoint and returns its latency in seconds. """
+    started = time.monotonic()
+
+    call = urllib.request.Request(
+        f"http://127.0.0.1:{port}/check", data=b"{}", headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(call, timeout=120) as response:
+        response.read()
+
+    return time.monotonic() - started
+
+def load(port: int, requests: int, concurrency: int) -> dict:
+    """ A function that sends a number of requests with a number of concurrent clients and returns the throughput and latencies. """
+    started = time.monotonic()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(lambda _: request(port), range(requests)))
+
+    elapsed = time.monotonic() - started
+    return {
+        "throughput": requests / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+def main():
+    """ A function that runs the load test for each server configuration and concurrency level. """
+    parser = argparse.ArgumentParser(description="GeoCore execution model load test")
+    parser.add_argument("--latency", type=float, default=0.2, help="the simulated Earth Engine latency in seconds")
+    parser.add_argument("--requests", type=int, default=100, help="the number of requests sent at each concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 20], help="the concurrency levels")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("GUNICORN_THREADS", 20)), help="the number of gthread threads")
+    arguments = parser.parse_args()
+
+    configurations = {
+        "sync (--workers 1)": ["--workers", "1"],
+        f"gthread (--threads {arguments.threads})": ["--workers", "1", "--worker-class", "gthread", "--threads", str(arguments.threads)],
+    }
+
+    print(f"simulated earth engine latency - {arguments.latency}s, requests per level - {arguments.requests}")
+    print(f"{'configuration':<28}{'concurrency':>12}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}")
+
+    for name, options in configurations.items():
+        server, port = serve(options, arguments.latency)
+
+        try:
+            for concurrency in arguments.concurrency:
+                result = load(port, arguments.requests, concurrency)
+                print(f"{name:<28}{concurrency:>12}{result['throughput']:>10.2f}{result['p50']:>10.3f}{result['p95']:>10.3f}")
+
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()